@@ -49,6 +49,7 @@ in {
           # Web Application
           fastapi
           uvicorn
+          orjson
           python-multipart
           python-jose
           passlib
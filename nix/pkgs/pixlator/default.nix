@@ -6,6 +6,7 @@
 , click
 , fastapi
 , uvicorn
+, orjson
 , python-multipart
 , python-jose
 , passlib
@@ -26,6 +27,7 @@
     click
     fastapi
     uvicorn
+    orjson
     python-multipart
     python-jose
     passlib
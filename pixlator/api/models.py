@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Tuple, Dict, Optional, Literal
+from pydantic import BaseModel, Field
+from typing import List, Tuple, Dict, Optional, Literal, Union
 from enum import Enum
 
 
@@ -20,6 +20,8 @@ class UploadResponse(BaseModel):
     size: int
     preview_url: str
     dimensions: Dict[str, int]
+    sha256: Optional[str] = None
+    deduplicated: bool = False  # 与已有上传内容相同，共享同一个原图
 
 
 class ProcessRequest(BaseModel):
@@ -27,6 +29,7 @@ class ProcessRequest(BaseModel):
     max_size: int = 100
     color_count: Optional[int] = None
     numbering_mode: NumberingMode = "diagonal_bottom_right"
+    instructions: Literal["full", "compressed"] = "full"  # compressed时number_stats中重复的序列以引用表示
 
 
 class PixelData(BaseModel):
@@ -50,11 +53,134 @@ class NumberStat(BaseModel):
     sequence: List[Tuple[int, int]]  # (color_index, count)
 
 
+class NumberInstruction(BaseModel):
+    """压缩的编号统计：sequence、same_as、count+period 三者之一"""
+    number: int
+    sequence: Optional[List[Tuple[int, int]]] = None  # 序列第一次出现
+    same_as: Optional[int] = None  # 与编号same_as的序列相同
+    count: Optional[int] = None  # 从number开始的连续count个编号
+    period: Optional[int] = None  # 每个编号与其前period个编号的序列相同
+
+
 class ProcessResponse(BaseModel):
     pixel_data: List[List[PixelData]]
     color_stats: List[ColorStat]
+    number_stats: List[Union[NumberStat, NumberInstruction]]
+    dimensions: Dict[str, int]
+
+
+# 单个分块返回逐像素数据，分块边长上限
+MAX_TILE_SIZE = 1024
+
+
+class TiledProcessRequest(BaseModel):
+    file_id: str
+    max_size: int = Field(1000, gt=0)  # 上限为 MAX_TILED_SIZE（由路由检查）
+    color_count: Optional[int] = None
+    numbering_mode: NumberingMode = "diagonal_bottom_right"
+    tile_size: Optional[int] = Field(None, gt=0, le=MAX_TILE_SIZE)
+
+
+class PaletteEntry(BaseModel):
+    color_index: int
+    rgb: Tuple[int, int, int]
+    hex: str
+    count: int
+
+
+class TiledProcessResponse(BaseModel):
+    dimensions: Dict[str, int]
+    tile_size: int
+    tiles: Dict[str, int]  # columns, rows
+    number_count: int
+    palette: List[PaletteEntry]
+
+
+class TileResponse(BaseModel):
+    tile_x: int
+    tile_y: int
+    x: int
+    y: int
+    width: int
+    height: int
+    pixel_data: List[List[PixelData]]
+    color_stats: List[ColorStat]
+
+
+class NumberStatsPage(BaseModel):
+    start: int
+    limit: int
+    number_count: int
     number_stats: List[NumberStat]
+
+
+class ColorDelta(BaseModel):
+    color_index: int  # 结果a调色板中的颜色
+    rgb: Tuple[int, int, int]
+    hex: str
+    count_a: int
+    count_b: int  # b中对齐到该颜色的格子数
+    delta: int
+
+
+class PaletteMapping(BaseModel):
+    color_index_b: int
+    color_index_a: int  # 最近的颜色
+    distance: float  # RGB欧氏距离
+
+
+class ResultDiffResponse(BaseModel):
+    a: str
+    b: str
+    dimensions: Dict[str, int]  # 结果a的尺寸
+    resampled: bool  # 尺寸不同时b按最近邻缩放到a的尺寸
+    changed: int
+    total: int
+    mask: str  # 变化格子的位图：按行展开，np.packbits打包（高位在前）后base64编码
+    color_deltas: List[ColorDelta]
+    palette_mapping: List[PaletteMapping]
+
+
+class AnimationProcessRequest(BaseModel):
+    file_id: str
+    max_size: int = 100
+    color_count: Optional[int] = None
+    numbering_mode: NumberingMode = "diagonal_bottom_right"
+
+
+class AnimationResponse(BaseModel):
     dimensions: Dict[str, int]
+    frame_count: int
+    durations: List[int]  # 每帧时长（毫秒）
+    palette: List[PaletteEntry]  # 所有帧共用的调色板，count为所有帧的合计
+    storage: Dict[str, int]  # keyframes, deltas, repeats, raw_bytes, stored_bytes
+
+
+class PixelEdit(BaseModel):
+    x: int
+    y: int
+    color_index: int  # 调色板中的颜色索引（从1开始）
+
+
+class PixelEditRequest(BaseModel):
+    edits: List[PixelEdit] = Field(..., min_length=1)
+
+
+class PixelEditResponse(BaseModel):
+    updated: int  # 实际改变颜色的像素数
+    number_stats: List[NumberStat]  # 受影响编号的新序列
+    palette: List[PaletteEntry]  # 更新后的颜色计数
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # pending, running, completed, failed, cancelled
+    stage: Optional[str] = None
+    progress: float  # 0.0 ~ 1.0
+    error: Optional[str] = None
+    events_url: str
+    result_url: str
 
 
 class ErrorResponse(BaseModel):
@@ -0,0 +1,16 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from pixlator.utils import serialization
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 utils/serialization 编码的JSON响应
+
+    路由直接返回该响应时，FastAPI不再按response_model重新校验和转换内容，
+    适合处理结果这类由服务内部生成、结构已知的大数据。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return serialization.dumps(content)
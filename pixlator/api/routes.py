@@ -1,19 +1,113 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import asyncio
+import hashlib
+import json
+import mimetypes
 import os
+from typing import Dict, Optional
+import numpy as np
 from loguru import logger
 from pixlator.api.models import (
-    UploadResponse, ProcessRequest, ProcessResponse
+    UploadResponse, ProcessRequest, ProcessResponse,
+    TiledProcessRequest, TiledProcessResponse, TileResponse, NumberStatsPage,
+    AnimationProcessRequest, AnimationResponse, PixelEditRequest, PixelEditResponse, JobResponse,
+    ResultDiffResponse
 )
+from pixlator.api.responses import FastJSONResponse
+from pixlator.services.admission import AdmissionRejected
+from pixlator.services.animation import frame_count
+from pixlator.services.cancellation import CancelToken, LatestOnly, ProcessingCancelled
+from pixlator.services.diff import diff_grids
 from pixlator.services.file_manager import FileManager
+from pixlator.services.grid import compress_number_stats
 from pixlator.services.image_processor import ImageProcessor
+from pixlator.services.jobs import (
+    COMPLETED, EXPORT_STAGE_WEIGHTS, PROCESS_STAGE_WEIGHTS, Job, JobManager
+)
+from pixlator.services.metrics import PROCESSING_STAGE_SECONDS, size_bucket
+from pixlator.services.prefetch import Prefetcher
+from pixlator.services.profiling import RequestProfiler, profiled
+from pixlator.services.singleflight import SingleFlight
 from pixlator.config import settings
 
 router = APIRouter()
 
 # 创建服务实例
-file_manager = FileManager()
 image_processor = ImageProcessor()
+prefetcher = Prefetcher(image_processor)
+file_manager = FileManager(prefetcher=prefetcher)
+request_profiler = RequestProfiler()
+job_manager = JobManager()
+# 每个file_id只保留最新的 /process 请求，参数相同的并发请求合并为一次计算
+latest_processing = LatestOnly()
+processing_flights = SingleFlight()
+
+# /process 检查客户端是否断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.2
+
+def _etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """请求的 If-None-Match 是否与etag匹配（支持多个值、弱比较与 *）"""
+    if not etag:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in (value[2:] if value.startswith("W/") else value for value in candidates)
+
+# 支持的导出格式（见 ImageProcessor.write_export）
+EXPORT_TYPES = ("png", "jpg")
+
+# SSE轮询任务事件的间隔（秒）
+JOB_EVENT_POLL_INTERVAL = 0.1
+
+def _save_result(file_id: str, file_path: str, result: Dict) -> Optional[str]:
+    """保存处理结果及对应的量化网格（像素编辑在网格上进行），返回保存的结果文件的ETag
+
+    已保存的就是同样参数、未经编辑的结果时（例如命中缓存的重复请求）不重复写入。
+    """
+    params = result["processing_params"]
+    if file_manager.has_saved_result(file_id, params):
+        etag = file_manager.get_result_etag(file_id)
+        # 计算ETag期间结果文件可能被参数不同的请求替换，确认后才使用
+        if file_manager.has_saved_result(file_id, params):
+            logger.debug(f"Processing result already saved: {file_id}")
+            return etag
+    etag = file_manager.save_processing_result(file_id, result)
+    indices, palette = image_processor.get_index_grid(file_path, result)
+    grid_info = image_processor.summarize_grid(
+        indices, palette,
+        max_size=params["max_size"],
+        color_count=params["color_count"],
+        numbering_mode=params["numbering_mode"]
+    )
+    grid_info["result_saved"] = True
+    file_manager.save_grid(file_id, indices, grid_info)
+    return etag
+
+def _process_response(result: Dict, headers: Optional[Dict[str, str]] = None, instructions: str = "full") -> FastJSONResponse:
+    """处理结果的响应：结果由服务内部生成，跳过ProcessResponse的重新校验直接编码
+
+    instructions为compressed时编号统计中重复的序列以引用表示（保存与缓存的结果仍为完整格式）。
+    """
+    number_stats = result["number_stats"]
+    if instructions == "compressed":
+        number_stats = compress_number_stats(number_stats)
+    return FastJSONResponse(
+        {
+            "pixel_data": result["pixel_data"],
+            "color_stats": result["color_stats"],
+            "number_stats": number_stats,
+            "dimensions": result["dimensions"]
+        },
+        headers=headers
+    )
+
+def _refresh_result(filename: str) -> bool:
+    """像素编辑后按需由量化网格重新生成保存的处理结果"""
+    return file_manager.refresh_edited_result(filename, image_processor.result_from_grid)
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_image(file: UploadFile = File(...)):
@@ -27,16 +121,25 @@ async def upload_image(file: UploadFile = File(...)):
                 detail=f"Unsupported file format. Allowed formats: {', '.join(settings.ALLOWED_EXTENSIONS)}"
             )
         
-        # 验证文件大小
-        file_content = await file.read()
-        if len(file_content) > settings.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE // 1024 // 1024}MB"
+        # 按块读取，边写入边计算内容哈希，超过大小限制时立即停止
+        writer = file_manager.open_upload(file.filename)
+        try:
+            chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+            while chunk:
+                if writer.size + len(chunk) > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE // 1024 // 1024}MB"
+                    )
+                await run_in_threadpool(writer.write, chunk)
+                chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+            
+            # 保存文件（内容相同的上传共享同一个原图）
+            file_info = await run_in_threadpool(
+                file_manager.commit_upload, writer, file.filename, prefetch=settings.PREFETCH_ENABLED
             )
-        
-        # 保存文件
-        file_info = file_manager.save_uploaded_file(file_content, file.filename)
+        finally:
+            writer.discard()
         
         logger.info(f"File uploaded successfully: {file_info['filename']}")
         
@@ -45,7 +148,9 @@ async def upload_image(file: UploadFile = File(...)):
             filename=file_info["filename"],
             size=file_info["file_size"],
             preview_url=f"/api/preview/{file_info['filename']}",
-            dimensions=file_info["dimensions"]
+            dimensions=file_info["dimensions"],
+            sha256=file_info["sha256"],
+            deduplicated=file_info["deduplicated"]
         )
         
     except HTTPException:
@@ -55,40 +160,331 @@ async def upload_image(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="Failed to upload file")
 
 @router.post("/process", response_model=ProcessResponse)
-async def process_image(request: ProcessRequest):
-    """处理图片"""
+async def process_image(request: ProcessRequest, http_request: Request):
+    """处理图片
+
+    在线程池中处理，参数相同的并发请求共享一次计算；所有等待的客户端都断开，
+    或同一file_id有参数不同的新请求时取消当前处理。
+    """
     try:
         # 获取文件路径
         file_path = file_manager.get_file_path(request.file_id)
         if not file_path:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # 处理图片
-        result = image_processor.process_image(
-            file_path=file_path,
-            max_size=request.max_size,
-            color_count=request.color_count,
-            numbering_mode=request.numbering_mode
-        )
+        if request.max_size > settings.MAX_PROCESSING_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"max_size exceeds {settings.MAX_PROCESSING_SIZE}, use /api/process/tiled for larger grids"
+            )
+        
+        # 参数相同的并发请求共享同一次计算
+        flight_key = (request.file_id, request.max_size, request.color_count, request.numbering_mode)
+        flight, leader = processing_flights.join(flight_key)
+        # 加入进行中计算的请求同样是该file_id的最新请求，需要取代参数不同的旧处理
+        latest_processing.begin(request.file_id, flight.cancel_token)
+        if leader:
+            def run(cancel_token: CancelToken):
+                try:
+                    # 处理图片
+                    result = image_processor.process_image(
+                        file_path=file_path,
+                        max_size=request.max_size,
+                        color_count=request.color_count,
+                        numbering_mode=request.numbering_mode,
+                        cancel_token=cancel_token,
+                        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT
+                    )
+                    
+                    # 已被取代的结果不再覆盖较新请求保存的结果
+                    cancel_token.check()
+                    etag = _save_result(request.file_id, file_path, result)
+                    return result, etag
+                finally:
+                    latest_processing.end(request.file_id, cancel_token)
+            
+            asyncio.get_running_loop().run_in_executor(None, profiled(processing_flights.run), flight_key, flight, run)
+        else:
+            logger.info(f"Joining in-flight processing: {request.file_id} with max_size={request.max_size}, color_count={request.color_count}, numbering_mode={request.numbering_mode}")
         
-        # 保存处理结果
-        file_manager.save_processing_result(request.file_id, result)
+        waiting = asyncio.wrap_future(flight.future)
+        while not waiting.done():
+            await asyncio.wait({waiting}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not waiting.done() and await http_request.is_disconnected():
+                # 只有所有等待方都断开时才会真正取消计算
+                processing_flights.leave(flight)
+                waiting.cancel()
+                raise ProcessingCancelled("client disconnected")
+        result, etag = waiting.result()
         
         logger.info(f"Image processed successfully: {request.file_id}")
         
-        return ProcessResponse(
-            pixel_data=result["pixel_data"],
-            color_stats=result["color_stats"],
-            number_stats=result["number_stats"],
-            dimensions=result["dimensions"]
-        )
+        # 与 /api/history/{filename} 相同的ETag（取自保存这份结果时写入的内容，而不是之后磁盘上的文件），
+        # 之后查看历史记录时可直接返回304（压缩格式是不同的表示，使用不同的ETag）
+        if etag and request.instructions == "compressed":
+            etag = etag[:-1] + '-compressed"'
+        
+        with PROCESSING_STAGE_SECONDS.time(
+            stage="response_model",
+            size_bucket=size_bucket(request.max_size),
+            color_count=result["processing_params"]["color_count"],
+            numbering_mode=request.numbering_mode
+        ):
+            response = _process_response(result, headers={"ETag": etag} if etag else None, instructions=request.instructions)
+        
+        return response
         
     except HTTPException:
         raise
+    except ProcessingCancelled as e:
+        logger.info(f"Processing request cancelled ({e}): {request.file_id}")
+        raise HTTPException(status_code=409, detail=f"Processing cancelled: {e}")
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error processing image: {e}")
         raise HTTPException(status_code=500, detail="Failed to process image")
 
+@router.post("/process/tiled", response_model=TiledProcessResponse)
+async def process_image_tiled(request: TiledProcessRequest):
+    """分块模式处理图片：只保存一次量化网格，像素数据与统计按分块读取"""
+    try:
+        file_path = file_manager.get_file_path(request.file_id)
+        if not file_path:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        if request.max_size > settings.MAX_TILED_SIZE:
+            raise HTTPException(status_code=400, detail=f"max_size exceeds {settings.MAX_TILED_SIZE}")
+        
+        def run():
+            # 量化为颜色索引网格
+            indices, palette = image_processor.build_grid(
+                file_path=file_path,
+                max_size=request.max_size,
+                color_count=request.color_count,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT
+            )
+            grid_info = image_processor.summarize_grid(
+                indices, palette,
+                max_size=request.max_size,
+                color_count=request.color_count,
+                numbering_mode=request.numbering_mode,
+                tile_size=request.tile_size
+            )
+            
+            # 保存量化网格
+            file_manager.save_grid(request.file_id, indices, grid_info)
+            return grid_info
+        
+        grid_info = await run_in_threadpool(profiled(run))
+        
+        logger.info(f"Image processed in tiled mode: {request.file_id}")
+        
+        return TiledProcessResponse(**grid_info)
+        
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error processing image in tiled mode: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process image")
+
+@router.post("/process/animation", response_model=AnimationResponse)
+async def process_animation(request: AnimationProcessRequest):
+    """处理多帧图片（GIF）：所有帧量化到同一个调色板，帧按差异压缩保存，逐帧读取"""
+    try:
+        file_path = file_manager.get_file_path(request.file_id)
+        if not file_path:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        if request.max_size > settings.MAX_PROCESSING_SIZE:
+            raise HTTPException(status_code=400, detail=f"max_size exceeds {settings.MAX_PROCESSING_SIZE}")
+        
+        frames = await run_in_threadpool(frame_count, file_path)
+        if frames > settings.MAX_ANIMATION_FRAMES:
+            raise HTTPException(status_code=400, detail=f"Too many frames ({frames}), maximum is {settings.MAX_ANIMATION_FRAMES}")
+        
+        def run():
+            encoded, frames_info = image_processor.process_animation(
+                file_path=file_path,
+                max_size=request.max_size,
+                color_count=request.color_count,
+                numbering_mode=request.numbering_mode,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT
+            )
+            file_manager.save_frames(request.file_id, encoded, frames_info)
+            return frames_info
+        
+        frames_info = await run_in_threadpool(profiled(run))
+        
+        logger.info(f"Animation processed: {request.file_id} ({frames_info['frame_count']} frames)")
+        
+        return AnimationResponse(**frames_info)
+        
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error processing animation: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process animation")
+
+@router.get("/results/diff", response_model=ResultDiffResponse)
+async def diff_results(a: str = Query(...), b: str = Query(...)):
+    """比较两个处理结果的量化网格：返回变化格子的位图与各颜色的计数变化"""
+    try:
+        grid_a = await run_in_threadpool(file_manager.load_grid, a)
+        grid_b = await run_in_threadpool(file_manager.load_grid, b)
+        if not grid_a or not grid_b:
+            raise HTTPException(status_code=404, detail="Index grid not found")
+        
+        (indices_a, info_a), (indices_b, info_b) = grid_a, grid_b
+        palette_a = np.array([entry["rgb"] for entry in info_a["palette"]], dtype=np.uint8)
+        palette_b = np.array([entry["rgb"] for entry in info_b["palette"]], dtype=np.uint8)
+        diff = await run_in_threadpool(profiled(diff_grids), indices_a, palette_a, indices_b, palette_b)
+        
+        logger.info(f"Diffed results: {a} vs {b} ({diff['changed']}/{diff['total']} cells changed)")
+        
+        return FastJSONResponse({"a": a, "b": b, **diff})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error diffing results: {e}")
+        raise HTTPException(status_code=500, detail="Failed to diff results")
+
+@router.get("/results/{file_id}/frames/{index}")
+async def get_result_frame(file_id: str, index: int):
+    """获取多帧结果中一帧的像素数据、颜色统计与编号统计（格式与 /api/process 相同）"""
+    try:
+        frames = await run_in_threadpool(file_manager.load_frames, file_id)
+        if not frames:
+            raise HTTPException(status_code=404, detail="Frames not found")
+        
+        encoded, frames_info = frames
+        result = await run_in_threadpool(profiled(image_processor.get_frame), encoded, frames_info, index)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Frame out of range")
+        
+        return _process_response(result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting frame: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get frame")
+
+@router.get("/results/{file_id}/tiles/{tile_x}/{tile_y}", response_model=TileResponse)
+async def get_result_tile(file_id: str, tile_x: int, tile_y: int):
+    """获取分块结果中一个分块的像素数据与颜色统计"""
+    try:
+        grid = await run_in_threadpool(file_manager.load_grid, file_id)
+        if not grid:
+            raise HTTPException(status_code=404, detail="Index grid not found")
+        
+        indices, grid_info = grid
+        tile = await run_in_threadpool(profiled(image_processor.get_tile), indices, grid_info, tile_x, tile_y)
+        if tile is None:
+            raise HTTPException(status_code=404, detail="Tile out of range")
+        
+        return FastJSONResponse(tile)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting tile: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get tile")
+
+@router.get("/results/{file_id}/numbers", response_model=NumberStatsPage)
+async def get_result_numbers(file_id: str, start: int = Query(1, ge=1), limit: int = Query(100, ge=1)):
+    """分页获取分块结果的编号统计"""
+    try:
+        grid = await run_in_threadpool(file_manager.load_grid, file_id)
+        if not grid:
+            raise HTTPException(status_code=404, detail="Index grid not found")
+        
+        indices, grid_info = grid
+        limit = min(limit, settings.MAX_NUMBER_STATS_PAGE)
+        number_stats = await run_in_threadpool(profiled(image_processor.get_number_stats), indices, grid_info, start, limit)
+        
+        return NumberStatsPage(
+            start=start,
+            limit=limit,
+            number_count=grid_info["number_count"],
+            number_stats=number_stats
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting number stats: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get number stats")
+
+@router.get("/results/{file_id}/export.png")
+async def export_result_tiled(file_id: str, pixel_size: int = Query(10, ge=1, le=64)):
+    """按分块逐行渲染并以流的形式导出PNG，不在磁盘生成中间文件
+
+    渲染与编码在生成器中进行，StreamingResponse会在线程池中迭代同步生成器，不阻塞事件循环。
+    """
+    try:
+        grid = await run_in_threadpool(file_manager.load_grid, file_id)
+        if not grid:
+            raise HTTPException(status_code=404, detail="Index grid not found")
+        
+        indices, grid_info = grid
+        palette = np.array([entry["rgb"] for entry in grid_info["palette"]], dtype=np.uint8)
+        
+        logger.info(f"Streaming tiled export: {file_id} (pixel_size={pixel_size})")
+        
+        return StreamingResponse(
+            image_processor.iter_grid_png(indices, palette, pixel_size),
+            media_type="image/png",
+            headers={"Content-Disposition": f'attachment; filename="pixelated_{os.path.splitext(file_id)[0]}.png"'}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting tiled result: {e}")
+        raise HTTPException(status_code=500, detail="Failed to export result")
+
+@router.patch("/results/{file_id}/pixels", response_model=PixelEditResponse)
+async def edit_result_pixels(file_id: str, request: PixelEditRequest):
+    """批量修改像素颜色
+
+    就地更新保存的量化网格，只重新计算受影响编号的连续颜色块序列并增量更新颜色计数；
+    完整的处理结果JSON在下次读取或导出时才重新生成。
+    """
+    try:
+        if len(request.edits) > settings.MAX_PIXEL_EDITS:
+            raise HTTPException(status_code=400, detail=f"Too many edits, maximum is {settings.MAX_PIXEL_EDITS}")
+        
+        edits = [(edit.x, edit.y, edit.color_index) for edit in request.edits]
+        
+        def apply_edits():
+            with file_manager.edit_grid(file_id) as grid:
+                if grid is None:
+                    return None
+                indices, grid_info = grid
+                return image_processor.apply_pixel_edits(indices, grid_info, edits)
+        
+        changes = await run_in_threadpool(profiled(apply_edits))
+        if changes is None:
+            raise HTTPException(status_code=404, detail="Index grid not found")
+        
+        logger.info(f"Pixels edited: {file_id} ({changes['updated']} changed, {len(changes['number_stats'])} numbers updated)")
+        
+        return PixelEditResponse(**changes)
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error editing pixels: {e}")
+        raise HTTPException(status_code=500, detail="Failed to edit pixels")
+
 @router.get("/history")
 async def get_history():
     """获取历史记录列表"""
@@ -105,23 +501,49 @@ async def get_history():
         raise HTTPException(status_code=500, detail="Failed to get history")
 
 @router.get("/history/{filename}")
-async def get_history_detail(filename: str):
-    """获取历史记录详情"""
+async def get_history_detail(request: Request, filename: str):
+    """获取历史记录详情
+
+    直接返回保存的JSON内容（不重新解析），带内容哈希ETag，未变化时返回304。
+    """
     try:
         # 检查文件是否存在
         file_path = file_manager.get_file_path(filename)
         if not file_path:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # 加载处理结果
-        result = file_manager.load_processing_result(filename)
-        if not result:
+        await run_in_threadpool(_refresh_result, filename)
+        result_path = file_manager.get_result_path(filename)
+        etag = await run_in_threadpool(file_manager.get_result_etag, filename) if result_path else None
+        if not etag:
             raise HTTPException(status_code=404, detail="Processing result not found")
         
-        return {
-            "success": True,
-            "data": result
-        }
+        cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=cache_headers)
+        
+        # 保存的结果即为响应中的data字段，按块拼接到响应外层
+        prefix = b'{"success": true, "data": '
+        suffix = b'}'
+        result_file = open(result_path, 'rb')
+        size = os.fstat(result_file.fileno()).st_size
+        
+        def iter_result(chunk_size: int = 256 * 1024):
+            try:
+                yield prefix
+                chunk = result_file.read(chunk_size)
+                while chunk:
+                    yield chunk
+                    chunk = result_file.read(chunk_size)
+                yield suffix
+            finally:
+                result_file.close()
+        
+        return StreamingResponse(
+            iter_result(),
+            media_type="application/json",
+            headers={**cache_headers, "Content-Length": str(len(prefix) + size + len(suffix))}
+        )
         
     except HTTPException:
         raise
@@ -130,17 +552,24 @@ async def get_history_detail(filename: str):
         raise HTTPException(status_code=500, detail="Failed to get history detail")
 
 @router.get("/preview/{filename}")
-async def get_image_preview(filename: str):
-    """获取图片预览"""
+async def get_image_preview(request: Request, filename: str):
+    """获取图片预览（原图），历史列表请使用 /api/thumbnails"""
     try:
         file_path = file_manager.get_file_path(filename)
         if not file_path:
             raise HTTPException(status_code=404, detail="File not found")
         
+        etag = await run_in_threadpool(file_manager.get_content_etag, file_path)
+        cache_headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.IMAGE_CACHE_MAX_AGE}"}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=cache_headers)
+        
         return FileResponse(
             path=file_path,
-            media_type="image/*",
-            filename=filename
+            media_type=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            filename=filename,
+            headers=cache_headers,
+            content_disposition_type="inline"
         )
         
     except HTTPException:
@@ -149,6 +578,33 @@ async def get_image_preview(filename: str):
         logger.error(f"Error getting image preview: {e}")
         raise HTTPException(status_code=500, detail="Failed to get image preview")
 
+@router.get("/thumbnails/{filename}")
+async def get_thumbnail(request: Request, filename: str, size: int = Query(None, ge=1), image_format: str = Query(None, alias="format")):
+    """获取缩略图：size取不小于请求值的最小预设尺寸，format为webp或jpeg"""
+    try:
+        sizes = sorted(settings.THUMBNAIL_SIZES)
+        if size is None:
+            size = sizes[0]
+        size = next((preset for preset in sizes if preset >= size), sizes[-1])
+        
+        thumbnail = await run_in_threadpool(file_manager.get_thumbnail, filename, size, image_format)
+        if not thumbnail:
+            raise HTTPException(status_code=404, detail="File not found")
+        thumbnail_path, media_type = thumbnail
+        
+        etag = await run_in_threadpool(file_manager.get_content_etag, thumbnail_path)
+        cache_headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.IMAGE_CACHE_MAX_AGE}"}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=cache_headers)
+        
+        return FileResponse(path=thumbnail_path, media_type=media_type, headers=cache_headers)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting thumbnail: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get thumbnail")
+
 @router.delete("/files/{filename}")
 async def delete_file(filename: str):
     """删除文件"""
@@ -182,6 +638,7 @@ async def export_result(filename: str, export_type: str = Form(...), pixel_size:
             raise HTTPException(status_code=404, detail="File not found")
         
         # 加载处理结果
+        await run_in_threadpool(_refresh_result, filename)
         result = file_manager.load_processing_result(filename)
         if not result:
             raise HTTPException(status_code=404, detail="Processing result not found")
@@ -191,12 +648,14 @@ async def export_result(filename: str, export_type: str = Form(...), pixel_size:
             pixel_data=result["pixel_data"],
             dimensions=result["dimensions"],
             pixel_size=pixel_size,
-            export_type=export_type
+            export_type=export_type,
+            source_filename=filename,
+            output_dir=file_manager.get_export_dir(filename)
         )
         
         # 获取文件大小
-        export_path = os.path.join(settings.UPLOAD_DIR, export_filename)
-        file_size = os.path.getsize(export_path) if os.path.exists(export_path) else 0
+        export_path = file_manager.get_export_path(export_filename)
+        file_size = os.path.getsize(export_path) if export_path else 0
         
         logger.info(f"Export completed: {filename} -> {export_filename}")
         
@@ -215,12 +674,84 @@ async def export_result(filename: str, export_type: str = Form(...), pixel_size:
         logger.error(f"Error exporting result: {e}")
         raise HTTPException(status_code=500, detail="Failed to export result")
 
+@router.get("/export/{filename}/direct")
+async def export_result_direct(
+    request: Request,
+    filename: str,
+    export_type: str = Query("png"),
+    pixel_size: int = Query(10, ge=1, le=64)
+):
+    """直接导出处理结果：在内存缓冲区中渲染并流式返回，不写入上传目录"""
+    try:
+        if export_type.lower() not in EXPORT_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported export type: {export_type}")
+        
+        # 检查文件是否存在
+        file_path = file_manager.get_file_path(filename)
+        if not file_path:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        await run_in_threadpool(_refresh_result, filename)
+        version = file_manager.get_result_version(filename)
+        if not version:
+            raise HTTPException(status_code=404, detail="Processing result not found")
+        
+        # 处理结果与导出参数不变时，浏览器可以直接使用缓存
+        etag = '"' + hashlib.sha1(f"{filename}:{version}:{export_type}:{pixel_size}".encode()).hexdigest() + '"'
+        cache_headers = {
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={settings.EXPORT_CACHE_MAX_AGE}"
+        }
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=cache_headers)
+        
+        # 加载处理结果
+        result = await run_in_threadpool(file_manager.load_processing_result, filename)
+        if not result:
+            raise HTTPException(status_code=404, detail="Processing result not found")
+        
+        buffer, size, media_type = await run_in_threadpool(
+            profiled(image_processor.export_to_buffer),
+            pixel_data=result["pixel_data"],
+            dimensions=result["dimensions"],
+            pixel_size=pixel_size,
+            export_type=export_type
+        )
+        
+        def iter_buffer(chunk_size: int = 64 * 1024):
+            try:
+                chunk = buffer.read(chunk_size)
+                while chunk:
+                    yield chunk
+                    chunk = buffer.read(chunk_size)
+            finally:
+                buffer.close()
+        
+        export_filename = f"pixelated_{os.path.splitext(filename)[0]}.{export_type}"
+        logger.info(f"Direct export: {filename} -> {export_filename} ({size} bytes)")
+        
+        return StreamingResponse(
+            iter_buffer(),
+            media_type=media_type,
+            headers={
+                **cache_headers,
+                "Content-Length": str(size),
+                "Content-Disposition": f'attachment; filename="{export_filename}"'
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting result directly: {e}")
+        raise HTTPException(status_code=500, detail="Failed to export result")
+
 @router.get("/download/{filename}")
 async def download_export(filename: str):
     """下载导出文件"""
     try:
-        file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        if not os.path.exists(file_path):
+        file_path = file_manager.get_export_path(filename)
+        if not file_path:
             raise HTTPException(status_code=404, detail="Export file not found")
         
         return FileResponse(
@@ -251,10 +782,219 @@ async def get_stats():
                 "total_files": total_files,
                 "total_size": total_size,
                 "processed_files": processed_files,
-                "upload_dir": settings.UPLOAD_DIR
+                "upload_dir": settings.UPLOAD_DIR,
+                "admission": image_processor.admission.stats(),
+                "shared_cache": image_processor.shared_cache.stats() if image_processor.shared_cache is not None else None
             }
         }
         
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get stats") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to get stats") 
+
+@router.get("/diagnostics/profiles")
+async def list_profiles():
+    """列出已捕获的请求性能剖析"""
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    
+    try:
+        return {
+            "success": True,
+            "data": [
+                {**profile, "download_url": f"/api/diagnostics/profiles/{profile['name']}"}
+                for profile in request_profiler.list_profiles()
+            ]
+        }
+        
+    except Exception as e:
+        logger.error(f"Error listing profiles: {e}")
+        raise HTTPException(status_code=500, detail="Failed to list profiles")
+
+@router.get("/diagnostics/profiles/{name}")
+async def download_profile(name: str):
+    """下载请求性能剖析文件（cProfile为.prof，pyinstrument为.html）"""
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    
+    try:
+        artifact_path = request_profiler.get_artifact_path(name)
+        if not artifact_path:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        media_type = "text/html" if artifact_path.endswith(".html") else "application/octet-stream"
+        return FileResponse(
+            path=artifact_path,
+            media_type=media_type,
+            filename=os.path.basename(artifact_path)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error downloading profile: {e}")
+        raise HTTPException(status_code=500, detail="Failed to download profile")
+
+def _job_response(job: Job) -> JobResponse:
+    snapshot = job.snapshot()
+    return JobResponse(
+        job_id=job.id,
+        kind=job.kind,
+        status=snapshot["status"],
+        stage=snapshot["stage"],
+        progress=snapshot["progress"],
+        error=snapshot["error"],
+        events_url=f"/api/jobs/{job.id}/events",
+        result_url=f"/api/jobs/{job.id}/result"
+    )
+
+@router.post("/jobs/process", response_model=JobResponse)
+async def submit_process_job(request: ProcessRequest):
+    """以后台任务方式处理图片，进度通过 /api/jobs/{job_id}/events 推送"""
+    try:
+        file_path = file_manager.get_file_path(request.file_id)
+        if not file_path:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        if request.max_size > settings.MAX_PROCESSING_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"max_size exceeds {settings.MAX_PROCESSING_SIZE}, use /api/process/tiled for larger grids"
+            )
+        
+        def run(job: Job):
+            result = image_processor.process_image(
+                file_path=file_path,
+                max_size=request.max_size,
+                color_count=request.color_count,
+                numbering_mode=request.numbering_mode,
+                progress=job.report,
+                cancel_token=job.cancel_token
+            )
+            job.report("save", 0.0)
+            _save_result(request.file_id, file_path, result)
+            job.report("save", 1.0)
+            return result
+        
+        job = job_manager.submit("process", run, request.model_dump(), PROCESS_STAGE_WEIGHTS)
+        return _job_response(job)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting process job: {e}")
+        raise HTTPException(status_code=500, detail="Failed to submit process job")
+
+@router.post("/jobs/export/{filename}", response_model=JobResponse)
+async def submit_export_job(filename: str, export_type: str = Form(...), pixel_size: int = Form(10, ge=1, le=64)):
+    """以后台任务方式导出处理结果，完成后从 /api/jobs/{job_id}/result 获取下载地址"""
+    try:
+        export_type = export_type.lower()
+        if export_type not in EXPORT_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported export type: {export_type}")
+        
+        if not file_manager.get_file_path(filename):
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        def run(job: Job):
+            job.report("load", 0.0)
+            _refresh_result(filename)
+            result = file_manager.load_processing_result(filename)
+            if not result:
+                raise ValueError("Processing result not found")
+            job.report("load", 1.0)
+            
+            export_filename = image_processor.export_pixelated_image(
+                pixel_data=result["pixel_data"],
+                dimensions=result["dimensions"],
+                pixel_size=pixel_size,
+                export_type=export_type,
+                progress=job.report,
+                source_filename=filename,
+                output_dir=file_manager.get_export_dir(filename)
+            )
+            export_path = file_manager.get_export_path(export_filename)
+            return {
+                "download_url": f"/api/download/{export_filename}",
+                "filename": export_filename,
+                "file_size": os.path.getsize(export_path) if export_path else 0
+            }
+        
+        params = {"filename": filename, "export_type": export_type, "pixel_size": pixel_size}
+        job = job_manager.submit("export", run, params, EXPORT_STAGE_WEIGHTS)
+        return _job_response(job)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting export job: {e}")
+        raise HTTPException(status_code=500, detail="Failed to submit export job")
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """获取任务状态与整体进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(request: Request, job_id: str):
+    """以Server-Sent Events推送任务进度，任务结束后关闭连接
+
+    断线重连时浏览器会带上 Last-Event-ID，从其后的事件继续推送。
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    try:
+        last_event_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_event_id = 0
+    
+    async def event_stream():
+        sent = last_event_id
+        idle = 0.0
+        while True:
+            # 先读取状态再读取事件，保证结束事件不会被遗漏
+            finished = job.finished
+            events = job.events_since(sent)
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+                sent = event["id"]
+            if finished or await request.is_disconnected():
+                break
+            
+            idle = 0.0 if events else idle + JOB_EVENT_POLL_INTERVAL
+            if idle >= settings.JOB_EVENT_KEEPALIVE:
+                yield ": keepalive\n\n"
+                idle = 0.0
+            await asyncio.sleep(JOB_EVENT_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """获取已完成任务的结果：处理任务返回与 /api/process 相同的数据，导出任务返回下载信息"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    
+    if job.kind == "process":
+        return _process_response(job.result, instructions=job.params.get("instructions", "full"))
+    return {"success": True, "data": job.result}
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """取消任务：排队中的任务直接取消，运行中的任务在下一次进度回调时停止"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+负载测试
+
+模拟多个并发用户的完整使用流程：上传合成图片 → 按参数组合依次处理（模拟拖动尺寸/颜色滑块）→ 查看历史记录 → 导出。
+默认通过ASGI传输在进程内驱动应用（上传目录为临时目录，无需启动服务器）；指定 --base-url 时测试已运行的服务。
+按路由统计请求数、错误率、p50/p95/p99延迟与吞吐量，结果可输出为JSON。
+
+用法:
+    python -m pixlator.benchmarks.loadtest --users 8 --iterations 3
+    python -m pixlator.benchmarks.loadtest --users 16 --duration 60 --sizes 50,100,200 --colors 0,8,16
+    python -m pixlator.benchmarks.loadtest --base-url http://127.0.0.1:9000 --users 4 --output load.json
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from pixlator.benchmarks.pipeline import NUMBERING_MODES, parse_int_list
+
+DEFAULT_SIZES = [50, 100, 200]
+DEFAULT_COLORS = [0, 8]
+
+
+def create_image_bytes(width: int, height: int, seed: int) -> bytes:
+    """生成PNG格式的合成图片：渐变背景加随机色块，不同seed的内容不同（不会被上传去重合并）"""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width]
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[..., 0] = (255 * (xs / width)).astype(np.uint8)
+    img[..., 1] = (255 * (ys / height)).astype(np.uint8)
+    img[..., 2] = rng.integers(0, 256)
+    for _ in range(12):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        img[y:y + height // 6, x:x + width // 6] = rng.integers(0, 256, size=3)
+    buffer = io.BytesIO()
+    Image.fromarray(img).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class RouteStats:
+    """按路由记录延迟与状态码"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.flows = 0
+        self.failed_flows = 0
+
+    def record(self, route: str, seconds: float, status: str) -> None:
+        self.latencies[route].append(seconds)
+        self.statuses[route][status] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict]:
+        routes = {}
+        for route, samples in self.latencies.items():
+            statuses = dict(self.statuses[route])
+            errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            routes[route] = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": errors / len(samples),
+                "throughput": len(samples) / elapsed,
+                "p50_ms": p50 * 1000,
+                "p95_ms": p95 * 1000,
+                "p99_ms": p99 * 1000,
+                "max_ms": max(samples) * 1000,
+                "statuses": statuses,
+            }
+        return routes
+
+
+class VirtualUser:
+    """一个模拟用户：循环执行 上传 → 处理参数扫描 → 历史记录 → 导出"""
+
+    def __init__(self, index: int, client: httpx.AsyncClient, stats: RouteStats, args: argparse.Namespace):
+        self.index = index
+        self.client = client
+        self.stats = stats
+        self.args = args
+        self.sweep = list(itertools.product(args.sizes, args.colors))
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(route, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.stats.record(route, time.perf_counter() - start, str(response.status_code))
+        return response
+
+    async def run_flow(self, iteration: int) -> bool:
+        seed = self.args.seed if self.args.reuse_image else self.args.seed + self.index * 100003 + iteration
+        # 在线程中生成图片，进程内运行时不阻塞应用的事件循环
+        image = await asyncio.to_thread(create_image_bytes, self.args.image_size, int(self.args.image_size * 0.75), seed)
+        response = await self.request("POST /api/upload", "POST", "/api/upload", files={"file": (f"load_{seed}.png", image, "image/png")})
+        if response is None or response.status_code != 200:
+            return False
+        filename = response.json()["filename"]
+
+        ok = True
+        for step, (max_size, color_count) in enumerate(self.sweep):
+            payload = {
+                "file_id": filename,
+                "max_size": max_size,
+                "color_count": color_count or None,
+                "numbering_mode": NUMBERING_MODES[(self.index + step) % len(NUMBERING_MODES)],
+            }
+            response = await self.request("POST /api/process", "POST", "/api/process", json=payload)
+            ok = ok and response is not None and response.status_code == 200
+
+        response = await self.request("GET /api/history", "GET", "/api/history")
+        ok = ok and response is not None and response.status_code == 200
+
+        response = await self.request(
+            "POST /api/export/{filename}", "POST", f"/api/export/{filename}",
+            data={"export_type": "png", "pixel_size": str(self.args.pixel_size)}
+        )
+        return ok and response is not None and response.status_code == 200
+
+    async def run(self, deadline: Optional[float]) -> None:
+        for iteration in itertools.count():
+            if deadline is None and iteration >= self.args.iterations:
+                return
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            ok = await self.run_flow(iteration)
+            self.stats.flows += 1
+            self.stats.failed_flows += 0 if ok else 1
+
+
+@asynccontextmanager
+async def open_client(args: argparse.Namespace) -> AsyncIterator[httpx.AsyncClient]:
+    """--base-url 时连接已运行的服务，否则在临时上传目录中进程内启动应用（包括lifespan）"""
+    timeout = httpx.Timeout(args.timeout)
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+            yield client
+        return
+
+    with tempfile.TemporaryDirectory(prefix="pixlator-load-") as work_dir:
+        # 应用在导入时读取配置并挂载静态目录，必须在导入 pixlator.main 之前设置；
+        # get_upload_path/ensure_upload_dir 是类方法，读取的是类属性，因此设置在类上
+        from pixlator.config import Settings
+        original_upload_dir = Settings.UPLOAD_DIR
+        Settings.UPLOAD_DIR = os.path.join(work_dir, "uploads")
+        frontend = os.path.join(work_dir, "frontend")
+        os.makedirs(os.path.join(frontend, "assets"))
+        os.environ.setdefault("PIXELATOR_FRONTEND", frontend)
+        try:
+            from pixlator.main import app
+
+            transport = httpx.ASGITransport(app=app)
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+                    yield client
+        finally:
+            Settings.UPLOAD_DIR = original_upload_dir
+
+
+async def run_load(args: argparse.Namespace) -> Dict:
+    stats = RouteStats()
+    async with open_client(args) as client:
+        deadline = time.perf_counter() + args.duration if args.duration else None
+        users = [VirtualUser(index, client, stats, args) for index in range(args.users)]
+        start = time.perf_counter()
+        await asyncio.gather(*(user.run(deadline) for user in users))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "target": args.base_url or "in-process",
+            "users": args.users,
+            "iterations": None if args.duration else args.iterations,
+            "duration": args.duration,
+            "sizes": args.sizes,
+            "colors": args.colors,
+            "image_size": args.image_size,
+            "reuse_image": args.reuse_image,
+        },
+        "elapsed": elapsed,
+        "flows": stats.flows,
+        "failed_flows": stats.failed_flows,
+        "flows_per_second": stats.flows / elapsed if elapsed else 0.0,
+        "routes": stats.summary(elapsed),
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"{report['flows']} flows ({report['failed_flows']} failed) in {report['elapsed']:.1f}s, {report['flows_per_second']:.2f} flows/s")
+    print(f"{'route':<30} {'reqs':>6} {'err%':>6} {'req/s':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route, item in report["routes"].items():
+        print(f"{route:<30} {item['requests']:>6} {item['error_rate'] * 100:>5.1f}% {item['throughput']:>7.2f} "
+              f"{item['p50_ms']:>7.0f}ms {item['p95_ms']:>7.0f}ms {item['p99_ms']:>7.0f}ms")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pixlator 负载测试")
+    parser.add_argument("--base-url", help="已运行服务的地址，不指定时在进程内运行应用")
+    parser.add_argument("--users", type=int, default=4, help="并发用户数")
+    parser.add_argument("--iterations", type=int, default=2, help="每个用户执行完整流程的次数")
+    parser.add_argument("--duration", type=float, help="持续时间（秒），指定时忽略 --iterations")
+    parser.add_argument("--sizes", type=parse_int_list, default=DEFAULT_SIZES, help="每次流程中依次处理的max_size，逗号分隔")
+    parser.add_argument("--colors", type=parse_int_list, default=DEFAULT_COLORS, help="每次流程中依次使用的color_count，0表示不减色")
+    parser.add_argument("--image-size", type=int, default=800, help="合成图片的宽度")
+    parser.add_argument("--reuse-image", action="store_true", help="所有用户上传同一张图片（测试去重与缓存命中）")
+    parser.add_argument("--pixel-size", type=int, default=4, help="导出的像素块大小")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的超时（秒）")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    # 进程内运行时关闭应用日志
+    logger.disable("pixlator")
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+处理流程基准测试
+
+使用合成的渐变图片（与 tests/test_upload_and_process.py 中的 create_test_image 相同），
+分别计时 PixelArtConverter 及 ImageProcessor 的各个阶段，结果输出为JSON，
+并可与基线结果比较、标记超过阈值的性能回退。
+
+用法:
+    python -m pixlator.benchmarks.pipeline run --output bench.json
+    python -m pixlator.benchmarks.pipeline compare baseline.json bench.json --threshold 0.2
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from pixlator.config import Settings
+from pixlator.services.file_manager import FileManager
+from pixlator.services.image_processor import ImageProcessor, PixelArtConverter
+from pixlator.services.quantizer import ColorQuantizer
+from pixlator.utils import serialization
+
+NUMBERING_MODES = ["top_to_bottom", "bottom_to_top", "diagonal_bottom_left", "diagonal_bottom_right"]
+STAGES = ["decode", "resize", "quantize", "analyze", "sequences", "stats", "serialize", "save", "export"]
+
+DEFAULT_SIZES = [50, 100, 200, 500]
+DEFAULT_COLORS = [0, 8, 16]
+
+# 比较时忽略绝对差值小于该值（秒）的阶段，避免噪声误报
+DEFAULT_MIN_DELTA = 0.001
+
+
+def create_test_image(width: int, height: int, path: str) -> str:
+    """创建渐变测试图片（向量化版本的 create_test_image）"""
+    xs = np.arange(width)[None, :].repeat(height, axis=0)
+    ys = np.arange(height)[:, None].repeat(width, axis=1)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = (255 * (xs / width)).astype(np.uint8)
+    img[..., 1] = (255 * (ys / height)).astype(np.uint8)
+    img[..., 2] = 128
+    Image.fromarray(img).save(path)
+    return path
+
+
+def run_case(image_path: str, max_size: int, color_count: int, numbering_mode: str, file_manager: FileManager) -> Dict[str, float]:
+    """执行一次完整流程，返回各阶段耗时（秒）"""
+    processor = ImageProcessor()
+    timings = {}
+
+    def timed(stage: str, func: Callable):
+        start = time.perf_counter()
+        value = func()
+        timings[stage] = time.perf_counter() - start
+        return value
+
+    converter = timed("decode", lambda: PixelArtConverter(image_path))
+    timed("resize", lambda: converter.resize_image(max_size))
+    if color_count:
+        # 每次使用新的量化器，测量冷启动K-means
+        timed("quantize", lambda: converter.reduce_colors(color_count, quantizer=ColorQuantizer()))
+    else:
+        timings["quantize"] = 0.0
+    timed("analyze", lambda: converter.analyze_pixels(numbering_mode))
+    number_sequences, color_to_index = timed("sequences", lambda: converter.analyze_number_sequences(numbering_mode))
+
+    def stats():
+        return (
+            processor._generate_color_stats(converter.pixel_data, color_to_index),
+            processor._generate_number_stats(number_sequences),
+        )
+
+    color_stats, number_stats = timed("stats", stats)
+    dimensions = {"width": converter.width, "height": converter.height}
+
+    def serialize():
+        result = {
+            "pixel_data": processor._serialize_pixel_data(converter.pixel_data),
+            "color_stats": color_stats,
+            "number_stats": number_stats,
+            "dimensions": dimensions,
+        }
+        serialization.dumps(result)
+        return result
+
+    result = timed("serialize", serialize)
+    timed("save", lambda: file_manager.save_processing_result(os.path.basename(image_path), result))
+
+    def export():
+        img = processor.render_pixelated_image(result["pixel_data"], dimensions, pixel_size=10)
+        processor.write_export(img, io.BytesIO(), "png")
+
+    timed("export", export)
+    return timings
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """汇总多次运行的耗时"""
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "max": max(samples),
+    }
+
+
+def run_benchmarks(sizes: List[int], colors: List[int], modes: List[str], repeat: int, source_size: int) -> Dict:
+    """运行全部基准测试用例"""
+    original_upload_dir = Settings.UPLOAD_DIR
+    with tempfile.TemporaryDirectory(prefix="pixlator-bench-") as work_dir:
+        # FileManager与ImageProcessor的共享磁盘缓存都位于上传目录下：放在临时目录中，
+        # 既不在当前目录留下uploads/，也不会命中之前运行留下的缓存。
+        # get_upload_path/ensure_upload_dir 是类方法，读取的是类属性，因此设置在类上
+        Settings.UPLOAD_DIR = work_dir
+        try:
+            image_path = create_test_image(source_size, int(source_size * 0.8), os.path.join(work_dir, "bench_source.png"))
+            file_manager = FileManager()
+            results = run_cases(image_path, sizes, colors, modes, repeat, file_manager)
+        finally:
+            Settings.UPLOAD_DIR = original_upload_dir
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "source_size": source_size,
+        },
+        "results": results,
+    }
+
+
+def run_cases(image_path: str, sizes: List[int], colors: List[int], modes: List[str], repeat: int, file_manager: FileManager) -> List[Dict]:
+    """按尺寸、颜色数与编号方式的组合运行各用例，返回每个用例的阶段耗时汇总"""
+    results = []
+    for size in sizes:
+        for color_count in colors:
+            for mode in modes:
+                samples = {stage: [] for stage in STAGES}
+                for _ in range(repeat):
+                    timings = run_case(image_path, size, color_count, mode, file_manager)
+                    for stage in STAGES:
+                        samples[stage].append(timings[stage])
+
+                stages = {stage: summarize(values) for stage, values in samples.items()}
+                total = sum(stage["median"] for stage in stages.values())
+                case = f"size={size},colors={color_count},mode={mode}"
+                print(f"{case:<60} total={total * 1000:9.1f}ms")
+                results.append({
+                    "case": case,
+                    "max_size": size,
+                    "color_count": color_count,
+                    "numbering_mode": mode,
+                    "stages": stages,
+                    "total": total,
+                })
+
+    return results
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float, min_delta: float = DEFAULT_MIN_DELTA) -> List[Dict]:
+    """比较两次基准测试结果（按中位数），返回超过阈值的回退列表"""
+    baseline_cases = {item["case"]: item for item in baseline["results"]}
+    regressions = []
+
+    for item in current["results"]:
+        base = baseline_cases.get(item["case"])
+        if base is None:
+            continue
+        for stage, timing in item["stages"].items():
+            if stage not in base["stages"]:
+                continue
+            before = base["stages"][stage]["median"]
+            after = timing["median"]
+            if after - before < min_delta:
+                continue
+            ratio = after / before if before > 0 else float("inf")
+            if ratio > 1 + threshold:
+                regressions.append({
+                    "case": item["case"],
+                    "stage": stage,
+                    "baseline": before,
+                    "current": after,
+                    "ratio": ratio,
+                })
+
+    return regressions
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pixlator 处理流程基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("--sizes", type=parse_int_list, default=DEFAULT_SIZES, help="max_size列表，逗号分隔")
+    run_parser.add_argument("--colors", type=parse_int_list, default=DEFAULT_COLORS, help="color_count列表，0表示不减色")
+    run_parser.add_argument("--modes", default="all", help="编号方式列表，逗号分隔，默认全部")
+    run_parser.add_argument("--repeat", type=int, default=3, help="每个用例的重复次数")
+    run_parser.add_argument("--source-size", type=int, default=1000, help="合成源图片的宽度")
+    run_parser.add_argument("--output", help="结果JSON输出路径")
+
+    compare_parser = subparsers.add_parser("compare", help="与基线结果比较")
+    compare_parser.add_argument("baseline", help="基线结果JSON")
+    compare_parser.add_argument("current", help="当前结果JSON")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="允许的相对回退比例")
+    compare_parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA, help="忽略的绝对差值（秒）")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        # 关闭处理流程中的日志，避免日志输出计入耗时
+        logger.disable("pixlator")
+        modes = NUMBERING_MODES if args.modes == "all" else args.modes.split(",")
+        report = run_benchmarks(args.sizes, args.colors, modes, args.repeat, args.source_size)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output)
+            print(f"Results written to {args.output}")
+        else:
+            print(output)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    regressions = compare_results(baseline, current, args.threshold, args.min_delta)
+    for item in regressions:
+        print(
+            f"REGRESSION {item['case']} [{item['stage']}]: "
+            f"{item['baseline'] * 1000:.1f}ms -> {item['current'] * 1000:.1f}ms ({item['ratio']:.2f}x)"
+        )
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+JSON序列化基准测试
+
+对不同尺寸的处理结果，比较原有的编码方式（标准库json缩进保存、ProcessResponse校验后编码响应）
+与 utils/serialization（orjson，未安装时为标准库json）的编码、解码耗时及输出大小。
+
+用法:
+    python -m pixlator.benchmarks.serialization
+    python -m pixlator.benchmarks.serialization --sizes 100,200,500 --repeat 5 --output serialization.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+
+from pixlator.api.models import ProcessResponse
+from pixlator.api.responses import FastJSONResponse
+from pixlator.benchmarks.pipeline import create_test_image, parse_int_list, summarize
+from pixlator.services.image_processor import ImageProcessor
+from pixlator.utils import serialization
+
+DEFAULT_SIZES = [100, 200, 500]
+
+
+def response_content(result: Dict) -> Dict:
+    return {key: result[key] for key in ("pixel_data", "color_stats", "number_stats", "dimensions")}
+
+
+def encoders(result: Dict) -> Dict[str, Callable[[], bytes]]:
+    """各编码方式：名称 -> 返回编码结果的函数"""
+    content = response_content(result)
+
+    def pydantic_response() -> bytes:
+        # 原有的响应路径：按response_model校验并转换，再由JSONResponse编码
+        model = ProcessResponse(**content)
+        return json.dumps(model.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return {
+        "save_json_indent": lambda: json.dumps(result, indent=2, ensure_ascii=False).encode("utf-8"),
+        "save_fast": lambda: serialization.dumps(result),
+        "response_pydantic": pydantic_response,
+        "response_fast": lambda: FastJSONResponse(content).body,
+    }
+
+
+def time_samples(func: Callable, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_benchmarks(sizes: List[int], color_count: int, repeat: int, source_size: int) -> Dict:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pixlator-bench-") as work_dir:
+        image_path = create_test_image(source_size, int(source_size * 0.8), os.path.join(work_dir, "bench_source.png"))
+        processor = ImageProcessor()
+
+        for size in sizes:
+            result = processor.process_image(image_path, max_size=size, color_count=color_count)
+            cases = {}
+            for name, encode in encoders(result).items():
+                data = encode()
+                cases[name] = {"bytes": len(data), **summarize(time_samples(encode, repeat))}
+
+            # 读取保存的结果
+            indented = json.dumps(result, indent=2, ensure_ascii=False).encode("utf-8")
+            compact = serialization.dumps(result)
+            cases["load_json"] = {"bytes": len(indented), **summarize(time_samples(lambda: json.loads(indented), repeat))}
+            cases["load_fast"] = {"bytes": len(compact), **summarize(time_samples(lambda: serialization.loads(compact), repeat))}
+
+            dimensions = result["dimensions"]
+            print(f"size={size} ({dimensions['width']}x{dimensions['height']})")
+            for name, timing in cases.items():
+                print(f"  {name:<20} {timing['median'] * 1000:9.1f}ms {timing['bytes'] / 1024:10.1f}KB")
+            results.append({"max_size": size, "dimensions": dimensions, "cases": cases})
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "backend": serialization.BACKEND,
+            "repeat": repeat,
+            "source_size": source_size,
+            "color_count": color_count,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pixlator JSON序列化基准测试")
+    parser.add_argument("--sizes", type=parse_int_list, default=DEFAULT_SIZES, help="max_size列表，逗号分隔")
+    parser.add_argument("--colors", type=int, default=16, help="color_count，0表示不减色")
+    parser.add_argument("--repeat", type=int, default=5, help="每种编码方式的重复次数")
+    parser.add_argument("--source-size", type=int, default=1000, help="合成源图片的宽度")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    # 关闭处理流程中的日志
+    logger.disable("pixlator")
+    print(f"Backend: {serialization.BACKEND}")
+    report = run_benchmarks(args.sizes, args.colors, args.repeat, args.source_size)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试
+
+在全新的子进程中以 `python -X importtime` 导入应用入口模块，记录进程总耗时、导入耗时，
+并按顶层包汇总 -X importtime 报告的自身导入时间，找出拖慢worker启动的依赖。
+--warmup 额外计时导入后执行 warmup.warm_up()（即 WARMUP_ON_STARTUP 时worker可以开始处理请求前的耗时）。
+
+用法:
+    python -m pixlator.benchmarks.startup
+    python -m pixlator.benchmarks.startup --modules pixlator.main --repeat 10 --warmup --output startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pixlator.benchmarks.pipeline import summarize
+
+DEFAULT_MODULES = ["pixlator.main", "pixlator.api.routes", "pixlator.examples.converter"]
+
+# 子进程中执行的代码：导入模块（可选预热），把耗时（秒）打印到stdout
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter() - start
+if {warmup}:
+    from pixlator.services.warmup import warm_up
+    warm_up()
+print(imported, time.perf_counter() - start)
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 的输出，返回[(模块名, 自身耗时us, 累计耗时us)]"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 表头
+        entries.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return entries
+
+
+def top_packages(entries: List[Tuple[str, int, int]], limit: int) -> List[Dict]:
+    """按顶层包汇总自身导入耗时，返回耗时最多的limit个"""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in entries:
+        totals[name.split(".")[0]] += self_us
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"package": package, "self_ms": us / 1000} for package, us in ranked]
+
+
+def benchmark_env(work_dir: str) -> Dict[str, str]:
+    """子进程环境：上传目录放在临时目录中；未构建前端时提供空的静态目录，使 pixlator.main 可以导入"""
+    env = dict(os.environ)
+    env["UPLOAD_DIR"] = os.path.join(work_dir, "uploads")
+    env.setdefault("LOGURU_LEVEL", "WARNING")
+    if "PIXELATOR_FRONTEND" not in env and not (Path(__file__).parent.parent / "webapp" / "dist" / "assets").is_dir():
+        frontend = Path(work_dir) / "frontend"
+        (frontend / "assets").mkdir(parents=True, exist_ok=True)
+        env["PIXELATOR_FRONTEND"] = str(frontend)
+    return env
+
+
+def run_once(module: str, warmup: bool, env: Dict[str, str]) -> Dict:
+    """在新进程中导入一次模块"""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT.format(module=module, warmup=warmup)],
+        capture_output=True, text=True, env=env,
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    imported, ready = (float(value) for value in completed.stdout.split()[-2:])
+    return {"wall": wall, "import": imported, "ready": ready, "entries": parse_importtime(completed.stderr)}
+
+
+def run_benchmarks(modules: List[str], repeat: int, warmup: bool, top: int) -> Dict:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pixlator-bench-") as work_dir:
+        env = benchmark_env(work_dir)
+        for module in modules:
+            cases = [(module, False)] + ([(module, True)] if warmup else [])
+            for name, with_warmup in cases:
+                runs = [run_once(name, with_warmup, env) for _ in range(repeat)]
+                entries = runs[-1]["entries"]
+                heavy = {"sklearn", "scipy", "openpyxl"}
+                result = {
+                    "module": name,
+                    "warmup": with_warmup,
+                    "wall": summarize([run["wall"] for run in runs]),
+                    "import": summarize([run["import"] for run in runs]),
+                    "ready": summarize([run["ready"] for run in runs]),
+                    "modules_imported": len(entries),
+                    "heavy_imported": sorted(heavy & {entry[0].split(".")[0] for entry in entries}),
+                    "top_packages": top_packages(entries, top),
+                }
+                label = f"{name}{' + warm_up' if with_warmup else ''}"
+                print(f"{label:<40} wall {result['wall']['median'] * 1000:7.0f}ms  import {result['import']['median'] * 1000:7.0f}ms  "
+                      f"ready {result['ready']['median'] * 1000:7.0f}ms  heavy={','.join(result['heavy_imported']) or '-'}")
+                for item in result["top_packages"]:
+                    print(f"    {item['package']:<24} {item['self_ms']:8.1f}ms")
+                results.append(result)
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pixlator 启动耗时基准测试")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES), help="要导入的模块列表，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块的重复次数")
+    parser.add_argument("--warmup", action="store_true", help="同时计时导入后执行warm_up()")
+    parser.add_argument("--top", type=int, default=8, help="列出导入耗时最多的顶层包个数")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    modules = [module.strip() for module in args.modules.split(",") if module.strip()]
+    report = run_benchmarks(modules, args.repeat, args.warmup, args.top)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,5 @@
 import os
 from typing import List
-from loguru import logger
 
 class Settings:
     """应用配置类"""
@@ -13,6 +12,7 @@ class Settings:
     # 服务器配置
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "9000"))
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"  # 启动时预加载重依赖并预热（配合 gunicorn --preload）
     
     # 文件上传配置
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
@@ -32,9 +32,75 @@ class Settings:
     MAX_PROCESSING_SIZE: int = int(os.getenv("MAX_PROCESSING_SIZE", "500"))
     DEFAULT_COLOR_COUNT: int = int(os.getenv("DEFAULT_COLOR_COUNT", "8"))
     
+    # 处理请求准入配置（按估算内存占用准入，超出预算时排队或返回503）
+    ADMISSION_MEMORY_BUDGET_MB: int = int(os.getenv("ADMISSION_MEMORY_BUDGET_MB", "1024"))  # 0表示不限制
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))  # /api/process 最长排队时间（秒）
+    ADMISSION_RETRY_AFTER: int = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))  # 503响应的Retry-After（秒）
+    
+    # 多帧GIF配置（所有帧共用一个调色板，帧按差异压缩保存）
+    MAX_ANIMATION_FRAMES: int = int(os.getenv("MAX_ANIMATION_FRAMES", "300"))
+    ANIMATION_WORKERS: int = int(os.getenv("ANIMATION_WORKERS", str(min(4, os.cpu_count() or 1))))
+    ANIMATION_KEYFRAME_INTERVAL: int = int(os.getenv("ANIMATION_KEYFRAME_INTERVAL", "30"))
+    ANIMATION_DELTA_RATIO: float = float(os.getenv("ANIMATION_DELTA_RATIO", "0.25"))  # 变化像素超过该比例时保存完整帧
+    
+    # 分块模式配置（超过MAX_PROCESSING_SIZE的大尺寸网格）
+    MAX_TILED_SIZE: int = int(os.getenv("MAX_TILED_SIZE", "4000"))
+    TILE_SIZE: int = int(os.getenv("TILE_SIZE", "256"))
+    MAX_NUMBER_STATS_PAGE: int = int(os.getenv("MAX_NUMBER_STATS_PAGE", "500"))
+    MAX_PIXEL_EDITS: int = int(os.getenv("MAX_PIXEL_EDITS", "10000"))  # 单次像素编辑请求的最大修改数
+    
+    # 导出配置
+    EXPORT_SPOOL_MAX_SIZE: int = int(os.getenv("EXPORT_SPOOL_MAX_SIZE", "8388608"))  # 超过8MB落盘到临时文件
+    EXPORT_CACHE_MAX_AGE: int = int(os.getenv("EXPORT_CACHE_MAX_AGE", "3600"))
+    
+    # JSON序列化配置（auto时安装了orjson则使用orjson，否则使用标准库json）
+    JSON_BACKEND: str = os.getenv("JSON_BACKEND", "auto")
+    RESULT_JSON_INDENT: bool = os.getenv("RESULT_JSON_INDENT", "false").lower() == "true"  # 保存的处理结果是否缩进
+    
+    # 响应压缩配置（开启BROTLI_ENABLED且安装了brotli-asgi时使用brotli，否则使用gzip）
+    BROTLI_ENABLED: bool = os.getenv("BROTLI_ENABLED", "false").lower() == "true"
+    COMPRESSION_MINIMUM_SIZE: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", "4"))
+    
+    # 预览与缩略图配置
+    THUMBNAIL_DIR: str = os.getenv("THUMBNAIL_DIR", "thumbnails")  # 位于上传目录下
+    BLOB_DIR: str = os.getenv("BLOB_DIR", "blobs")  # 按内容去重的原图，位于上传目录下
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # 上传按块读取并计算哈希
+    THUMBNAIL_SIZES: List[int] = [int(size) for size in os.getenv("THUMBNAIL_SIZES", "128,256,512").split(",") if size.strip()]
+    THUMBNAIL_FORMAT: str = os.getenv("THUMBNAIL_FORMAT", "webp")  # webp 或 jpeg
+    THUMBNAIL_QUALITY: int = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+    IMAGE_CACHE_MAX_AGE: int = int(os.getenv("IMAGE_CACHE_MAX_AGE", "86400"))
+    
+    # 处理结果缓存与上传后预热配置
+    CACHE_MEMORY_LIMIT_MB: int = int(os.getenv("CACHE_MEMORY_LIMIT_MB", "256"))
+    SHARED_CACHE_MB: int = int(os.getenv("SHARED_CACHE_MB", "512"))  # 多个worker共享的磁盘缓存上限，0表示不使用
+    SHARED_CACHE_DIR: str = os.getenv("SHARED_CACHE_DIR", "cache")  # 位于上传目录下
+    PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+    PREFETCH_WORKERS: int = int(os.getenv("PREFETCH_WORKERS", "1"))
+    PREFETCH_MAX_PENDING: int = int(os.getenv("PREFETCH_MAX_PENDING", "4"))
+    PREFETCH_SIZES: List[int] = [int(size) for size in os.getenv("PREFETCH_SIZES", "50,100,150,200").split(",") if size.strip()]
+    PREFETCH_MAX_SOURCE_PIXELS: int = int(os.getenv("PREFETCH_MAX_SOURCE_PIXELS", "25000000"))  # 约5000x5000
+    
+    # 后台任务配置（带进度事件的处理/导出）
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_RETENTION_SECONDS: int = int(os.getenv("JOB_RETENTION_SECONDS", "600"))
+    JOB_EVENT_KEEPALIVE: float = float(os.getenv("JOB_EVENT_KEEPALIVE", "15"))  # SSE心跳间隔（秒）
+    
+    # 请求性能剖析配置（默认关闭）
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0.0"))
+    PROFILE_SLOW_THRESHOLD_MS: float = float(os.getenv("PROFILE_SLOW_THRESHOLD_MS", "2000"))  # 0表示只按采样率剖析
+    PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", "100"))
+    DIAGNOSTICS_DIR: str = os.getenv("DIAGNOSTICS_DIR", "diagnostics")
+    
     # 文件清理配置
-    CLEANUP_INTERVAL: int = int(os.getenv("CLEANUP_INTERVAL", "86400"))  # 24小时
+    CLEANUP_INTERVAL: int = int(os.getenv("CLEANUP_INTERVAL", "86400"))  # 24小时，0表示不自动清理
     FILE_RETENTION_DAYS: int = int(os.getenv("FILE_RETENTION_DAYS", "7"))
+    CLEANUP_BATCH_SIZE: int = int(os.getenv("CLEANUP_BATCH_SIZE", "100"))  # 每批删除的文件数
+    CLEANUP_BATCH_PAUSE: float = float(os.getenv("CLEANUP_BATCH_PAUSE", "0.5"))  # 批次间暂停（秒）
+    DISK_QUOTA_MB: int = int(os.getenv("DISK_QUOTA_MB", "0"))  # 0表示不限制
     
     @classmethod
     def get_upload_path(cls) -> str:
@@ -2,11 +2,7 @@ import os
 import argparse
 from PIL import Image
 from tqdm import tqdm
-from sklearn.cluster import KMeans
 import numpy as np
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
-from openpyxl.utils import get_column_letter
 from collections import defaultdict
 
 class DiagonalPixelArtConverter:
@@ -32,6 +28,9 @@ class DiagonalPixelArtConverter:
 
     def reduce_colors(self, n_colors):
         """使用K-means算法减少颜色数量"""
+        # scikit-learn导入较慢，只在需要减色时导入
+        from sklearn.cluster import KMeans
+
         print(f"正在将颜色减少到 {n_colors} 种...")
         img_array = np.array(self.img)
         h, w, c = img_array.shape
@@ -117,8 +116,16 @@ class DiagonalPixelArtConverter:
 
         return diagonal_sequences, color_to_index
 
-    def generate_excel(self, output_dir="output"):
-        """生成带颜色和对角线编号的Excel文件"""
+    def generate_excel(self, output_dir="output", compress=False):
+        """生成带颜色和对角线编号的Excel文件
+
+        compress为True时，对角线统计表中重复的序列以"同第N条"或周期性重复的引用代替
+        """
+        # openpyxl只在生成Excel时导入，不影响只做预览/分析的调用
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, Alignment, PatternFill
+        from openpyxl.utils import get_column_letter
+
         os.makedirs(output_dir, exist_ok=True)
         output_path = os.path.join(output_dir, f"{self.filename}_pixelart.xlsx")
 
@@ -157,13 +164,16 @@ class DiagonalPixelArtConverter:
         self._add_color_sheet(wb)
 
         # 添加对角线统计表
-        self._add_diagonal_sheet(wb)
+        self._add_diagonal_sheet(wb, compress=compress)
 
         wb.save(output_path)
         print(f"\nExcel文件已保存: {os.path.abspath(output_path)}")
 
     def _add_color_sheet(self, workbook):
         """添加颜色统计表"""
+        from openpyxl.styles import PatternFill
+        from openpyxl.utils import get_column_letter
+
         ws = workbook.create_sheet(title="颜色统计")
         ws.append(["颜色索引", "RGB值", "十六进制", "使用次数", "使用单元格"])
 
@@ -197,8 +207,11 @@ class DiagonalPixelArtConverter:
                 start_color=hex_color, end_color=hex_color, fill_type="solid"
             )
 
-    def _add_diagonal_sheet(self, workbook):
+    def _add_diagonal_sheet(self, workbook, compress=False):
         """添加对角线统计表"""
+        from openpyxl.styles import Font, Alignment, PatternFill
+        from openpyxl.utils import get_column_letter
+
         ws = workbook.create_sheet(title="对角线统计")
 
         # 分析对角线颜色序列
@@ -224,46 +237,59 @@ class DiagonalPixelArtConverter:
         for row in range(1, self.width + self.height + 5):
             ws.row_dimensions[row].height = 30
 
-        # 为每个对角线添加序列
-        for diagonal_num in range(self.width + self.height - 1):
-            row_num = diagonal_num + 2  # 从第2行开始
+        stats = [
+            {"number": diagonal_num, "sequence": diagonal_sequences.get(diagonal_num, [])}
+            for diagonal_num in range(self.width + self.height - 1)
+        ]
+        if compress:
+            # 压缩指令与 /api/process 的 instructions=compressed 相同
+            from pixlator.services.grid import compress_number_stats
+            stats = compress_number_stats(stats)
 
-            # 添加对角线索引号
+        # 为每个对角线（或压缩后的每条指令）添加一行
+        for row_num, stat in enumerate(stats, 2):  # 从第2行开始
+            diagonal_num = stat["number"]
+
+            # 添加对角线索引号（连续重复的对角线显示为范围）
             diagonal_index_cell = ws.cell(row=row_num, column=1)
-            diagonal_index_cell.value = diagonal_num
+            diagonal_index_cell.value = diagonal_num if "count" not in stat else f"{diagonal_num}-{diagonal_num + stat['count'] - 1}"
             diagonal_index_cell.alignment = Alignment(
                 horizontal="center", vertical="center"
             )
             diagonal_index_cell.font = Font(bold=True)
 
-            if diagonal_num in diagonal_sequences:
-                sequence = diagonal_sequences[diagonal_num]
-                col_offset = 0
-
-                for color_index, count in sequence:
-                    # 显示数量（带颜色背景）
-                    count_cell = ws.cell(row=row_num, column=2 + col_offset)
-                    count_cell.value = count
-                    count_cell.alignment = Alignment(
-                        horizontal="center", vertical="center"
-                    )
+            if "same_as" in stat:
+                ws.cell(row=row_num, column=2).value = f"同第{stat['same_as']}条"
+                continue
+            if "period" in stat:
+                ws.cell(row=row_num, column=2).value = "每条同上一条" if stat["period"] == 1 else f"每条同前第{stat['period']}条"
+                continue
+
+            col_offset = 0
+            for color_index, count in stat["sequence"]:
+                # 显示数量（带颜色背景）
+                count_cell = ws.cell(row=row_num, column=2 + col_offset)
+                count_cell.value = count
+                count_cell.alignment = Alignment(
+                    horizontal="center", vertical="center"
+                )
 
-                    # 设置背景色
-                    rgb_color = index_to_color[color_index]
-                    hex_color = (
-                        f"{rgb_color[0]:02X}{rgb_color[1]:02X}{rgb_color[2]:02X}"
-                    )
-                    count_cell.fill = PatternFill(
-                        start_color=hex_color, end_color=hex_color, fill_type="solid"
-                    )
+                # 设置背景色
+                rgb_color = index_to_color[color_index]
+                hex_color = (
+                    f"{rgb_color[0]:02X}{rgb_color[1]:02X}{rgb_color[2]:02X}"
+                )
+                count_cell.fill = PatternFill(
+                    start_color=hex_color, end_color=hex_color, fill_type="solid"
+                )
 
-                    # 设置字体颜色（根据背景色调整）
-                    if sum(rgb_color) > 384:  # 浅色背景用黑色字体
-                        count_cell.font = Font(color="000000", bold=True)
-                    else:  # 深色背景用白色字体
-                        count_cell.font = Font(color="FFFFFF", bold=True)
+                # 设置字体颜色（根据背景色调整）
+                if sum(rgb_color) > 384:  # 浅色背景用黑色字体
+                    count_cell.font = Font(color="000000", bold=True)
+                else:  # 深色背景用白色字体
+                    count_cell.font = Font(color="FFFFFF", bold=True)
 
-                    col_offset += 1
+                col_offset += 1
 
 
 def main():
@@ -273,6 +299,7 @@ def main():
     parser.add_argument("image_path", help="输入图片路径")
     parser.add_argument("--size", type=int, default=50, help="最大尺寸（保持宽高比）")
     parser.add_argument("--colors", type=int, help="限制颜色数量（K-means聚类）")
+    parser.add_argument("--compress", action="store_true", help="对角线统计表中重复的序列以引用代替")
 
     args = parser.parse_args()
 
@@ -284,7 +311,7 @@ def main():
             converter.reduce_colors(args.colors)
 
         converter.analyze_pixels()
-        converter.generate_excel()
+        converter.generate_excel(compress=args.compress)
 
         print("\n转换完成！Excel文件包含以下工作表：")
         print("- 像素图：颜色填充和对角线编号（右下角为0，向左上方递增）")
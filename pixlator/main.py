@@ -1,13 +1,45 @@
 import os
-from fastapi import FastAPI, HTTPException
+import json
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 from loguru import logger
 from pathlib import Path
 from pixlator.config import settings
-from pixlator.api.routes import router as api_router
+from pixlator.api.routes import router as api_router, request_profiler, file_manager, job_manager, prefetcher
+from pixlator.services.metrics import REQUEST_SECONDS, registry
+from pixlator.services.retention import RetentionScheduler
+from pixlator.services.warmup import preload, warm_up
+
+# 预热：导入应用时（gunicorn --preload 下即fork之前的主进程中）加载重依赖，worker启动时再跑一遍小图
+if settings.WARMUP_ON_STARTUP:
+    preload()
+
+# brotli-asgi为可选依赖，未安装时只使用gzip
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # pragma: no cover - 取决于运行环境
+    BrotliMiddleware = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：按需预热，启动定期清理，关闭时停止后台任务"""
+    if settings.WARMUP_ON_STARTUP:
+        await run_in_threadpool(warm_up)
+    retention = RetentionScheduler(file_manager)
+    retention.start()
+    try:
+        yield
+    finally:
+        await retention.stop()
+        job_manager.shutdown()
+        prefetcher.shutdown()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -15,7 +47,8 @@ app = FastAPI(
     description="图片像素化处理工具API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 配置CORS中间件
@@ -27,6 +60,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 响应压缩中间件：gzip不压缩图片、SSE等内容类型；brotli-asgi不区分内容类型，需显式开启
+if settings.BROTLI_ENABLED and BrotliMiddleware is not None:
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=settings.BROTLI_QUALITY,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_fallback=True
+    )
+else:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        compresslevel=settings.GZIP_LEVEL
+    )
+
+# 请求耗时统计中间件
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 使用路由模板而不是实际路径，避免标签基数随文件名增长
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
+
+# 请求性能剖析中间件（通过 PROFILING_ENABLED 开启）
+PROFILE_BODY_LIMIT = 64 * 1024
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if not settings.PROFILING_ENABLED or not request.url.path.startswith("/api/") or request.url.path.startswith("/api/diagnostics"):
+        return await call_next(request)
+    
+    # 记录请求参数，只保留较小的JSON请求体
+    request_info = {
+        "method": request.method,
+        "path": request.url.path,
+        "query": dict(request.query_params)
+    }
+    content_type = request.headers.get("content-type", "")
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_type.startswith("application/json") and 0 < content_length <= PROFILE_BODY_LIMIT:
+        try:
+            request_info["body"] = json.loads(await request.body())
+        except ValueError:
+            pass
+    
+    session = request_profiler.start()
+    if session is None:
+        return await call_next(request)
+    
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        request_info["status"] = status
+        request_profiler.finish(session, request_info)
+
 # 创建uploads目录
 uploads_dir = settings.UPLOAD_DIR
 os.makedirs(uploads_dir, exist_ok=True)
@@ -57,7 +159,8 @@ async def http_exception_handler(request, exc):
             "success": False,
             "error": exc.detail,
             "timestamp": datetime.now().isoformat()
-        }
+        },
+        headers=exc.headers
     )
 
 @app.exception_handler(Exception)
@@ -84,6 +187,11 @@ async def health_check():
         "version": settings.APP_VERSION
     }
 
+# 指标端点（Prometheus文本格式）
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 根端点
 @app.get("/")
 async def root():
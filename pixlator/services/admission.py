@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from loguru import logger
+
+from pixlator.config import settings
+from pixlator.services.cancellation import CancelToken
+from pixlator.services.metrics import ADMISSION_DECISIONS, ADMISSION_WAIT_SECONDS
+
+# 内存估算（字节），以峰值RSS与tracemalloc实测（2000x1500随机噪声图，最坏情况下几乎每个像素颜色都不同）：
+# - 解码原图（含转换为RGB时的副本）
+DECODE_BYTES_PER_SOURCE_PIXEL = 7
+# - /api/process 每个网格像素的字典结构、统计与返回副本：16色约900，不减色约1600
+PROCESS_BYTES_PER_PIXEL = 1536
+# - K-means的去重与浮点副本：分块网格减色时峰值增加约75
+QUANTIZE_BYTES_PER_PIXEL = 96
+# - 分块模式的缩放图、索引网格与去重临时数组：不减色时约86
+GRID_BYTES_PER_PIXEL = 96
+# - 多帧图片每帧每个网格像素（保存的索引帧、差异编码与汇总的颜色）：300px 40帧约11，小尺寸时固定开销占比更高
+ANIMATION_BYTES_PER_FRAME_PIXEL = 24
+
+# 排队等待时检查取消令牌的间隔（秒）
+WAIT_POLL_INTERVAL = 0.1
+
+
+class AdmissionRejected(Exception):
+    """内存预算不足且无法排队（队列已满或等待超时）"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_processing_cost(source_pixels: int, grid_pixels: int, color_count: Optional[int], decode: bool = True, bytes_per_pixel: int = PROCESS_BYTES_PER_PIXEL) -> int:
+    """估算一次处理的峰值内存（字节）；缩放图已缓存时不需要解码原图（decode=False）
+
+    分块模式只生成索引网格，bytes_per_pixel 传入 GRID_BYTES_PER_PIXEL。
+    """
+    cost = grid_pixels * bytes_per_pixel
+    if decode:
+        cost += source_pixels * DECODE_BYTES_PER_SOURCE_PIXEL
+    if color_count:
+        cost += grid_pixels * QUANTIZE_BYTES_PER_PIXEL
+    return cost
+
+
+def estimate_animation_cost(frame_pixels: int, grid_pixels: int, frames: int) -> int:
+    """估算多帧图片处理的峰值内存（字节）：同一时刻只解码一帧，所有帧的索引网格都保留到编码完成"""
+    return frame_pixels * DECODE_BYTES_PER_SOURCE_PIXEL + grid_pixels * frames * ANIMATION_BYTES_PER_FRAME_PIXEL
+
+
+class AdmissionController:
+    """按全局内存预算准入处理请求
+
+    每个请求按估算的内存占用申请预算，预算不足时按先来先服务排队；
+    队列已满或等待超时时抛出AdmissionRejected。单个请求的估算超过整个预算时按整个预算计算，
+    即只在没有其他请求运行时执行，而不是永远无法准入。budget_bytes为0时不做限制。
+    """
+
+    def __init__(self, budget_bytes: int = None, max_queue: int = None, retry_after: int = None):
+        self.budget_bytes = settings.ADMISSION_MEMORY_BUDGET_MB * 1024 * 1024 if budget_bytes is None else budget_bytes
+        self.max_queue = settings.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.retry_after = settings.ADMISSION_RETRY_AFTER if retry_after is None else retry_after
+        self._condition = threading.Condition()
+        self._in_use = 0
+        self._active = 0
+        self._queue: "deque[object]" = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes > 0
+
+    @contextmanager
+    def admit(self, cost: int, timeout: Optional[float] = None, cancel_token: Optional[CancelToken] = None) -> Iterator[None]:
+        """申请cost字节的预算，执行期间占用，结束后释放
+
+        timeout为None时一直排队等待（后台任务使用）；等待期间检查cancel_token。
+        """
+        if not self.enabled or cost <= 0:
+            yield
+            return
+        cost = min(cost, self.budget_bytes)
+        self._acquire(cost, timeout, cancel_token)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_use -= cost
+                self._active -= 1
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "in_use_bytes": self._in_use,
+                "active": self._active,
+                "queued": len(self._queue),
+            }
+
+    def _fits(self, cost: int) -> bool:
+        return self._in_use + cost <= self.budget_bytes
+
+    def _grant(self, cost: int) -> None:
+        self._in_use += cost
+        self._active += 1
+
+    def _acquire(self, cost: int, timeout: Optional[float], cancel_token: Optional[CancelToken]) -> None:
+        with self._condition:
+            if not self._queue and self._fits(cost):
+                self._grant(cost)
+                ADMISSION_DECISIONS.inc(outcome="admitted")
+                return
+            if len(self._queue) >= self.max_queue:
+                ADMISSION_DECISIONS.inc(outcome="rejected")
+                logger.warning(f"Rejected processing request: queue full ({len(self._queue)} waiting, {self._in_use // 2**20}MB of {self.budget_bytes // 2**20}MB in use)")
+                raise AdmissionRejected("Server is busy, too many processing requests queued", self.retry_after)
+
+            ticket = object()
+            self._queue.append(ticket)
+            ADMISSION_DECISIONS.inc(outcome="queued")
+            logger.info(f"Queued processing request needing {cost // 2**20}MB ({self._in_use // 2**20}MB of {self.budget_bytes // 2**20}MB in use, {len(self._queue)} waiting)")
+            start = time.monotonic()
+            deadline = None if timeout is None else start + timeout
+            try:
+                # 只有队首可以准入，避免大请求一直被后来的小请求插队
+                while not (self._queue[0] is ticket and self._fits(cost)):
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    wait = WAIT_POLL_INTERVAL
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            ADMISSION_DECISIONS.inc(outcome="rejected")
+                            logger.warning(f"Rejected processing request after waiting {timeout}s for {cost // 2**20}MB")
+                            raise AdmissionRejected(f"Server is busy, no memory available after waiting {timeout}s", self.retry_after)
+                        wait = min(wait, remaining)
+                    self._condition.wait(wait)
+                self._grant(cost)
+            finally:
+                self._queue.remove(ticket)
+                # 队首变化后唤醒其他等待方
+                self._condition.notify_all()
+                ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from PIL import Image, ImageSequence
+
+from pixlator.config import settings
+from pixlator.services.grid import index_dtype
+from pixlator.services.quantizer import ColorQuantizer, assign_colors, unique_colors
+
+# 帧的存储方式：完整关键帧、相对上一帧的差异、与上一帧相同
+KEYFRAME = 0
+DELTA = 1
+REPEAT = 2
+
+
+def frame_count(file_path: str) -> int:
+    with Image.open(file_path) as img:
+        return getattr(img, "n_frames", 1)
+
+
+def iter_frames(file_path: str, size: Tuple[int, int]) -> Iterator[Tuple[np.ndarray, int]]:
+    """逐帧解码并缩放到size，返回(RGB数组, 帧时长毫秒)，任意时刻只有一帧在内存中"""
+    with Image.open(file_path) as img:
+        for frame in ImageSequence.Iterator(img):
+            duration = int(frame.info.get("duration", 0) or 0)
+            yield np.asarray(frame.convert("RGB").resize(size, Image.NEAREST)), duration
+
+
+def pooled_colors(frames: Iterator[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """汇总所有帧的颜色及出现次数（按颜色去重，内存只与颜色数有关）"""
+    keys = np.empty(0, dtype=np.uint32)
+    counts = np.empty(0, dtype=np.int64)
+    for frame in frames:
+        colors, _, frame_counts = unique_colors(frame)
+        colors = colors.astype(np.uint32)
+        frame_keys = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+        keys, inverse = np.unique(np.concatenate((keys, frame_keys)), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate((counts, frame_counts)), minlength=len(keys)).astype(np.int64)
+    colors = np.stack([(keys >> 16) & 0xFF, (keys >> 8) & 0xFF, keys & 0xFF], axis=1)
+    return colors, counts
+
+
+def encode_frames(frames: List[np.ndarray], keyframe_interval: int = None, max_delta_ratio: float = None) -> Dict[str, np.ndarray]:
+    """按帧间差异压缩索引帧
+
+    与上一帧相同的帧只记录REPEAT；变化的像素不超过max_delta_ratio时只保存变化位置与新索引；
+    否则（以及每keyframe_interval帧）保存完整关键帧，限制解码某一帧时需要回放的差异数。
+    """
+    if keyframe_interval is None:
+        keyframe_interval = settings.ANIMATION_KEYFRAME_INTERVAL
+    if max_delta_ratio is None:
+        max_delta_ratio = settings.ANIMATION_DELTA_RATIO
+
+    kinds, keyframes, positions, values, offsets = [], [], [], [], [0]
+    previous = None
+    since_keyframe = 0
+    for frame in frames:
+        flat = frame.reshape(-1)
+        changed = None if previous is None else np.flatnonzero(flat != previous)
+        since_keyframe += 1
+        if changed is not None and len(changed) == 0:
+            kinds.append(REPEAT)
+        elif changed is not None and since_keyframe < keyframe_interval and len(changed) <= max_delta_ratio * flat.size:
+            kinds.append(DELTA)
+            positions.append(changed.astype(np.uint32))
+            values.append(flat[changed])
+            offsets.append(offsets[-1] + len(changed))
+        else:
+            kinds.append(KEYFRAME)
+            keyframes.append(frame)
+            since_keyframe = 0
+        previous = flat
+
+    dtype = frames[0].dtype
+    return {
+        "kinds": np.array(kinds, dtype=np.uint8),
+        "keyframes": np.stack(keyframes),
+        "delta_positions": np.concatenate(positions) if positions else np.empty(0, dtype=np.uint32),
+        "delta_values": np.concatenate(values) if values else np.empty(0, dtype=dtype),
+        "delta_offsets": np.array(offsets, dtype=np.int64),
+    }
+
+
+def decode_frame(encoded: Dict[str, np.ndarray], index: int) -> np.ndarray:
+    """还原第index帧：从之前最近的关键帧开始依次应用差异"""
+    kinds = np.asarray(encoded["kinds"])
+    start = int(np.flatnonzero(kinds[:index + 1] == KEYFRAME)[-1])
+    keyframes = encoded["keyframes"]
+    frame = np.array(keyframes[int((kinds[:start] == KEYFRAME).sum())])
+    flat = frame.reshape(-1)
+
+    offsets = encoded["delta_offsets"]
+    positions = encoded["delta_positions"]
+    values = encoded["delta_values"]
+    delta = int((kinds[:start] == DELTA).sum())
+    for kind in kinds[start + 1:index + 1]:
+        if kind == DELTA:
+            a, b = offsets[delta], offsets[delta + 1]
+            flat[positions[a:b]] = values[a:b]
+            delta += 1
+    return frame
+
+
+def quantize_animation(
+    file_path: str,
+    size: Tuple[int, int],
+    n_colors: Optional[int],
+    quantizer: ColorQuantizer,
+    workers: int = None,
+    progress: Optional[Callable[[float, Dict], None]] = None,
+) -> Tuple[List[np.ndarray], np.ndarray, List[int]]:
+    """把所有帧量化到同一个调色板，返回(各帧颜色索引网格, 调色板, 各帧时长)
+
+    第一遍逐帧汇总颜色并拟合共享调色板（n_colors为空时使用全部颜色），第二遍逐帧解码，
+    在线程池中并行为像素分配调色板颜色；同时在途的帧数有上限，内存不随帧数增长。
+    调色板按颜色在帧序列中（逐帧、逐行扫描）首次出现的顺序排列，与单帧结果的 color_index 规则一致。
+    """
+    colors, counts = pooled_colors(frame for frame, _ in iter_frames(file_path, size))
+    palette = quantizer.fit_palette(colors, counts, n_colors) if n_colors else colors.astype(int)
+    total = frame_count(file_path)
+
+    labels: List[np.ndarray] = []
+    durations: List[int] = []
+    workers = workers or settings.ANIMATION_WORKERS
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pixlator-frames") as executor:
+        pending = []
+
+        def collect(future):
+            labels.append(future.result().reshape(size[1], size[0]))
+            if progress is not None:
+                progress(len(labels) / total, {"frames_done": len(labels), "frames_total": total})
+
+        for frame, duration in iter_frames(file_path, size):
+            durations.append(duration)
+            pending.append(executor.submit(assign_colors, frame, palette))
+            if len(pending) >= workers * 2:
+                collect(pending.pop(0))
+        for future in pending:
+            collect(future)
+
+    # 按首次出现顺序重新编号，并去掉没有用到的颜色
+    seen: List[int] = []
+    used = np.zeros(len(palette), dtype=bool)
+    for frame in labels:
+        values, first = np.unique(frame.reshape(-1), return_index=True)
+        new = ~used[values]
+        seen.extend(values[new][np.argsort(first[new], kind="stable")].tolist())
+        used[values] = True
+    rank = np.zeros(len(palette), dtype=np.int64)
+    rank[seen] = np.arange(len(seen))
+    dtype = index_dtype(len(seen))
+    frames = [rank[frame].astype(dtype) for frame in labels]
+    palette = np.asarray(palette)[seen].astype(np.uint8)
+
+    logger.info(f"Quantized {len(frames)} frames to a shared palette of {len(palette)} colors")
+    return frames, palette, durations
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from loguru import logger
+
+from pixlator.utils.atomic import atomic_write
+
+# fcntl只在类Unix系统可用，其他系统只有进程内的锁
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 取决于运行环境
+    fcntl = None
+
+REFS_SUFFIX = ".refs"
+
+
+class BlobWriter:
+    """边写入边计算SHA-256的临时文件，由 BlobStore.commit 提交为内容寻址的blob"""
+
+    def __init__(self, directory: str, ext: str):
+        self.ext = ext
+        self.size = 0
+        self._digest = hashlib.sha256()
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=".upload.", suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._digest.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self) -> None:
+        """丢弃未提交的临时文件（已提交时无操作）"""
+        self.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    """按内容哈希去重的上传存储：<root>/<ab>/<sha256><ext>，引用计数保存在同名的 .refs 文件中
+
+    引用计数的修改在进程内的锁与 .lock 文件锁（fcntl）下进行，多个worker进程共享同一目录时也是安全的。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def writer(self, ext: str) -> BlobWriter:
+        os.makedirs(self.root, exist_ok=True)
+        return BlobWriter(self.root, ext)
+
+    def blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}{ext}")
+
+    def commit(self, writer: BlobWriter) -> Tuple[str, bool]:
+        """提交写入的内容并增加一次引用，返回(blob路径, 是否与已有内容重复)"""
+        writer.close()
+        blob_path = self.blob_path(writer.hexdigest, writer.ext)
+        with self._locked():
+            duplicate = os.path.exists(blob_path)
+            if duplicate:
+                writer.discard()
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(writer.temp_path, blob_path)
+            self._write_refs(blob_path, self._read_refs(blob_path) + 1)
+        return blob_path, duplicate
+
+    def incref(self, blob_path: str) -> int:
+        with self._locked():
+            count = self._read_refs(blob_path) + 1
+            self._write_refs(blob_path, count)
+        return count
+
+    def decref(self, blob_path: str) -> int:
+        """减少一次引用，引用归零时删除blob，返回剩余引用数
+
+        同一个引用不能释放两次：调用方需保证每条上传记录只调用一次（见 FileManager._release_upload）。
+        """
+        with self._locked():
+            count = max(self._read_refs(blob_path) - 1, 0)
+            if count == 0:
+                for path in (blob_path, blob_path + REFS_SUFFIX):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                logger.info(f"Deleted unreferenced blob: {os.path.basename(blob_path)}")
+            else:
+                self._write_refs(blob_path, count)
+        return count
+
+    def refcount(self, blob_path: str) -> int:
+        with self._locked():
+            return self._read_refs(blob_path)
+
+    def sweep_unreferenced(self, older_than: float) -> List[str]:
+        """删除没有引用且修改时间早于older_than的blob与临时文件（上传中断等遗留），返回删除的路径"""
+        removed = []
+        with self._locked():
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    if name.endswith(REFS_SUFFIX) or name == ".lock":
+                        continue
+                    try:
+                        if os.path.getmtime(path) >= older_than:
+                            continue
+                        if name.startswith(".upload.") or self._read_refs(path) <= 0:
+                            os.remove(path)
+                            if os.path.exists(path + REFS_SUFFIX):
+                                os.remove(path + REFS_SUFFIX)
+                            removed.append(path)
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_refs(blob_path: str) -> int:
+        try:
+            with open(blob_path + REFS_SUFFIX, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_refs(blob_path: str, count: int) -> None:
+        with atomic_write(blob_path + REFS_SUFFIX, "w", encoding="utf-8") as f:
+            f.write(str(count))
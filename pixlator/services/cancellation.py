@@ -0,0 +1,55 @@
+import threading
+from typing import Dict, Hashable, Optional
+
+
+class ProcessingCancelled(Exception):
+    """处理已被取消（客户端断开、被新请求取代或任务被取消）"""
+
+
+class CancelToken:
+    """协作式取消令牌：处理流程在阶段之间和循环内部调用check()"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def check(self) -> None:
+        """已取消时抛出ProcessingCancelled"""
+        if self._event.is_set():
+            raise ProcessingCancelled(self.reason)
+
+
+class LatestOnly:
+    """按键只保留最新的请求：同一个键开始新请求时取消上一个仍在运行的请求"""
+
+    def __init__(self):
+        self._tokens: Dict[Hashable, CancelToken] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key: Hashable, token: Optional[CancelToken] = None) -> CancelToken:
+        """登记键的最新请求（可传入已有令牌），并取消同一个键上一个仍在运行的请求
+
+        再次登记同一个令牌（加入进行中的相同计算）不会取消它自己。
+        """
+        if token is None:
+            token = CancelToken()
+        with self._lock:
+            previous = self._tokens.get(key)
+            self._tokens[key] = token
+        if previous is not None and previous is not token:
+            previous.cancel("superseded")
+        return token
+
+    def end(self, key: Hashable, token: CancelToken) -> None:
+        with self._lock:
+            if self._tokens.get(key) is token:
+                del self._tokens[key]
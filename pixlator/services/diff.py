@@ -0,0 +1,66 @@
+import base64
+from typing import Dict, Tuple
+
+import numpy as np
+
+from pixlator.services.grid import palette_hex
+from pixlator.services.quantizer import assign_colors
+
+
+def resample_indices(indices: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """按最近邻把索引网格缩放到shape（height, width），用于比较不同max_size的结果"""
+    height, width = indices.shape
+    ys = np.arange(shape[0]) * height // shape[0]
+    xs = np.arange(shape[1]) * width // shape[1]
+    return np.asarray(indices)[np.ix_(ys, xs)]
+
+
+def diff_grids(indices_a: np.ndarray, palette_a: np.ndarray, indices_b: np.ndarray, palette_b: np.ndarray) -> Dict:
+    """比较两个量化网格
+
+    b的调色板按最近颜色对齐到a的调色板后逐格比较；尺寸不同时b按最近邻缩放到a的尺寸。
+    变化的格子以按行展开、np.packbits打包（高位在前）的位图返回（base64编码），
+    颜色计数变化按a的调色板给出。
+    """
+    height, width = indices_a.shape
+    resampled = indices_b.shape != indices_a.shape
+    if resampled:
+        indices_b = resample_indices(indices_b, indices_a.shape)
+
+    # b的每个颜色对应a中最近的颜色
+    mapping = assign_colors(palette_b, palette_a)
+    aligned_b = mapping[np.asarray(indices_b)]
+    indices_a = np.asarray(indices_a)
+
+    changed = indices_a != aligned_b
+    counts_a = np.bincount(indices_a.reshape(-1), minlength=len(palette_a))
+    counts_b = np.bincount(aligned_b.reshape(-1), minlength=len(palette_a))
+    distances = np.sqrt(((palette_b.astype(np.int64) - palette_a[mapping].astype(np.int64)) ** 2).sum(axis=1))
+    hex_a = palette_hex(palette_a)
+
+    return {
+        "dimensions": {"width": width, "height": height},
+        "resampled": bool(resampled),
+        "changed": int(changed.sum()),
+        "total": int(changed.size),
+        "mask": base64.b64encode(np.packbits(changed.reshape(-1)).tobytes()).decode("ascii"),
+        "color_deltas": [
+            {
+                "color_index": index + 1,
+                "rgb": tuple(palette_a[index].tolist()),
+                "hex": hex_a[index],
+                "count_a": int(counts_a[index]),
+                "count_b": int(counts_b[index]),
+                "delta": int(counts_b[index]) - int(counts_a[index])
+            }
+            for index in range(len(palette_a))
+        ],
+        "palette_mapping": [
+            {
+                "color_index_b": index + 1,
+                "color_index_a": int(mapping[index]) + 1,
+                "distance": round(float(distances[index]), 2)
+            }
+            for index in range(len(palette_b))
+        ]
+    }
@@ -1,23 +1,62 @@
 import os
 import json
 import shutil
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageOps, features
+import numpy as np
 import uuid
 from loguru import logger
 
 from pixlator.config import settings
+from pixlator.services.blobs import BlobStore, BlobWriter
+from pixlator.services.metrics import FILE_IO_SECONDS, timed
+from pixlator.services.storage import RELEASING_RECORD, UPLOAD_RECORD, ShardedStorage, is_upload
+from pixlator.utils import serialization
+from pixlator.utils.atomic import atomic_write
+
+# 缩略图格式：格式名 -> (PIL格式, 媒体类型, 扩展名)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+}
 
 class FileManager:
     """文件管理服务"""
     
-    def __init__(self):
+    def __init__(self, prefetcher=None):
         self.upload_dir = settings.get_upload_path()
+        # 可选的上传后预热服务（见 services/prefetch.py）
+        self.prefetcher = prefetcher
+        # 文件内容哈希缓存：路径 -> ((mtime_ns, size), etag)
+        self._etags: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._etag_lock = threading.Lock()
+        self._thumbnail_lock = threading.Lock()
+        self._grid_lock = threading.RLock()
+        self._storage: Optional[ShardedStorage] = None
+        self._blobs: Optional[BlobStore] = None
         settings.ensure_upload_dir()
         logger.info(f"FileManager initialized with upload directory: {self.upload_dir}")
     
+    @property
+    def storage(self) -> ShardedStorage:
+        """上传目录的分片存储布局（upload_dir可以在初始化后修改）"""
+        if self._storage is None or self._storage.root != self.upload_dir:
+            self._storage = ShardedStorage(self.upload_dir)
+        return self._storage
+    
+    @property
+    def blobs(self) -> BlobStore:
+        """按内容去重的原图存储"""
+        if self._blobs is None or self._blobs.root != self.storage.blob_root:
+            self._blobs = BlobStore(self.storage.blob_root)
+        return self._blobs
+    
     def generate_filename(self, original_filename: str) -> str:
         """生成安全的文件名"""
         # 获取文件扩展名
@@ -36,75 +75,147 @@ class FileManager:
         
         return new_filename
     
-    def save_uploaded_file(self, file_content: bytes, original_filename: str) -> Dict:
-        """保存上传的文件"""
+    def open_upload(self, original_filename: str) -> BlobWriter:
+        """开始接收上传：返回边写入边计算SHA-256的写入器，写完后调用 commit_upload"""
+        ext = Path(original_filename).suffix.lower()
+        if ext not in settings.ALLOWED_EXTENSIONS:
+            raise ValueError(f"Unsupported file extension: {ext}")
+        return self.blobs.writer(ext)
+    
+    @timed(FILE_IO_SECONDS, operation="save_upload")
+    def commit_upload(self, writer: BlobWriter, original_filename: str, prefetch: bool = True) -> Dict:
+        """提交上传：内容相同的上传共享同一个blob（引用计数），上传目录中只保存指向blob的记录"""
         try:
             # 生成安全的文件名
             filename = self.generate_filename(original_filename)
-            file_path = os.path.join(self.upload_dir, filename)
+            blob_path, duplicate = self.blobs.commit(writer)
             
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                f.write(file_content)
+            try:
+                # 获取图片尺寸
+                with Image.open(blob_path) as img:
+                    width, height = img.size
+                
+                record = {
+                    "filename": filename,
+                    "original_filename": original_filename,
+                    "blob": os.path.relpath(blob_path, self.upload_dir),
+                    "sha256": writer.hexdigest,
+                    "file_size": writer.size,
+                    "dimensions": {"width": width, "height": height},
+                    "upload_time": datetime.now().isoformat()
+                }
+                record_path = self.storage.record_path(filename)
+                os.makedirs(os.path.dirname(record_path), exist_ok=True)
+                with atomic_write(record_path, 'w', encoding='utf-8') as f:
+                    json.dump(record, f, ensure_ascii=False)
+            except Exception:
+                self.blobs.decref(blob_path)
+                raise
             
-            # 获取文件信息
-            file_size = len(file_content)
+            logger.info(
+                f"File saved: {filename} ({writer.size} bytes, {width}x{height}, "
+                f"{'deduplicated' if duplicate else 'new'} blob {writer.hexdigest[:12]})"
+            )
             
-            # 获取图片尺寸
-            with Image.open(file_path) as img:
-                width, height = img.size
+            # 重复内容的缩放图与结果缓存已经按内容预热过
+            if prefetch and not duplicate and self.prefetcher is not None:
+                self.prefetcher.schedule(blob_path, {"width": width, "height": height})
             
-            logger.info(f"File saved: {filename} ({file_size} bytes, {width}x{height})")
-            
-            return {
-                "filename": filename,
-                "original_filename": original_filename,
-                "file_path": file_path,
-                "file_size": file_size,
-                "dimensions": {"width": width, "height": height},
-                "upload_time": datetime.now().isoformat()
-            }
+            return {**record, "file_path": blob_path, "deduplicated": duplicate}
             
         except Exception as e:
             logger.error(f"Error saving file {original_filename}: {e}")
             raise
+        finally:
+            writer.discard()
+    
+    def save_uploaded_file(self, file_content: bytes, original_filename: str, prefetch: bool = True) -> Dict:
+        """保存上传的文件，prefetch为True时在后台预热缩放图与默认参数结果"""
+        writer = self.open_upload(original_filename)
+        try:
+            writer.write(file_content)
+        except Exception:
+            writer.discard()
+            raise
+        return self.commit_upload(writer, original_filename, prefetch=prefetch)
+    
+    def _load_record(self, filename: str) -> Optional[Dict]:
+        """上传记录，旧布局（原图直接位于上传目录）或不存在时返回None"""
+        try:
+            with open(self.storage.record_path(filename), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    def _release_upload(self, upload_dir: str) -> bool:
+        """释放上传目录记录的blob引用，每条记录只释放一次，返回本次调用是否执行了释放
+
+        先把记录原子地重命名为 RELEASING_RECORD，只有重命名成功的一方减少引用：
+        多个worker同时清理同一目录、删除与清理并发或清理中途崩溃后重跑时都不会重复释放。
+        重命名后、释放前崩溃只会让blob多保留一个引用，不会误删仍被其他上传使用的blob。
+        """
+        record_path = os.path.join(upload_dir, UPLOAD_RECORD)
+        releasing_path = os.path.join(upload_dir, RELEASING_RECORD)
+        try:
+            os.replace(record_path, releasing_path)
+        except FileNotFoundError:
+            return False
+        try:
+            with open(releasing_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except ValueError:
+            logger.warning(f"Invalid upload record in {upload_dir}, blob reference not released")
+            return False
+        self.blobs.decref(os.path.join(self.upload_dir, record["blob"]))
+        os.remove(releasing_path)
+        return True
     
+    def _artifact_path(self, filename: str, suffix: str) -> str:
+        """上传文件的衍生文件路径（处理结果、量化网格等），与原图位于同一目录"""
+        return self.storage.artifact_path(filename, suffix)
+    
+    @timed(FILE_IO_SECONDS, operation="save_result")
     def save_processing_result(self, filename: str, result_data: Dict) -> str:
-        """保存处理结果到JSON文件"""
+        """保存处理结果到JSON文件（原子替换，读取方不会读到写了一半的文件），返回所写内容的ETag"""
         try:
             # 生成JSON文件名
-            json_filename = f"{Path(filename).stem}.json"
-            json_path = os.path.join(self.upload_dir, json_filename)
+            json_path = self._artifact_path(filename, ".json")
+            json_filename = os.path.basename(json_path)
+            os.makedirs(os.path.dirname(json_path), exist_ok=True)
             
-            # 添加元数据
-            result_data["metadata"] = {
+            # 添加元数据（不修改传入的结果）
+            metadata = {
                 "saved_time": datetime.now().isoformat(),
                 "original_filename": filename
             }
             
-            # 保存JSON文件
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(result_data, f, indent=2, ensure_ascii=False)
+            # 保存JSON文件，写入时顺便计算内容哈希作为ETag
+            content = serialization.dumps({**result_data, "metadata": metadata}, indent=settings.RESULT_JSON_INDENT)
+            with atomic_write(json_path, 'wb') as f:
+                f.write(content)
+            etag = f'"{hashlib.sha1(content).hexdigest()}"'
+            self._remember_etag(json_path, etag)
             
             logger.info(f"Processing result saved: {json_filename}")
-            return json_path
+            return etag
             
         except Exception as e:
             logger.error(f"Error saving processing result for {filename}: {e}")
             raise
     
+    @timed(FILE_IO_SECONDS, operation="load_result")
     def load_processing_result(self, filename: str) -> Optional[Dict]:
         """从JSON文件加载处理结果"""
         try:
-            json_filename = f"{Path(filename).stem}.json"
-            json_path = os.path.join(self.upload_dir, json_filename)
+            json_path = self._artifact_path(filename, ".json")
+            json_filename = os.path.basename(json_path)
             
             if not os.path.exists(json_path):
                 logger.warning(f"Processing result not found: {json_filename}")
                 return None
             
-            with open(json_path, 'r', encoding='utf-8') as f:
-                result_data = json.load(f)
+            with open(json_path, 'rb') as f:
+                result_data = serialization.loads(f.read())
             
             logger.info(f"Processing result loaded: {json_filename}")
             return result_data
@@ -113,36 +224,301 @@ class FileManager:
             logger.error(f"Error loading processing result for {filename}: {e}")
             return None
     
+    def get_result_path(self, filename: str) -> Optional[str]:
+        """处理结果JSON文件的路径，结果不存在时返回None"""
+        json_path = self._artifact_path(filename, ".json")
+        return json_path if os.path.exists(json_path) else None
+    
+    def get_result_etag(self, filename: str) -> Optional[str]:
+        """处理结果的内容哈希ETag，结果不存在时返回None"""
+        return self.get_content_etag(self._artifact_path(filename, ".json"))
+    
+    def _remember_etag(self, path: str, etag: str) -> None:
+        """记录刚写入文件的ETag，避免之后重新读取整个文件计算哈希"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._etag_lock:
+            self._etags[path] = ((stat.st_mtime_ns, stat.st_size), etag)
+    
+    def get_content_etag(self, path: str) -> Optional[str]:
+        """文件内容的强ETag（SHA-1），按修改时间和大小缓存，文件不存在时返回None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        
+        with self._etag_lock:
+            cached = self._etags.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()}"'
+        
+        with self._etag_lock:
+            self._etags[path] = (version, etag)
+        return etag
+    
+    def _thumbnail_path(self, filename: str, size: int, ext: str) -> str:
+        return self.storage.thumbnail_path(filename, size, ext)
+    
+    @timed(FILE_IO_SECONDS, operation="thumbnail")
+    def get_thumbnail(self, filename: str, size: int, image_format: str = None) -> Optional[Tuple[str, str]]:
+        """获取（必要时生成）缩略图，返回(路径, 媒体类型)，原图不存在时返回None
+
+        缩略图在首次请求时生成并缓存到上传目录下的 THUMBNAIL_DIR，原图更新后重新生成。
+        """
+        source_path = self.get_file_path(filename)
+        if not source_path:
+            return None
+        
+        image_format = (image_format or settings.THUMBNAIL_FORMAT).lower()
+        if image_format not in THUMBNAIL_FORMATS or (image_format == "webp" and not features.check("webp")):
+            image_format = "jpeg"
+        pil_format, media_type, ext = THUMBNAIL_FORMATS[image_format]
+        thumbnail_path = self._thumbnail_path(filename, size, ext)
+        
+        with self._thumbnail_lock:
+            if not os.path.exists(thumbnail_path) or os.path.getmtime(thumbnail_path) < os.path.getmtime(source_path):
+                os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                with Image.open(source_path) as img:
+                    # JPEG可以在解码时直接缩小，避免解码完整尺寸
+                    img.draft("RGB", (size, size))
+                    thumbnail = ImageOps.exif_transpose(img).convert("RGB")
+                thumbnail.thumbnail((size, size))
+                with atomic_write(thumbnail_path, 'wb') as f:
+                    thumbnail.save(f, pil_format, quality=settings.THUMBNAIL_QUALITY)
+                logger.info(f"Thumbnail generated: {os.path.basename(thumbnail_path)} ({thumbnail.width}x{thumbnail.height})")
+        
+        return thumbnail_path, media_type
+    
+    def get_result_version(self, filename: str) -> Optional[str]:
+        """处理结果的版本标识（修改时间 + 大小），结果不存在时返回None"""
+        json_path = self._artifact_path(filename, ".json")
+        try:
+            stat = os.stat(json_path)
+        except OSError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    
+    @timed(FILE_IO_SECONDS, operation="save_grid")
+    def save_grid(self, filename: str, indices: np.ndarray, grid_info: Dict) -> str:
+        """保存量化网格：颜色索引数组（.npy）与网格信息（调色板、尺寸、参数）"""
+        try:
+            grid_path = self._artifact_path(filename, "_grid.npy")
+            info_path = self._artifact_path(filename, "_grid.json")
+            os.makedirs(os.path.dirname(grid_path), exist_ok=True)
+            
+            grid_info = dict(grid_info)
+            grid_info["saved_time"] = datetime.now().isoformat()
+            with self._grid_lock:
+                with atomic_write(grid_path, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(indices))
+                self._write_grid_info(info_path, grid_info)
+            
+            logger.info(f"Index grid saved: {os.path.basename(grid_path)} ({indices.shape[1]}x{indices.shape[0]})")
+            return grid_path
+            
+        except Exception as e:
+            logger.error(f"Error saving index grid for {filename}: {e}")
+            raise
+    
+    @timed(FILE_IO_SECONDS, operation="load_grid")
+    def load_grid(self, filename: str) -> Optional[Tuple[np.ndarray, Dict]]:
+        """以内存映射方式加载量化网格，只有实际访问的部分会被读入内存"""
+        try:
+            grid_path = self._artifact_path(filename, "_grid.npy")
+            info_path = self._artifact_path(filename, "_grid.json")
+            
+            if not os.path.exists(grid_path) or not os.path.exists(info_path):
+                logger.warning(f"Index grid not found: {os.path.basename(grid_path)}")
+                return None
+            
+            indices = np.load(grid_path, mmap_mode="r")
+            with open(info_path, 'r', encoding='utf-8') as f:
+                grid_info = json.load(f)
+            
+            return indices, grid_info
+            
+        except Exception as e:
+            logger.error(f"Error loading index grid for {filename}: {e}")
+            return None
+    
+    @timed(FILE_IO_SECONDS, operation="save_frames")
+    def save_frames(self, filename: str, encoded: Dict[str, np.ndarray], frames_info: Dict) -> str:
+        """保存多帧结果：差异压缩后的帧数组（.npz）与帧信息（调色板、时长、尺寸、参数）"""
+        try:
+            frames_path = self._artifact_path(filename, "_frames.npz")
+            info_path = self._artifact_path(filename, "_frames.json")
+            os.makedirs(os.path.dirname(frames_path), exist_ok=True)
+            
+            with atomic_write(frames_path, 'wb') as f:
+                np.savez_compressed(f, **encoded)
+            
+            frames_info = dict(frames_info)
+            frames_info["saved_time"] = datetime.now().isoformat()
+            with atomic_write(info_path, 'w', encoding='utf-8') as f:
+                json.dump(frames_info, f, ensure_ascii=False)
+            
+            logger.info(f"Frames saved: {os.path.basename(frames_path)} ({frames_info['frame_count']} frames, {os.path.getsize(frames_path)} bytes)")
+            return frames_path
+            
+        except Exception as e:
+            logger.error(f"Error saving frames for {filename}: {e}")
+            raise
+    
+    @timed(FILE_IO_SECONDS, operation="load_frames")
+    def load_frames(self, filename: str) -> Optional[Tuple[Dict[str, np.ndarray], Dict]]:
+        """加载多帧结果，返回(帧数组, 帧信息)，不存在时返回None"""
+        try:
+            frames_path = self._artifact_path(filename, "_frames.npz")
+            info_path = self._artifact_path(filename, "_frames.json")
+            
+            if not os.path.exists(frames_path) or not os.path.exists(info_path):
+                logger.warning(f"Frames not found: {os.path.basename(frames_path)}")
+                return None
+            
+            with np.load(frames_path) as archive:
+                encoded = {name: archive[name] for name in archive.files}
+            with open(info_path, 'r', encoding='utf-8') as f:
+                frames_info = json.load(f)
+            
+            return encoded, frames_info
+            
+        except Exception as e:
+            logger.error(f"Error loading frames for {filename}: {e}")
+            return None
+    
+    def _write_grid_info(self, info_path: str, grid_info: Dict) -> None:
+        with atomic_write(info_path, 'w', encoding='utf-8') as f:
+            json.dump(grid_info, f, ensure_ascii=False)
+    
+    @contextmanager
+    def edit_grid(self, filename: str) -> Iterator[Optional[Tuple[np.ndarray, Dict]]]:
+        """以读写内存映射打开量化网格进行就地修改，网格不存在时得到None
+
+        退出时把修改刷回磁盘并保存网格信息，同时标记保存的处理结果需要重新生成（见 refresh_edited_result）。
+        """
+        grid_path = self._artifact_path(filename, "_grid.npy")
+        info_path = self._artifact_path(filename, "_grid.json")
+        with self._grid_lock:
+            if not os.path.exists(grid_path) or not os.path.exists(info_path):
+                yield None
+                return
+            
+            indices = np.load(grid_path, mmap_mode="r+")
+            with open(info_path, 'r', encoding='utf-8') as f:
+                grid_info = json.load(f)
+            
+            yield indices, grid_info
+            
+            indices.flush()
+            grid_info["dirty"] = True
+            grid_info["edited_time"] = datetime.now().isoformat()
+            self._write_grid_info(info_path, grid_info)
+    
+    def has_saved_result(self, filename: str, params: Dict) -> bool:
+        """保存的处理结果是否就是按params生成且未经像素编辑的结果（只读取很小的网格信息文件）
+
+        网格信息中的 result_saved 由 /api/process 保存结果时写入；分块处理只保存网格，
+        像素编辑会记录 edited_time，这两种情况都需要重新保存。
+        """
+        if self.get_result_path(filename) is None:
+            return False
+        try:
+            with open(self._artifact_path(filename, "_grid.json"), 'r', encoding='utf-8') as f:
+                grid_info = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        return (
+            grid_info.get("result_saved", False)
+            and "edited_time" not in grid_info
+            and grid_info.get("processing_params") == params
+        )
+    
+    def refresh_edited_result(self, filename: str, build: Callable[[np.ndarray, Dict], Dict]) -> bool:
+        """网格在上次保存处理结果后被编辑过时，用 build(indices, grid_info) 重新生成并保存处理结果
+
+        只在读取结果时才重新生成，连续多次编辑只需要生成一次；只有分块结果（没有保存处理结果）
+        时不生成。返回是否重新生成。
+        """
+        info_path = self._artifact_path(filename, "_grid.json")
+        if self.get_result_path(filename) is None:
+            return False
+        with self._grid_lock:
+            try:
+                with open(info_path, 'r', encoding='utf-8') as f:
+                    grid_info = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return False
+            if not grid_info.get("dirty"):
+                return False
+            
+            grid = self.load_grid(filename)
+            if grid is None:
+                return False
+            self.save_processing_result(filename, build(*grid))
+            grid_info["dirty"] = False
+            self._write_grid_info(info_path, grid_info)
+        
+        logger.info(f"Processing result regenerated from edited grid: {filename}")
+        return True
+    
+    @timed(FILE_IO_SECONDS, operation="scan_history")
     def get_history_list(self) -> List[Dict]:
         """扫描目录获取历史记录列表"""
         try:
             history = []
             
-            # 扫描uploads目录
-            for file_path in Path(self.upload_dir).glob("*"):
-                if file_path.is_file() and file_path.suffix.lower() in settings.ALLOWED_EXTENSIONS:
-                    # 获取文件信息
-                    stat = file_path.stat()
-                    
-                    # 获取图片尺寸
+            # 扫描各上传目录
+            for upload_dir in self.storage.iter_upload_dirs():
+                with os.scandir(upload_dir) as entries:
+                    names = {entry.name: entry for entry in entries if entry.is_file()}
+                
+                record = None
+                if UPLOAD_RECORD in names:
                     try:
-                        with Image.open(file_path) as img:
-                            width, height = img.size
-                    except Exception:
-                        width, height = 0, 0
-                    
-                    # 检查是否有对应的JSON文件
-                    json_path = file_path.with_suffix('.json')
-                    has_processing_result = json_path.exists()
-                    
+                        with open(names[UPLOAD_RECORD].path, 'r', encoding='utf-8') as f:
+                            record = json.load(f)
+                    except ValueError:
+                        pass
+                
+                if record is not None:
+                    # 上传记录中已有尺寸等信息，无需打开图片
+                    items = [(record["filename"], record["original_filename"], record["upload_time"],
+                              record["file_size"], record["dimensions"])]
+                else:
+                    # 旧布局：原图直接位于上传目录
+                    items = []
+                    for entry in names.values():
+                        if not is_upload(entry.name):
+                            continue
+                        stat = entry.stat()
+                        try:
+                            with Image.open(entry.path) as img:
+                                width, height = img.size
+                        except Exception:
+                            width, height = 0, 0
+                        items.append((entry.name, entry.name, datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                                      stat.st_size, {"width": width, "height": height}))
+                
+                for filename, original_filename, upload_time, file_size, dimensions in items:
                     history.append({
-                        "filename": file_path.name,
-                        "original_filename": file_path.name,  # 这里可以改进，从JSON中读取原始文件名
-                        "upload_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                        "file_size": stat.st_size,
-                        "dimensions": {"width": width, "height": height},
-                        "preview_url": f"/api/preview/{file_path.name}",
-                        "has_processing_result": has_processing_result
+                        "filename": filename,
+                        "original_filename": original_filename,
+                        "upload_time": upload_time,
+                        "file_size": file_size,
+                        "dimensions": dimensions,
+                        "preview_url": f"/api/preview/{filename}",
+                        "thumbnail_url": f"/api/thumbnails/{filename}?size={settings.THUMBNAIL_SIZES[0]}",
+                        # 检查是否有对应的JSON文件
+                        "has_processing_result": f"{Path(filename).stem}.json" in names
                     })
             
             # 按上传时间排序（最新的在前）
@@ -155,22 +531,20 @@ class FileManager:
             logger.error(f"Error scanning history: {e}")
             return []
     
+    @timed(FILE_IO_SECONDS, operation="delete")
     def delete_file(self, filename: str) -> bool:
-        """删除文件及其相关文件"""
+        """删除文件及其相关文件（整个上传目录：结果、量化网格、导出与缩略图），并释放原图blob的引用"""
         try:
-            file_path = os.path.join(self.upload_dir, filename)
-            json_path = os.path.join(self.upload_dir, f"{Path(filename).stem}.json")
-            
-            # 删除主文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            upload_dir = self.storage.upload_dir(filename)
+            if os.path.isdir(upload_dir):
+                self._release_upload(upload_dir)
+                try:
+                    shutil.rmtree(upload_dir)
+                except FileNotFoundError:
+                    # 清理同时删除了该上传
+                    pass
                 logger.info(f"Deleted file: {filename}")
             
-            # 删除JSON文件
-            if os.path.exists(json_path):
-                os.remove(json_path)
-                logger.info(f"Deleted JSON file: {Path(filename).stem}.json")
-            
             return True
             
         except Exception as e:
@@ -178,36 +552,132 @@ class FileManager:
             return False
     
     def get_file_path(self, filename: str) -> Optional[str]:
-        """获取文件的完整路径"""
-        file_path = os.path.join(self.upload_dir, filename)
+        """获取原图的完整路径（内容相同的上传返回同一个blob，处理缓存因此按内容命中）"""
+        record = self._load_record(filename)
+        if record is not None:
+            blob_path = os.path.join(self.upload_dir, record["blob"])
+            return blob_path if os.path.exists(blob_path) else None
+        
+        file_path = self.storage.upload_path(filename)
         if os.path.exists(file_path):
             return file_path
         return None
     
-    def cleanup_old_files(self, days: int = None) -> int:
-        """清理旧文件"""
+    def get_export_dir(self, filename: str) -> str:
+        """上传对应的导出目录（即上传所在目录）"""
+        return self.storage.upload_dir(filename)
+    
+    def get_export_path(self, export_filename: str) -> Optional[str]:
+        """导出文件的完整路径，不存在时返回None"""
+        export_path = self.storage.export_path(export_filename)
+        if os.path.exists(export_path):
+            return export_path
+        return None
+    
+    def _scan_groups(self) -> List[Dict]:
+        """按上传分组扫描存储，返回每组的文件、总大小与最近使用时间
+
+        每个上传目录为一组；根目录下无法归属的文件（旧导出、临时文件）各自成组。
+        原图blob的大小按引用数平摊到引用它的各组，访问时间计入各组的最近使用时间。
+        """
+        groups = []
+        
+        def make_group(name: str, entries: List[os.DirEntry], directory: Optional[str] = None) -> Dict:
+            group = {"group": name, "paths": [], "size": 0, "last_used": 0.0, "directory": directory}
+            for entry in entries:
+                stat = entry.stat()
+                group["paths"].append(entry.path)
+                group["size"] += stat.st_size
+                # 挂载选项为relatime时访问时间仍会更新，可以近似反映最近使用
+                group["last_used"] = max(group["last_used"], stat.st_mtime, stat.st_atime)
+            return group
+        
+        for upload_dir in self.storage.iter_upload_dirs():
+            group = make_group(os.path.basename(upload_dir), self.storage.list_files(upload_dir), upload_dir)
+            try:
+                with open(os.path.join(upload_dir, UPLOAD_RECORD), 'r', encoding='utf-8') as f:
+                    blob_path = os.path.join(self.upload_dir, json.load(f)["blob"])
+                stat = os.stat(blob_path)
+                group["size"] += stat.st_size // max(self.blobs.refcount(blob_path), 1)
+                group["last_used"] = max(group["last_used"], stat.st_atime)
+            except (OSError, ValueError, KeyError):
+                pass
+            groups.append(group)
+        
+        with os.scandir(self.upload_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    groups.append(make_group(entry.name, [entry]))
+        
+        return groups
+    
+    def _delete_groups(self, groups: List[Dict], batch_size: int, pause: float) -> int:
+        """分批删除文件组（同一上传的原图、结果、网格、导出与缩略图一起删除），返回删除的文件数"""
+        deleted = 0
+        in_batch = 0
+        for group in groups:
+            if group["directory"]:
+                self._release_upload(group["directory"])
+            for path in group["paths"]:
+                try:
+                    os.remove(path)
+                    deleted += 1
+                    in_batch += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Error deleting old file {os.path.basename(path)}: {e}")
+                
+                # 每批之间暂停，限制清理对磁盘I/O的占用
+                if in_batch >= batch_size:
+                    in_batch = 0
+                    if pause > 0:
+                        time.sleep(pause)
+            if group["directory"]:
+                shutil.rmtree(group["directory"], ignore_errors=True)
+            logger.info(f"Cleaned up {group['group']} ({len(group['paths'])} files, {group['size']} bytes)")
+        return deleted
+    
+    @timed(FILE_IO_SECONDS, operation="cleanup")
+    def cleanup_old_files(self, days: int = None, quota_bytes: int = None, batch_size: int = None, pause: float = None) -> int:
+        """清理旧文件，返回删除的文件数
+
+        超过保留天数未使用的上传连同其衍生文件一起删除；设置了磁盘配额时，
+        再按最近使用时间从旧到新淘汰，直到总大小不超过配额。原图blob在最后一个引用删除时删除，
+        中断的上传等遗留的无引用blob也在保留期过后删除。
+        """
         if days is None:
             days = settings.FILE_RETENTION_DAYS
+        if quota_bytes is None:
+            quota_bytes = settings.DISK_QUOTA_MB * 1024 * 1024
+        if batch_size is None:
+            batch_size = settings.CLEANUP_BATCH_SIZE
+        if pause is None:
+            pause = settings.CLEANUP_BATCH_PAUSE
         
         try:
             cutoff_time = datetime.now().timestamp() - (days * 24 * 60 * 60)
-            deleted_count = 0
+            groups = sorted(self._scan_groups(), key=lambda group: group["last_used"])
             
-            for file_path in Path(self.upload_dir).glob("*"):
-                if file_path.is_file():
-                    if file_path.stat().st_mtime < cutoff_time:
-                        try:
-                            file_path.unlink()
-                            deleted_count += 1
-                            logger.info(f"Cleaned up old file: {file_path.name}")
-                        except Exception as e:
-                            logger.error(f"Error deleting old file {file_path.name}: {e}")
+            expired = [group for group in groups if group["last_used"] < cutoff_time]
+            remaining = groups[len(expired):]
+            
+            # 磁盘配额：按最近使用时间淘汰（LRU）
+            if quota_bytes > 0:
+                total = sum(group["size"] for group in remaining)
+                evicted = 0
+                while evicted < len(remaining) and total > quota_bytes:
+                    total -= remaining[evicted]["size"]
+                    evicted += 1
+                if evicted:
+                    logger.info(f"Disk quota exceeded, evicting {evicted} least recently used uploads")
+                expired += remaining[:evicted]
             
+            deleted_count = self._delete_groups(expired, batch_size, pause)
+            deleted_count += len(self.blobs.sweep_unreferenced(cutoff_time))
             logger.info(f"Cleanup completed: {deleted_count} files deleted")
             return deleted_count
             
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
             return 0
-
- 
\ No newline at end of file
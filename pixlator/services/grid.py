@@ -0,0 +1,176 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 编号方式（与 image_processor.NumberingMode 一致）
+DIAGONAL_MODES = ("diagonal_bottom_left", "diagonal_bottom_right")
+
+
+def build_index_grid(img_array: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """将RGB像素数组转换为颜色索引网格与调色板
+
+    调色板按颜色在图片中（逐行扫描）首次出现的顺序排列，与 analyze_number_sequences
+    的 color_to_index 一致：网格中的索引 i 对应 color_index = i + 1。
+    """
+    h, w, _ = img_array.shape
+    flat = img_array.reshape(-1, 3).astype(np.uint32)
+    packed = (flat[:, 0] << 16) | (flat[:, 1] << 8) | flat[:, 2]
+    keys, first_index, inverse = np.unique(packed, return_index=True, return_inverse=True)
+
+    # 按首次出现位置重新编号
+    order = np.argsort(first_index, kind="stable")
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[order] = np.arange(len(keys))
+
+    dtype = index_dtype(len(keys))
+    indices = rank[inverse.reshape(-1)].astype(dtype).reshape(h, w)
+    ordered = keys[order]
+    palette = np.stack([(ordered >> 16) & 0xFF, (ordered >> 8) & 0xFF, ordered & 0xFF], axis=1).astype(np.uint8)
+    return indices, palette
+
+
+def index_dtype(n_colors: int) -> np.dtype:
+    """能容纳n_colors个颜色索引的最小整数类型"""
+    if n_colors <= np.iinfo(np.uint8).max + 1:
+        return np.dtype(np.uint8)
+    if n_colors <= np.iinfo(np.uint16).max + 1:
+        return np.dtype(np.uint16)
+    return np.dtype(np.uint32)
+
+
+def palette_hex(palette: np.ndarray) -> List[str]:
+    """调色板的十六进制颜色列表"""
+    return [f"#{r:02X}{g:02X}{b:02X}" for r, g, b in palette.tolist()]
+
+
+def max_number(mode: str, width: int, height: int) -> int:
+    """编号数量：对角线方式为 width + height - 1，行方式为行数"""
+    if mode in DIAGONAL_MODES:
+        return width + height - 1
+    return height
+
+
+def number_of(xs: np.ndarray, ys: np.ndarray, mode: str, width: int, height: int) -> np.ndarray:
+    """向量化计算像素编号，规则与 PixelArtConverter._calculate_number 相同"""
+    if mode == "top_to_bottom":
+        return ys + 1
+    if mode == "bottom_to_top":
+        return height - ys
+    if mode == "diagonal_bottom_left":
+        return (height - 1 - ys) + xs + 1
+    return (width - 1 - xs) + (height - 1 - ys) + 1
+
+
+def line_coords(number: int, mode: str, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """返回某个编号上所有像素的 (ys, xs)，按奇数编号从右往左、偶数编号从左往右排列"""
+    if mode == "top_to_bottom":
+        xs = np.arange(width)
+        ys = np.full(width, number - 1)
+    elif mode == "bottom_to_top":
+        xs = np.arange(width)
+        ys = np.full(width, height - number)
+    elif mode == "diagonal_bottom_left":
+        xs = np.arange(max(0, number - height), min(width - 1, number - 1) + 1)
+        ys = height - number + xs
+    else:
+        diagonal = width + height - 1 - number
+        xs = np.arange(max(0, diagonal - height + 1), min(width - 1, diagonal) + 1)
+        ys = diagonal - xs
+
+    if number % 2 == 1:
+        xs, ys = xs[::-1], ys[::-1]
+    return ys, xs
+
+
+def run_lengths(values: np.ndarray) -> List[Tuple[int, int]]:
+    """统计连续相同值的块，返回 [(color_index, count), ...]（color_index 从1开始）"""
+    if len(values) == 0:
+        return []
+    starts = np.flatnonzero(np.diff(values)) + 1
+    starts = np.concatenate(([0], starts))
+    counts = np.diff(np.concatenate((starts, [len(values)])))
+    return list(zip((values[starts].astype(np.int64) + 1).tolist(), counts.tolist()))
+
+
+def line_sequence(indices: np.ndarray, number: int, mode: str) -> List[Tuple[int, int]]:
+    """某个编号的连续颜色块序列"""
+    height, width = indices.shape
+    ys, xs = line_coords(number, mode, width, height)
+    return run_lengths(indices[ys, xs])
+
+
+def number_sequences(
+    indices: np.ndarray,
+    mode: str,
+    numbers: Optional[Iterable[int]] = None,
+    progress: Optional[Callable[[float, Dict], None]] = None,
+) -> Dict[int, List[Tuple[int, int]]]:
+    """计算多个编号（默认全部）的连续颜色块序列，progress按约1%的步长回调完成比例"""
+    height, width = indices.shape
+    if numbers is None:
+        numbers = range(1, max_number(mode, width, height) + 1)
+    numbers = list(numbers)
+    step = max(1, len(numbers) // 100)
+
+    sequences = {}
+    for position, number in enumerate(numbers, 1):
+        sequences[number] = line_sequence(indices, number, mode)
+        if progress is not None and (position % step == 0 or position == len(numbers)):
+            progress(position / len(numbers), {"numbers_done": position, "numbers_total": len(numbers)})
+    return sequences
+
+
+def compress_number_stats(number_stats: List[Dict]) -> List[Dict]:
+    """把按编号排列的序列压缩为引用指令（一次遍历，按序列内容建立哈希表）
+
+    - {"number": n, "sequence": [...]}: 序列第一次出现，原样给出
+    - {"number": n, "same_as": m}: 与之前的编号m序列相同
+    - {"number": n, "count": k, "period": p}: 编号n到n+k-1中的每一个都与其前p个编号的序列相同
+      （p=1为连续相同的编号，p>1为周期性重复的图案）
+    """
+    instructions: List[Dict] = []
+    last_seen: Dict[Tuple[int, ...], int] = {}
+    keys: Dict[int, Tuple[int, ...]] = {}
+    block: Optional[List[int]] = None  # [起始编号, 周期, 数量]
+
+    def close(block: Optional[List[int]]) -> None:
+        if block is None:
+            return
+        start, period, count = block
+        if count == 1:
+            instructions.append({"number": start, "same_as": start - period})
+        else:
+            instructions.append({"number": start, "count": count, "period": period})
+
+    for stat in number_stats:
+        number = stat["number"]
+        key = tuple(value for run in stat["sequence"] for value in run)
+        keys[number] = key
+        if block is not None and block[0] + block[2] == number and keys.get(number - block[1]) == key:
+            block[2] += 1
+        else:
+            close(block)
+            block = None
+            previous = last_seen.get(key)
+            if previous is not None:
+                block = [number, number - previous, 1]
+            else:
+                instructions.append({"number": number, "sequence": stat["sequence"]})
+        last_seen[key] = number
+    close(block)
+    return instructions
+
+
+def expand_number_stats(instructions: List[Dict]) -> List[Dict]:
+    """还原 compress_number_stats 的结果为完整的编号统计"""
+    sequences: Dict[int, List] = {}
+    for instruction in instructions:
+        number = instruction["number"]
+        if "sequence" in instruction:
+            sequences[number] = instruction["sequence"]
+        elif "same_as" in instruction:
+            sequences[number] = sequences[instruction["same_as"]]
+        else:
+            for offset in range(instruction["count"]):
+                sequences[number + offset] = sequences[number + offset - instruction["period"]]
+    return [{"number": number, "sequence": sequences[number]} for number in sorted(sequences)]
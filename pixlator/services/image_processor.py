@@ -1,54 +1,247 @@
 import os
-from typing import List, Dict, Tuple, Optional, Literal
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import IO, Callable, List, Dict, Iterator, Tuple, Optional, Literal
 from datetime import datetime
 from PIL import Image
 import numpy as np
-from sklearn.cluster import KMeans
 from collections import defaultdict
 from loguru import logger
 
 from pixlator.config import settings
+from pixlator.services.admission import (
+    GRID_BYTES_PER_PIXEL, AdmissionController, estimate_animation_cost, estimate_processing_cost
+)
+from pixlator.services.animation import (
+    DELTA, KEYFRAME, REPEAT, decode_frame, encode_frames, frame_count, quantize_animation
+)
+from pixlator.services.cache import MemoryLRUCache
+from pixlator.services.cancellation import CancelToken, ProcessingCancelled
+from pixlator.services.grid import (
+    build_index_grid, index_dtype, max_number, number_of, number_sequences, palette_hex
+)
+from pixlator.services.metrics import (
+    CACHE_LOOKUPS, PROCESSING_STAGE_SECONDS, StageTimings, size_bucket
+)
+from pixlator.services.quantizer import ColorQuantizer
+from pixlator.services.shared_cache import SharedCache
+from pixlator.utils.png import iter_png
 
 # 定义编号方式类型
 NumberingMode = Literal["top_to_bottom", "bottom_to_top", "diagonal_bottom_left", "diagonal_bottom_right"]
 
+# 进度回调：progress(stage, fraction, detail)
+ProgressCallback = Callable[[str, float, Dict], None]
+
+# 缓存内存估算：每个像素在结果字典中大约占用的字节数
+# （tracemalloc实测缓存条目释放的内存：16色约450，不减色、颜色统计条目很多时约790）
+RESULT_BYTES_PER_PIXEL = 800
+
+
+def fit_dimensions(width: int, height: int, max_dimension: int) -> Tuple[int, int]:
+    """按最长边缩放到max_dimension，返回保持宽高比的新尺寸"""
+    if width > height:
+        return max_dimension, int(height * (max_dimension / width))
+    return int(width * (max_dimension / height)), max_dimension
+
+
+def copy_result(result: Dict) -> Dict:
+    """复制处理结果中的可变部分（字典与列表），颜色、坐标与颜色块等元组在副本间共享
+
+    结果缓存中的同一个对象会返回给多个调用方，调用方得到的是副本，修改副本不会影响缓存。
+    """
+    params = result["processing_params"]
+    return {
+        **result,
+        "processing_params": {**params, "processed_dimensions": dict(params["processed_dimensions"])},
+        "pixel_data": [[pixel.copy() for pixel in row] for row in result["pixel_data"]],
+        "color_stats": [{**stat, "positions": list(stat["positions"])} for stat in result["color_stats"]],
+        "number_stats": [{**stat, "sequence": list(stat["sequence"])} for stat in result["number_stats"]],
+        "dimensions": dict(result["dimensions"])
+    }
+
+
+def _restore_tuples(result: Dict) -> Dict:
+    """JSON解码后的结果中元组变成了列表，就地恢复为元组，与直接计算的结果一致（copy_result只复制容器）"""
+    for row in result["pixel_data"]:
+        for pixel in row:
+            pixel["color"] = tuple(pixel["color"])
+    for stat in result["color_stats"]:
+        stat["rgb"] = tuple(stat["rgb"])
+        stat["positions"] = [tuple(position) for position in stat["positions"]]
+    for stat in result["number_stats"]:
+        stat["sequence"] = [tuple(run) for run in stat["sequence"]]
+    return result
+
+
 class ImageProcessor:
     """图片处理服务"""
     
     def __init__(self):
         self.logger = logger
+        # 跨请求保留聚类中心，用于颜色数量调整时的K-means热启动
+        self.quantizer = ColorQuantizer()
+        # 缩放后图片（图片金字塔）与处理结果的缓存，上传后的预热会提前填充
+        cache_budget = settings.CACHE_MEMORY_LIMIT_MB * 1024 * 1024
+        self.resized_cache = MemoryLRUCache("resized", cache_budget // 4)
+        self.result_cache = MemoryLRUCache("results", cache_budget - cache_budget // 4 - cache_budget // 32)
+        # 处理时构建的颜色索引网格，保存结果时直接使用，不再由结果重建
+        self.grid_cache = MemoryLRUCache("grids", cache_budget // 32)
+        # 多个worker共享的磁盘缓存，进程内缓存未命中时查找
+        self.shared_cache = SharedCache(
+            os.path.join(settings.UPLOAD_DIR, settings.SHARED_CACHE_DIR),
+            settings.SHARED_CACHE_MB * 1024 * 1024
+        ) if settings.SHARED_CACHE_MB > 0 else None
+        self._active_lock = threading.Lock()
+        self._active_requests = 0
+        # 按估算的内存占用准入前台处理请求，避免并发的大尺寸请求耗尽内存
+        self.admission = AdmissionController()
+    
+    @property
+    def is_busy(self) -> bool:
+        """是否有前台处理请求正在执行"""
+        with self._active_lock:
+            return self._active_requests > 0
+    
+    @contextmanager
+    def _track_active(self):
+        with self._active_lock:
+            self._active_requests += 1
+        try:
+            yield
+        finally:
+            with self._active_lock:
+                self._active_requests -= 1
+    
+    def process_image(self, file_path: str, max_size: int = None, color_count: int = None, numbering_mode: NumberingMode = "diagonal_bottom_right", progress: Optional[ProgressCallback] = None, cancel_token: Optional[CancelToken] = None, queue_timeout: Optional[float] = None) -> Dict:
+        """处理图片并返回像素化结果
+
+        progress(stage, fraction, detail) 会在每个阶段开始/结束及阶段内部循环中被调用；
+        传入cancel_token时在这些位置检查取消，已取消则抛出ProcessingCancelled。
+        处理前按估算的内存占用申请准入，内存预算不足时最多排队queue_timeout秒（None表示一直等待），
+        仍无法准入则抛出AdmissionRejected；命中结果缓存时不占用预算。
+        """
+        if max_size is None:
+            max_size = settings.DEFAULT_MAX_SIZE
+        if color_count is None:
+            color_count = settings.DEFAULT_COLOR_COUNT
+        cost = self.estimate_cost(file_path, max_size, color_count, numbering_mode)
+        with self.admission.admit(cost, timeout=queue_timeout, cancel_token=cancel_token):
+            if cancel_token is not None:
+                progress = self._with_cancellation(progress, cancel_token)
+            with self._track_active():
+                return self._process(file_path, max_size, color_count, numbering_mode, progress)
+    
+    def estimate_cost(self, file_path: str, max_size: int, color_count: int, numbering_mode: NumberingMode = "diagonal_bottom_right") -> int:
+        """估算处理占用的峰值内存（字节），只读取图片头部获取尺寸"""
+        source_key = self._source_key(file_path)
+        if self._has_result(source_key + (max_size, color_count, numbering_mode)):
+            return 0
+        with Image.open(file_path) as img:
+            width, height = img.size
+        grid_width, grid_height = fit_dimensions(width, height, max_size)
+        decode = not self._has_resized(source_key + (max_size,))
+        return estimate_processing_cost(width * height, grid_width * grid_height, color_count, decode=decode)
     
-    def process_image(self, file_path: str, max_size: int = None, color_count: int = None, numbering_mode: NumberingMode = "diagonal_bottom_right") -> Dict:
-        """处理图片并返回像素化结果"""
+    @staticmethod
+    def _with_cancellation(progress: Optional[ProgressCallback], cancel_token: CancelToken) -> ProgressCallback:
+        """在进度回调前检查取消令牌"""
+        def report(stage: str, fraction: float, detail: Dict):
+            cancel_token.check()
+            if progress is not None:
+                progress(stage, fraction, detail)
+        return report
+    
+    def build_pyramid(self, file_path: str, sizes: List[int], queue_timeout: Optional[float] = 0) -> int:
+        """只解码一次原图，生成多个max_size的缩放图并放入缓存，返回新生成的数量
+
+        后台预热使用：默认不排队，内存预算不足时直接抛出AdmissionRejected。
+        """
+        source_key = self._source_key(file_path)
+        missing = [size for size in sorted(set(sizes)) if not self._has_resized(source_key + (size,))]
+        if not missing:
+            return 0
+        
+        with Image.open(file_path) as img:
+            width, height = img.size
+        cost = estimate_processing_cost(width * height, 0, None) + sum(
+            3 * np.prod(fit_dimensions(width, height, size)) for size in missing
+        )
+        with self.admission.admit(int(cost), timeout=queue_timeout):
+            with Image.open(file_path) as img:
+                full = img.convert("RGB")
+            
+            for size in missing:
+                resized = full.resize(fit_dimensions(full.width, full.height, size), Image.NEAREST)
+                self._put_resized(source_key + (size,), resized)
+        
+        self.logger.info(f"Built image pyramid for {file_path}: sizes={missing}")
+        return len(missing)
+    
+    def precompute_defaults(self, file_path: str, queue_timeout: Optional[float] = 0) -> None:
+        """按默认参数预先计算结果并放入缓存（后台预热使用，不计入前台请求）
+
+        同样申请内存预算，默认不排队：预算不足时抛出AdmissionRejected，不与前台请求争抢。
+        """
+        max_size, color_count = settings.DEFAULT_MAX_SIZE, settings.DEFAULT_COLOR_COUNT
+        cost = self.estimate_cost(file_path, max_size, color_count)
+        with self.admission.admit(cost, timeout=queue_timeout):
+            self._process(file_path, max_size, color_count, "diagonal_bottom_right")
+    
+    def _process(self, file_path: str, max_size: int = None, color_count: int = None, numbering_mode: NumberingMode = "diagonal_bottom_right", progress: Optional[ProgressCallback] = None) -> Dict:
+        """处理流程本身，后台预热直接调用，不计入前台请求"""
         try:
             if max_size is None:
                 max_size = settings.DEFAULT_MAX_SIZE
             if color_count is None:
                 color_count = settings.DEFAULT_COLOR_COUNT
             
-            self.logger.info(f"Processing image: {file_path} with max_size={max_size}, color_count={color_count}, numbering_mode={numbering_mode}")
+            timings = StageTimings(
+                PROCESSING_STAGE_SECONDS,
+                progress=progress,
+                size_bucket=size_bucket(max_size),
+                color_count=color_count,
+                numbering_mode=numbering_mode
+            )
             
-            # 创建转换器
-            converter = PixelArtConverter(file_path)
+            source_key = self._source_key(file_path)
+            result_key = source_key + (max_size, color_count, numbering_mode)
+            cached = self._get_result(result_key)
+            if cached is not None:
+                self.logger.info(f"Result cache hit: {file_path} with max_size={max_size}, color_count={color_count}, numbering_mode={numbering_mode}")
+                if progress is not None:
+                    progress("cached", 1.0, {})
+                return copy_result(cached)
             
-            # 调整图片尺寸
-            converter.resize_image(max_size)
+            self.logger.info(f"Processing image: {file_path} with max_size={max_size}, color_count={color_count}, numbering_mode={numbering_mode}")
+            
+            # 创建转换器并调整图片尺寸
+            converter = self._create_converter(file_path, max_size, timings)
             
             # 减少颜色数量（如果指定）
             if color_count and color_count > 0:
-                converter.reduce_colors(color_count)
+                with timings.stage("quantize"):
+                    converter.reduce_colors(color_count, quantizer=self.quantizer, progress=timings.reporter("quantize"))
             
             # 分析像素数据
-            converter.analyze_pixels(numbering_mode)
+            with timings.stage("analyze"):
+                converter.analyze_pixels(numbering_mode, progress=timings.reporter("analyze"))
             
             # 分析编号序列
-            number_sequences, color_to_index = converter.analyze_number_sequences(numbering_mode)
+            with timings.stage("sequences"):
+                number_sequences, color_to_index = converter.analyze_number_sequences(numbering_mode, progress=timings.reporter("sequences"))
             
-            # 生成颜色统计
-            color_stats = self._generate_color_stats(converter.pixel_data, color_to_index)
+            with timings.stage("stats"):
+                # 生成颜色统计
+                color_stats = self._generate_color_stats(converter.pixel_data, color_to_index)
+                
+                # 生成编号统计
+                number_stats = self._generate_number_stats(number_sequences)
             
-            # 生成编号统计
-            number_stats = self._generate_number_stats(number_sequences)
+            with timings.stage("serialize"):
+                pixel_data = self._serialize_pixel_data(converter.pixel_data)
             
             # 准备返回数据
             result = {
@@ -61,7 +254,7 @@ class ImageProcessor:
                         "height": converter.height
                     }
                 },
-                "pixel_data": self._serialize_pixel_data(converter.pixel_data),
+                "pixel_data": pixel_data,
                 "color_stats": color_stats,
                 "number_stats": number_stats,
                 "dimensions": {
@@ -70,13 +263,376 @@ class ImageProcessor:
                 }
             }
             
-            self.logger.info(f"Image processing completed: {converter.width}x{converter.height}")
-            return result
+            self._put_result(result_key, result)
+            indices, palette = converter.index_grid
+            self.grid_cache.put(result_key[:-1], converter.index_grid, indices.nbytes + palette.nbytes)
             
+            self.logger.info(f"Image processing completed: {converter.width}x{converter.height} in {timings.total * 1000:.1f}ms ({timings.summary()})")
+            return copy_result(result)
+            
+        except ProcessingCancelled as e:
+            self.logger.info(f"Processing cancelled ({e}): {file_path} with max_size={max_size}, color_count={color_count}, numbering_mode={numbering_mode}")
+            raise
         except Exception as e:
             self.logger.error(f"Error processing image {file_path}: {e}")
             raise
     
+    def _create_converter(self, file_path: str, max_size: int, timings: StageTimings) -> "PixelArtConverter":
+        """创建已缩放到max_size的转换器，优先使用预热好的缩放图"""
+        source_key = self._source_key(file_path)
+        resized = self._get_resized(source_key + (max_size,))
+        if resized is not None:
+            return PixelArtConverter(file_path, image=resized)
+        
+        with timings.stage("decode"):
+            converter = PixelArtConverter(file_path)
+        with timings.stage("resize"):
+            converter.resize_image(max_size)
+        self._put_resized(source_key + (max_size,), converter.img)
+        return converter
+    
+    def _get_resized(self, key: Tuple) -> Optional[Image.Image]:
+        """先查进程内缓存，再查共享缓存（命中时放入进程内缓存）"""
+        resized = self.resized_cache.get(key)
+        CACHE_LOOKUPS.inc(cache="resized", outcome="hit" if resized is not None else "miss")
+        if resized is None and self.shared_cache is not None:
+            array = self.shared_cache.get_array(("resized",) + key)
+            CACHE_LOOKUPS.inc(cache="shared_resized", outcome="hit" if array is not None else "miss")
+            if array is not None:
+                resized = Image.fromarray(array)
+                self.resized_cache.put(key, resized, array.nbytes)
+        return resized
+    
+    def _put_resized(self, key: Tuple, img: Image.Image) -> None:
+        self.resized_cache.put(key, img, img.width * img.height * 3)
+        if self.shared_cache is not None:
+            self.shared_cache.put_array(("resized",) + key, np.asarray(img))
+    
+    def _has_resized(self, key: Tuple) -> bool:
+        return key in self.resized_cache or (self.shared_cache is not None and ("resized",) + key in self.shared_cache)
+    
+    def _get_result(self, key: Tuple) -> Optional[Dict]:
+        """先查进程内缓存，再查共享缓存（命中时放入进程内缓存）"""
+        result = self.result_cache.get(key)
+        CACHE_LOOKUPS.inc(cache="results", outcome="hit" if result is not None else "miss")
+        if result is None and self.shared_cache is not None:
+            result = self.shared_cache.get_object(("results",) + key)
+            CACHE_LOOKUPS.inc(cache="shared_results", outcome="hit" if result is not None else "miss")
+            if result is not None:
+                result = _restore_tuples(result)
+                dimensions = result["dimensions"]
+                self.result_cache.put(key, result, dimensions["width"] * dimensions["height"] * RESULT_BYTES_PER_PIXEL)
+        return result
+    
+    def _put_result(self, key: Tuple, result: Dict) -> None:
+        dimensions = result["dimensions"]
+        self.result_cache.put(key, result, dimensions["width"] * dimensions["height"] * RESULT_BYTES_PER_PIXEL)
+        if self.shared_cache is not None:
+            self.shared_cache.put_object(("results",) + key, result)
+    
+    def _has_result(self, key: Tuple) -> bool:
+        return key in self.result_cache or (self.shared_cache is not None and ("results",) + key in self.shared_cache)
+    
+    def build_grid(self, file_path: str, max_size: int, color_count: int = None, queue_timeout: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """缩放并量化图片，返回颜色索引网格与调色板（分块模式使用，不生成逐像素字典）
+
+        与 process_image 一样按估算的内存占用申请准入，最多排队queue_timeout秒。
+        """
+        if color_count is None:
+            color_count = settings.DEFAULT_COLOR_COUNT
+        
+        with Image.open(file_path) as img:
+            width, height = img.size
+        grid_width, grid_height = fit_dimensions(width, height, max_size)
+        decode = not self._has_resized(self._source_key(file_path) + (max_size,))
+        cost = estimate_processing_cost(width * height, grid_width * grid_height, color_count, decode=decode, bytes_per_pixel=GRID_BYTES_PER_PIXEL)
+        with self.admission.admit(cost, timeout=queue_timeout):
+            return self._build_grid(file_path, max_size, color_count)
+    
+    def _build_grid(self, file_path: str, max_size: int, color_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        
+        timings = StageTimings(
+            PROCESSING_STAGE_SECONDS,
+            size_bucket=size_bucket(max_size),
+            color_count=color_count,
+            numbering_mode="tiled"
+        )
+        with self._track_active():
+            converter = self._create_converter(file_path, max_size, timings)
+            if color_count and color_count > 0:
+                with timings.stage("quantize"):
+                    converter.reduce_colors(color_count, quantizer=self.quantizer)
+            with timings.stage("index_grid"):
+                indices, palette = build_index_grid(np.array(converter.img))
+        
+        self.logger.info(f"Built index grid: {converter.width}x{converter.height}, {len(palette)} colors in {timings.total * 1000:.1f}ms ({timings.summary()})")
+        return indices, palette
+    
+    def summarize_grid(self, indices: np.ndarray, palette: np.ndarray, max_size: int, color_count: Optional[int], numbering_mode: NumberingMode, tile_size: int = None) -> Dict:
+        """生成分块结果的概要信息（尺寸、分块数、调色板与颜色计数）"""
+        if tile_size is None:
+            tile_size = settings.TILE_SIZE
+        height, width = indices.shape
+        counts = np.bincount(indices.reshape(-1), minlength=len(palette))
+        hex_colors = palette_hex(palette)
+        
+        return {
+            "processing_params": {
+                "max_size": max_size,
+                "color_count": color_count,
+                "numbering_mode": numbering_mode,
+                "processed_dimensions": {"width": width, "height": height}
+            },
+            "dimensions": {"width": width, "height": height},
+            "tile_size": tile_size,
+            "tiles": {
+                "columns": (width + tile_size - 1) // tile_size,
+                "rows": (height + tile_size - 1) // tile_size
+            },
+            "number_count": max_number(numbering_mode, width, height),
+            "palette": [
+                {
+                    "color_index": index + 1,
+                    "rgb": tuple(palette[index].tolist()),
+                    "hex": hex_colors[index],
+                    "count": int(counts[index])
+                }
+                for index in range(len(palette))
+            ]
+        }
+    
+    def get_tile(self, indices: np.ndarray, grid_info: Dict, tile_x: int, tile_y: int) -> Optional[Dict]:
+        """读取一个分块的像素数据与颜色统计，分块越界时返回None"""
+        tile_size = grid_info["tile_size"]
+        height, width = indices.shape
+        x0, y0 = tile_x * tile_size, tile_y * tile_size
+        if tile_x < 0 or tile_y < 0 or x0 >= width or y0 >= height:
+            return None
+        x1, y1 = min(x0 + tile_size, width), min(y0 + tile_size, height)
+        
+        pixel_data, color_stats = self._grid_region(indices, grid_info, x0, y0, x1, y1)
+        
+        return {
+            "tile_x": tile_x,
+            "tile_y": tile_y,
+            "x": x0,
+            "y": y0,
+            "width": x1 - x0,
+            "height": y1 - y0,
+            "pixel_data": pixel_data,
+            "color_stats": color_stats
+        }
+    
+    def _grid_region(self, indices: np.ndarray, grid_info: Dict, x0: int, y0: int, x1: int, y1: int) -> Tuple[List[List[Dict]], List[Dict]]:
+        """网格矩形区域的像素数据与颜色统计（格式与 process_image 的结果相同）"""
+        height, width = indices.shape
+        tile = np.asarray(indices[y0:y1, x0:x1])
+        mode = grid_info["processing_params"]["numbering_mode"]
+        ys, xs = np.mgrid[y0:y1, x0:x1]
+        numbers = number_of(xs, ys, mode, width, height).tolist()
+        palette = [tuple(entry["rgb"]) for entry in grid_info["palette"]]
+        hex_colors = [entry["hex"] for entry in grid_info["palette"]]
+        
+        pixel_data = []
+        for row_index, row in enumerate(tile.tolist()):
+            y = y0 + row_index
+            pixel_data.append([
+                {
+                    "x": x0 + col_index,
+                    "y": y,
+                    "number": numbers[row_index][col_index],
+                    "color": palette[color],
+                    "hex": hex_colors[color]
+                }
+                for col_index, color in enumerate(row)
+            ])
+        
+        color_stats = []
+        flat = tile.reshape(-1)
+        for color in np.unique(flat).tolist():
+            tile_ys, tile_xs = np.nonzero(tile == color)
+            color_stats.append({
+                "color_index": color + 1,
+                "rgb": palette[color],
+                "hex": hex_colors[color],
+                "count": len(tile_xs),
+                "positions": np.stack([tile_xs + x0, tile_ys + y0], axis=1).tolist()
+            })
+        color_stats.sort(key=lambda item: item["count"], reverse=True)
+        
+        return pixel_data, color_stats
+    
+    def get_index_grid(self, file_path: str, result: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """处理结果对应的颜色索引网格与调色板：优先使用处理时已构建的网格，不在缓存中时由结果重建"""
+        params = result["processing_params"]
+        grid = self.grid_cache.get(self._source_key(file_path) + (params["max_size"], params["color_count"]))
+        CACHE_LOOKUPS.inc(cache="grids", outcome="hit" if grid is not None else "miss")
+        if grid is not None:
+            return grid
+        return self.grid_from_result(result)
+    
+    def grid_from_result(self, result: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """由处理结果的颜色统计重建颜色索引网格与调色板（网格中的索引 i 对应 color_index = i + 1）"""
+        width, height = result["dimensions"]["width"], result["dimensions"]["height"]
+        color_stats = result["color_stats"]
+        n_colors = max((stat["color_index"] for stat in color_stats), default=0)
+        
+        palette = np.zeros((n_colors, 3), dtype=np.uint8)
+        indices = np.zeros((height, width), dtype=index_dtype(n_colors))
+        for stat in color_stats:
+            palette[stat["color_index"] - 1] = stat["rgb"]
+            positions = np.asarray(stat["positions"], dtype=np.int64).reshape(-1, 2)
+            indices[positions[:, 1], positions[:, 0]] = stat["color_index"] - 1
+        return indices, palette
+    
+    def result_from_grid(self, indices: np.ndarray, grid_info: Dict) -> Dict:
+        """由量化网格重新生成完整的处理结果（像素编辑后按需重建保存的JSON）"""
+        height, width = indices.shape
+        pixel_data, color_stats = self._grid_region(indices, grid_info, 0, 0, width, height)
+        mode = grid_info["processing_params"]["numbering_mode"]
+        
+        return {
+            "processing_params": grid_info["processing_params"],
+            "pixel_data": pixel_data,
+            "color_stats": color_stats,
+            "number_stats": self._generate_number_stats(number_sequences(np.asarray(indices), mode)),
+            "dimensions": {"width": width, "height": height}
+        }
+    
+    def apply_pixel_edits(self, indices: np.ndarray, grid_info: Dict, edits: List[Tuple[int, int, int]]) -> Dict:
+        """就地修改颜色索引网格，edits 为 [(x, y, color_index), ...]，同一位置以最后一次修改为准
+
+        只重新计算受影响编号的连续颜色块序列，调色板中的颜色计数按修改前后的差值增量更新，
+        代价与修改涉及的编号数成正比，与网格大小无关。坐标或颜色索引越界时抛出ValueError。
+        """
+        height, width = indices.shape
+        palette = grid_info["palette"]
+        mode = grid_info["processing_params"]["numbering_mode"]
+        
+        edits = np.asarray(edits, dtype=np.int64).reshape(-1, 3)
+        xs, ys, colors = edits[:, 0], edits[:, 1], edits[:, 2]
+        if ((xs < 0) | (xs >= width) | (ys < 0) | (ys >= height)).any():
+            raise ValueError(f"Pixel coordinates must be within {width}x{height}")
+        if ((colors < 1) | (colors > len(palette))).any():
+            raise ValueError(f"color_index must be between 1 and {len(palette)}")
+        
+        # 同一位置多次修改时保留最后一次
+        positions = ys * width + xs
+        _, last = np.unique(positions[::-1], return_index=True)
+        keep = np.sort(len(positions) - 1 - last)
+        xs, ys, new = xs[keep], ys[keep], colors[keep] - 1
+        
+        old = np.asarray(indices[ys, xs]).astype(np.int64)
+        changed = old != new
+        xs, ys, old, new = xs[changed], ys[changed], old[changed], new[changed]
+        
+        if len(xs):
+            indices[ys, xs] = new
+            delta = np.bincount(new, minlength=len(palette)) - np.bincount(old, minlength=len(palette))
+            for entry, change in zip(palette, delta.tolist()):
+                entry["count"] += change
+        
+        numbers = np.unique(number_of(xs, ys, mode, width, height)).tolist()
+        sequences = number_sequences(indices, mode, numbers)
+        
+        return {
+            "updated": len(xs),
+            "number_stats": self._generate_number_stats(sequences),
+            "palette": palette
+        }
+    
+    def process_animation(self, file_path: str, max_size: int, color_count: Optional[int], numbering_mode: NumberingMode, progress: Optional[Callable[[float, Dict], None]] = None, queue_timeout: Optional[float] = None) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """把多帧图片（GIF）的所有帧量化到同一个调色板，返回(差异压缩后的帧数组, 帧信息)
+
+        按帧数估算内存占用并申请准入，最多排队queue_timeout秒。
+        """
+        with Image.open(file_path) as img:
+            size = fit_dimensions(img.width, img.height, max_size)
+            cost = estimate_animation_cost(img.width * img.height, size[0] * size[1], frame_count(file_path))
+        with self.admission.admit(cost, timeout=queue_timeout), self._track_active():
+            
+            start = time.perf_counter()
+            frames, palette, durations = quantize_animation(file_path, size, color_count, self.quantizer, progress=progress)
+            encoded = encode_frames(frames)
+            
+            counts = np.zeros(len(palette), dtype=np.int64)
+            for frame in frames:
+                counts += np.bincount(frame.reshape(-1), minlength=len(palette))
+            hex_colors = palette_hex(palette)
+            kinds = encoded["kinds"].tolist()
+            raw_bytes = sum(frame.nbytes for frame in frames)
+            stored_bytes = sum(array.nbytes for array in encoded.values())
+            
+            info = {
+                "processing_params": {
+                    "max_size": max_size,
+                    "color_count": color_count,
+                    "numbering_mode": numbering_mode,
+                    "processed_dimensions": {"width": size[0], "height": size[1]}
+                },
+                "dimensions": {"width": size[0], "height": size[1]},
+                "frame_count": len(frames),
+                "durations": durations,
+                "palette": [
+                    {
+                        "color_index": index + 1,
+                        "rgb": tuple(palette[index].tolist()),
+                        "hex": hex_colors[index],
+                        "count": int(counts[index])
+                    }
+                    for index in range(len(palette))
+                ],
+                "storage": {
+                    "keyframes": kinds.count(KEYFRAME),
+                    "deltas": kinds.count(DELTA),
+                    "repeats": kinds.count(REPEAT),
+                    "raw_bytes": raw_bytes,
+                    "stored_bytes": stored_bytes
+                }
+            }
+        
+        self.logger.info(
+            f"Processed {len(frames)} frames: {size[0]}x{size[1]}, {len(palette)} colors in {(time.perf_counter() - start) * 1000:.1f}ms "
+            f"(keyframes={info['storage']['keyframes']} deltas={info['storage']['deltas']} repeats={info['storage']['repeats']}, "
+            f"{raw_bytes} -> {stored_bytes} bytes)"
+        )
+        return encoded, info
+    
+    def get_frame(self, encoded: Dict[str, np.ndarray], info: Dict, index: int) -> Optional[Dict]:
+        """还原一帧并生成与 process_image 相同格式的结果，帧号越界时返回None"""
+        if index < 0 or index >= info["frame_count"]:
+            return None
+        return self.result_from_grid(decode_frame(encoded, index), info)
+    
+    def get_number_stats(self, indices: np.ndarray, grid_info: Dict, start: int, limit: int) -> List[Dict]:
+        """按编号区间计算编号统计（分页返回）"""
+        mode = grid_info["processing_params"]["numbering_mode"]
+        height, width = indices.shape
+        end = min(start + limit, max_number(mode, width, height) + 1)
+        sequences = number_sequences(indices, mode, range(max(start, 1), end))
+        return self._generate_number_stats(sequences)
+    
+    def iter_grid_png(self, indices: np.ndarray, palette: np.ndarray, pixel_size: int = 10) -> Iterator[bytes]:
+        """按分块行逐行渲染像素化PNG，以流的形式输出，内存占用不随网格增大"""
+        height, width = indices.shape
+        palette = np.asarray(palette, dtype=np.uint8)
+        tile_size = settings.TILE_SIZE
+        
+        def scanlines():
+            for band_start in range(0, height, tile_size):
+                band = np.asarray(indices[band_start:band_start + tile_size])
+                for row in band:
+                    line = np.repeat(palette[row], pixel_size, axis=0)
+                    for _ in range(pixel_size):
+                        yield line
+        
+        return iter_png(width * pixel_size, height * pixel_size, scanlines())
+    
+    @staticmethod
+    def _source_key(file_path: str) -> Tuple:
+        """源文件的缓存键（绝对路径 + 修改时间）"""
+        return (os.path.abspath(file_path), os.stat(file_path).st_mtime_ns)
+    
     def _serialize_pixel_data(self, pixel_data: List[List[Dict]]) -> List[List[Dict]]:
         """序列化像素数据"""
         serialized = []
@@ -112,7 +668,7 @@ class ImageProcessor:
                     }
                 
                 color_stats[color_key]["count"] += 1
-                color_stats[color_key]["positions"].append([x, y])
+                color_stats[color_key]["positions"].append((x, y))
         
         # 转换为列表并按使用次数排序
         stats_list = list(color_stats.values())
@@ -133,48 +689,70 @@ class ImageProcessor:
         
         return number_stats
     
-    def export_pixelated_image(self, pixel_data: List[List[Dict]], dimensions: Dict, pixel_size: int = 10, export_type: str = "png") -> str:
-        """导出像素化图片"""
+    def render_pixelated_image(self, pixel_data: List[List[Dict]], dimensions: Dict, pixel_size: int = 10) -> Image.Image:
+        """将像素数据渲染为放大pixel_size倍的图片"""
+        width = dimensions["width"]
+        height = dimensions["height"]
+        
+        # 先生成每个像素一个点的小图，缺失的像素保持白色
+        colors = np.full((height, width, 3), 255, dtype=np.uint8)
+        for y, row in enumerate(pixel_data):
+            if row:
+                colors[y, :len(row)] = [tuple(pixel["color"])[:3] for pixel in row]
+        
+        # 再按像素大小整体放大
+        return Image.fromarray(colors).resize((width * pixel_size, height * pixel_size), Image.NEAREST)
+    
+    def write_export(self, export_img: Image.Image, fp, export_type: str = "png") -> str:
+        """将导出图片写入文件或文件对象，返回对应的媒体类型"""
+        if export_type.lower() == "jpg":
+            export_img.save(fp, "JPEG", quality=95)
+            return "image/jpeg"
+        export_img.save(fp, "PNG")
+        return "image/png"
+    
+    def export_to_buffer(self, pixel_data: List[List[Dict]], dimensions: Dict, pixel_size: int = 10, export_type: str = "png") -> Tuple[IO[bytes], int, str]:
+        """将像素化图片渲染到内存缓冲区（过大时自动落到临时文件），返回(缓冲区, 字节数, 媒体类型)"""
+        export_img = self.render_pixelated_image(pixel_data, dimensions, pixel_size)
+        buffer = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
         try:
-            width = dimensions["width"]
-            height = dimensions["height"]
-            
-            # 创建新图片
-            export_width = width * pixel_size
-            export_height = height * pixel_size
-            export_img = Image.new("RGB", (export_width, export_height), (255, 255, 255))
-            
-            # 绘制像素
-            for y, row in enumerate(pixel_data):
-                for x, pixel in enumerate(row):
-                    color = pixel["color"]
-                    # 确保颜色值是元组格式
-                    if isinstance(color, list):
-                        color = tuple(color)
-                    elif not isinstance(color, tuple):
-                        # 如果是其他格式，尝试转换为元组
-                        color = tuple(color) if hasattr(color, '__iter__') else (0, 0, 0)
-                    
-                    pixel_x = x * pixel_size
-                    pixel_y = y * pixel_size
-                    
-                    # 绘制像素块
-                    for dy in range(pixel_size):
-                        for dx in range(pixel_size):
-                            export_img.putpixel((pixel_x + dx, pixel_y + dy), color)
+            media_type = self.write_export(export_img, buffer, export_type)
+            size = buffer.tell()
+            buffer.seek(0)
+        except Exception:
+            buffer.close()
+            raise
+        
+        self.logger.info(f"Rendered pixelated image to buffer: {size} bytes")
+        return buffer, size, media_type
+    
+    def export_pixelated_image(self, pixel_data: List[List[Dict]], dimensions: Dict, pixel_size: int = 10, export_type: str = "png", progress: Optional[ProgressCallback] = None, source_filename: Optional[str] = None, output_dir: Optional[str] = None) -> str:
+        """导出像素化图片，progress在渲染与写入阶段的开始/结束时被调用
+
+        传入source_filename时导出文件名包含上传文件名，便于清理时与上传一起删除；
+        output_dir为导出目录（默认为上传目录）。
+        """
+        def report(stage: str, fraction: float):
+            if progress is not None:
+                progress(stage, fraction, {})
+        
+        try:
+            report("render", 0.0)
+            export_img = self.render_pixelated_image(pixel_data, dimensions, pixel_size)
+            report("render", 1.0)
             
             # 生成导出文件名
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            export_filename = f"pixelated_{timestamp}.{export_type}"
-            export_path = os.path.join(settings.UPLOAD_DIR, export_filename)
+            if source_filename:
+                export_filename = f"pixelated_{os.path.splitext(source_filename)[0]}_{timestamp}.{export_type}"
+            else:
+                export_filename = f"pixelated_{timestamp}.{export_type}"
+            export_path = os.path.join(output_dir or settings.UPLOAD_DIR, export_filename)
             
             # 保存图片
-            if export_type.lower() == "png":
-                export_img.save(export_path, "PNG")
-            elif export_type.lower() == "jpg":
-                export_img.save(export_path, "JPEG", quality=95)
-            else:
-                export_img.save(export_path, "PNG")
+            report("write", 0.0)
+            self.write_export(export_img, export_path, export_type)
+            report("write", 1.0)
             
             self.logger.info(f"Exported pixelated image: {export_path}")
             return export_filename
@@ -187,40 +765,49 @@ class ImageProcessor:
 class PixelArtConverter:
     """像素艺术转换器"""
     
-    def __init__(self, image_path: str):
-        """初始化图片转换器"""
-        self.img = Image.open(image_path).convert("RGB")
+    def __init__(self, image_path: str, image: Optional[Image.Image] = None):
+        """初始化图片转换器，可直接传入已解码（或已缩放）的图片"""
+        self.img = image.copy() if image is not None else Image.open(image_path).convert("RGB")
         self.width, self.height = self.img.size
         self.pixel_data = []
+        self.index_grid: Optional[Tuple[np.ndarray, np.ndarray]] = None  # analyze_number_sequences 构建的(索引网格, 调色板)
+        self.image_path = image_path
         self.filename = os.path.splitext(os.path.basename(image_path))[0]
     
     def resize_image(self, max_dimension: int = 100):
         """调整图片尺寸"""
-        if self.width > self.height:
-            new_width = max_dimension
-            new_height = int(self.height * (max_dimension / self.width))
-        else:
-            new_height = max_dimension
-            new_width = int(self.width * (max_dimension / self.height))
+        new_width, new_height = fit_dimensions(self.width, self.height, max_dimension)
         
         self.img = self.img.resize((new_width, new_height), Image.NEAREST)
         self.width, self.height = self.img.size
         logger.info(f"Image resized to: {self.width}×{self.height} pixels")
     
-    def reduce_colors(self, n_colors: int):
-        """使用K-means算法减少颜色数量"""
+    def reduce_colors(self, n_colors: int, quantizer: Optional[ColorQuantizer] = None, progress: Optional[Callable[[float, Dict], None]] = None):
+        """使用K-means算法减少颜色数量
+
+        传入共享的quantizer时，同一张缩放后图片的上一次聚类中心会被用作初始中心。
+        """
         logger.info(f"Reducing colors to {n_colors}...")
+        if quantizer is None:
+            quantizer = ColorQuantizer()
         img_array = np.array(self.img)
         h, w, c = img_array.shape
         pixel_samples = img_array.reshape(-1, 3)
         
-        kmeans = KMeans(n_clusters=n_colors, random_state=0).fit(pixel_samples)
-        new_colors = kmeans.cluster_centers_.astype(int)
-        new_img_array = new_colors[kmeans.labels_].reshape(h, w, c)
+        new_colors, labels = quantizer.quantize(pixel_samples, n_colors, cache_key=self._resized_key(), progress=progress)
+        new_img_array = new_colors[labels].reshape(h, w, c)
         
         self.img = Image.fromarray(new_img_array.astype("uint8"))
         logger.info(f"Colors reduced to {n_colors}")
     
+    def _resized_key(self) -> Tuple:
+        """标识当前缩放后图片的缓存键（源文件 + 修改时间 + 缩放尺寸）"""
+        try:
+            mtime = os.stat(self.image_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        return (os.path.abspath(self.image_path), mtime, self.width, self.height)
+    
     def _calculate_number(self, x: int, y: int, mode: NumberingMode) -> int:
         """根据编号方式计算像素编号"""
         if mode == "top_to_bottom":
@@ -239,9 +826,10 @@ class PixelArtConverter:
             # 默认使用右下角对角线方式
             return (self.width - 1 - x) + (self.height - 1 - y) + 1
     
-    def analyze_pixels(self, numbering_mode: NumberingMode = "diagonal_bottom_right"):
-        """分析像素数据并生成编号"""
+    def analyze_pixels(self, numbering_mode: NumberingMode = "diagonal_bottom_right", progress: Optional[Callable[[float, Dict], None]] = None):
+        """分析像素数据并生成编号，progress按约1%的行数步长回调完成比例"""
         self.pixel_data = []
+        step = max(1, self.height // 100)
         
         for y in range(self.height):
             row = []
@@ -260,68 +848,17 @@ class PixelArtConverter:
                     "hex": hex_color,
                 })
             self.pixel_data.append(row)
+            if progress is not None and ((y + 1) % step == 0 or y + 1 == self.height):
+                progress((y + 1) / self.height, {"rows_done": y + 1, "rows_total": self.height})
     
-    def analyze_number_sequences(self, numbering_mode: NumberingMode = "diagonal_bottom_right"):
+    def analyze_number_sequences(self, numbering_mode: NumberingMode = "diagonal_bottom_right", progress: Optional[Callable[[float, Dict], None]] = None):
         """分析每个编号的连续颜色块序列"""
-        number_sequences = {}
-        
-        # 获取颜色索引映射
-        color_to_index = {}
-        for row in self.pixel_data:
-            for pixel in row:
-                if pixel["color"] not in color_to_index:
-                    color_to_index[pixel["color"]] = len(color_to_index) + 1
+        # 颜色索引按首次出现顺序编号，与像素数据中的颜色一一对应
+        indices, palette = build_index_grid(np.array(self.img))
+        self.index_grid = (indices, palette)
+        color_to_index = {tuple(color): index + 1 for index, color in enumerate(palette.tolist())}
         
-        # 根据编号方式确定编号数量
-        if numbering_mode in ["diagonal_bottom_left", "diagonal_bottom_right"]:
-            # 对角线方式：编号数量为 width + height - 1
-            max_number = self.width + self.height - 1
-        else:
-            # 行列方式：使用行数作为编号数量
-            max_number = self.height
+        # 按编号方式逐条取出像素并统计连续颜色块（奇数编号从右往左，偶数编号从左往右）
+        sequences = number_sequences(indices, numbering_mode, progress=progress)
         
-        # 分析每个编号（从1开始）
-        for number in range(1, max_number + 1):
-            sequence = []
-            
-            # 收集该编号的所有像素
-            number_pixels = []
-            for y in range(self.height):
-                for x in range(self.width):
-                    pixel_number = self._calculate_number(x, y, numbering_mode)
-                    if pixel_number == number:
-                        number_pixels.append(self.pixel_data[y][x])
-            
-            # 根据编号方式排序像素
-            # 奇数组号从右往左，偶数组号从左往右
-            if number % 2 == 1:
-                number_pixels.sort(key=lambda p: p["x"], reverse=True)
-            else:
-                number_pixels.sort(key=lambda p: p["x"])
-            
-            # 统计连续颜色块
-            if number_pixels:
-                current_color = color_to_index[number_pixels[0]["color"]]
-                current_count = 1
-                
-                for i in range(1, len(number_pixels)):
-                    pixel_color = color_to_index[number_pixels[i]["color"]]
-                    
-                    if pixel_color == current_color:
-                        # 相同颜色，计数加1
-                        current_count += 1
-                    else:
-                        # 不同颜色，保存当前块并开始新块
-                        sequence.append((current_color, current_count))
-                        current_color = pixel_color
-                        current_count = 1
-                
-                # 保存最后一个颜色块
-                sequence.append((current_color, current_count))
-            
-            number_sequences[number] = sequence
-        
-        return number_sequences, color_to_index
-
-
- 
\ No newline at end of file
+        return sequences, color_to_index
@@ -0,0 +1,200 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from pixlator.config import settings
+from pixlator.services.cancellation import CancelToken, ProcessingCancelled
+
+# 各类任务的阶段权重，用于把阶段内进度换算为整体进度
+PROCESS_STAGE_WEIGHTS = {
+    "decode": 0.05,
+    "resize": 0.05,
+    "quantize": 0.2,
+    "analyze": 0.3,
+    "sequences": 0.2,
+    "stats": 0.05,
+    "serialize": 0.1,
+    "save": 0.05,
+}
+EXPORT_STAGE_WEIGHTS = {
+    "load": 0.2,
+    "render": 0.4,
+    "write": 0.4,
+}
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class Job:
+    """后台任务及其进度事件
+
+    事件按顺序编号（从1开始），SSE客户端可以通过 Last-Event-ID 从断点继续读取。
+    """
+
+    def __init__(self, kind: str, params: Dict, stage_weights: Dict[str, float]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.stage_weights = stage_weights
+        self.status = PENDING
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._events: List[Dict] = []
+        self._completed_weight = 0.0
+        self.cancel_token = CancelToken()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def report(self, stage: str, fraction: float, detail: Optional[Dict] = None) -> None:
+        """进度回调 progress(stage, fraction, detail)，任务被取消时抛出ProcessingCancelled"""
+        self.cancel_token.check()
+
+        total_weight = sum(self.stage_weights.values()) or 1.0
+        weight = self.stage_weights.get(stage, 0.0)
+        with self._lock:
+            overall = (self._completed_weight + weight * min(max(fraction, 0.0), 1.0)) / total_weight
+            if fraction >= 1.0:
+                self._completed_weight += weight
+            # 跳过的阶段（如命中缓存）不会倒退整体进度
+            self.progress = max(self.progress, min(overall, 1.0))
+            self.stage = stage
+            self._append("progress", {"stage": stage, "stage_progress": round(fraction, 4), "detail": detail or {}})
+
+    def cancel(self) -> bool:
+        """请求取消，已结束的任务返回False"""
+        with self._lock:
+            if self.finished:
+                return False
+            self.cancel_token.cancel("job cancelled")
+            if self.status == PENDING:
+                self._finish(CANCELLED)
+        return True
+
+    def events_since(self, last_id: int) -> List[Dict]:
+        with self._lock:
+            return self._events[last_id:]
+
+    def snapshot(self) -> Dict:
+        """任务当前状态（不含结果本身）"""
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": round(self.progress, 4),
+                "error": self.error,
+                "params": self.params,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+    def _start(self) -> bool:
+        with self._lock:
+            if self.status != PENDING:
+                return False
+            self.status = RUNNING
+            self._append("status", {})
+            return True
+
+    def _complete(self, result: Any) -> None:
+        with self._lock:
+            self.result = result
+            self.progress = 1.0
+            self._finish(COMPLETED)
+
+    def _fail(self, error: str) -> None:
+        with self._lock:
+            self.error = error
+            self._finish(FAILED)
+
+    def _cancelled(self) -> None:
+        with self._lock:
+            self._finish(CANCELLED)
+
+    def _finish(self, status: str) -> None:
+        # 调用方需持有self._lock
+        self.status = status
+        self.finished_at = time.time()
+        self._append("status", {})
+
+    def _append(self, event: str, data: Dict) -> None:
+        # 调用方需持有self._lock
+        payload = {"status": self.status, "progress": round(self.progress, 4), **data}
+        self._events.append({"id": len(self._events) + 1, "event": event, "data": payload})
+
+
+class JobManager:
+    """在线程池中运行处理/导出任务，并保留进度事件供SSE读取"""
+
+    def __init__(self, max_workers: int = None, retention_seconds: int = None):
+        self.retention_seconds = settings.JOB_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or settings.JOB_WORKERS, thread_name_prefix="pixlator-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func: Callable[[Job], Any], params: Dict, stage_weights: Dict[str, float]) -> Job:
+        """提交任务，func(job) 的返回值作为任务结果，进度通过 job.report 上报"""
+        self._purge()
+        job = Job(kind, params, stage_weights)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func)
+        logger.info(f"Submitted {kind} job {job.id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """查找任务；顺带移除过期任务，使没有新提交时已完成任务的结果也能按时释放"""
+        self._purge()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """请求取消任务，任务不存在时返回None"""
+        job = self.get(job_id)
+        if job is not None and job.cancel():
+            logger.info(f"Cancellation requested for job {job_id}")
+        return job
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: Job, func: Callable[[Job], Any]) -> None:
+        if not job._start():
+            return
+        try:
+            result = func(job)
+        except ProcessingCancelled:
+            job._cancelled()
+            logger.info(f"Job {job.id} cancelled at stage {job.stage}")
+        except Exception as e:
+            job._fail(str(e))
+            logger.error(f"Job {job.id} failed: {e}")
+        else:
+            job._complete(result)
+            logger.info(f"Job {job.id} completed")
+
+    def _purge(self) -> None:
+        """移除结束超过保留时间的任务"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,221 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 按max_size划分的尺寸档位，避免标签基数过大
+SIZE_BUCKETS = (50, 100, 200, 500, 1000, 2000, 4000)
+
+
+def size_bucket(max_size: Optional[int]) -> str:
+    """将max_size归入固定档位"""
+    if max_size is None:
+        return "default"
+    index = bisect.bisect_left(SIZE_BUCKETS, max_size)
+    if index == len(SIZE_BUCKETS):
+        return f"gt{SIZE_BUCKETS[-1]}"
+    return f"le{SIZE_BUCKETS[index]}"
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """累积分桶直方图（Prometheus文本格式）"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：各分桶计数（非累积）、总和、总数
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文，退出时记录耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_bucket{inf_labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，输出Prometheus文本格式"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, label_names)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, label_names, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def timed(histogram: Histogram, **labels) -> Callable:
+    """函数装饰器：把每次调用的耗时记录到直方图"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StageTimings:
+    """一次处理流程的分阶段计时，同时写入直方图并生成日志摘要
+
+    传入progress回调时，每个阶段开始和结束都会以 progress(stage, fraction, detail) 通知。
+    """
+
+    def __init__(self, histogram: Histogram, progress: Optional[Callable[[str, float, Dict], None]] = None, **labels):
+        self.histogram = histogram
+        self.progress = progress
+        self.labels = labels
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.progress is not None:
+            self.progress(name, 0.0, {})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+            self.histogram.observe(elapsed, stage=name, **self.labels)
+        if self.progress is not None:
+            self.progress(name, 1.0, {"elapsed_ms": round(elapsed * 1000, 1)})
+
+    def reporter(self, name: str) -> Optional[Callable[[float, Dict], None]]:
+        """阶段内部循环使用的进度回调 (fraction, detail)，未设置progress时返回None"""
+        if self.progress is None:
+            return None
+        return lambda fraction, detail=None: self.progress(name, fraction, detail or {})
+
+    @property
+    def total(self) -> float:
+        return sum(self.durations.values())
+
+    def summary(self) -> str:
+        """形如 "decode=3.1ms resize=0.4ms" 的耗时摘要"""
+        return " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.durations.items())
+
+
+# 全局指标注册表与常用指标
+registry = MetricsRegistry()
+
+PROCESSING_STAGE_SECONDS = registry.histogram(
+    "pixlator_processing_stage_seconds",
+    "Duration of image processing pipeline stages",
+    ["stage", "size_bucket", "color_count", "numbering_mode"],
+)
+FILE_IO_SECONDS = registry.histogram(
+    "pixlator_file_io_seconds",
+    "Duration of FileManager I/O operations",
+    ["operation"],
+)
+REQUEST_SECONDS = registry.histogram(
+    "pixlator_request_seconds",
+    "Duration of API requests by route",
+    ["method", "route", "status"],
+)
+CACHE_LOOKUPS = registry.counter(
+    "pixlator_cache_lookups_total",
+    "In-process cache lookups by cache and outcome",
+    ["cache", "outcome"],
+)
+ADMISSION_DECISIONS = registry.counter(
+    "pixlator_admission_decisions_total",
+    "Processing admission decisions by outcome (admitted, queued, rejected)",
+    ["outcome"],
+)
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "pixlator_admission_wait_seconds",
+    "Time processing requests spent queued for the memory budget",
+)
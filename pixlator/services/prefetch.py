@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from pixlator.config import settings
+from pixlator.services.admission import AdmissionRejected
+from pixlator.services.image_processor import ImageProcessor
+
+
+class Prefetcher:
+    """上传后的后台预热服务
+
+    在空闲的工作线程中解码原图、生成多个max_size的缩放图，并按默认参数预先计算结果，
+    使上传后的第一次 /api/process 请求直接命中缓存。
+    """
+
+    # 前台请求繁忙时，预热每次让出的等待时间（秒）和最长等待时间
+    IDLE_POLL_INTERVAL = 0.05
+    IDLE_MAX_WAIT = 30.0
+
+    def __init__(
+        self,
+        image_processor: ImageProcessor,
+        max_workers: int = None,
+        max_pending: int = None,
+        sizes: Optional[List[int]] = None,
+        max_source_pixels: int = None,
+    ):
+        self.image_processor = image_processor
+        self.max_workers = max_workers or settings.PREFETCH_WORKERS
+        self.max_pending = max_pending or settings.PREFETCH_MAX_PENDING
+        self.sizes = sizes or settings.PREFETCH_SIZES
+        self.max_source_pixels = max_source_pixels or settings.PREFETCH_MAX_SOURCE_PIXELS
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, file_path: str, dimensions: Optional[Dict[str, int]] = None) -> bool:
+        """提交预热任务，返回是否已排队"""
+        if not settings.PREFETCH_ENABLED:
+            return False
+
+        if dimensions and dimensions.get("width", 0) * dimensions.get("height", 0) > self.max_source_pixels:
+            logger.info(f"Skipping prefetch for {file_path}: source too large ({dimensions})")
+            return False
+
+        file_path = os.path.abspath(file_path)
+        with self._lock:
+            if file_path in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                logger.info(f"Skipping prefetch for {file_path}: {len(self._pending)} warm-ups already pending")
+                return False
+            self._pending.add(file_path)
+
+        self._executor.submit(self._run, file_path)
+        return True
+
+    def shutdown(self, wait: bool = False) -> None:
+        """停止预热线程池"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, file_path: str) -> None:
+        try:
+            self._wait_until_idle()
+            self.image_processor.build_pyramid(file_path, self.sizes + [settings.DEFAULT_MAX_SIZE])
+
+            self._wait_until_idle()
+            self.image_processor.precompute_defaults(file_path)
+            logger.info(f"Prefetch completed: {file_path}")
+        except AdmissionRejected:
+            logger.info(f"Prefetch skipped for {file_path}: memory budget in use")
+        except Exception as e:
+            logger.warning(f"Prefetch failed for {file_path}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(file_path)
+
+    def _wait_until_idle(self) -> None:
+        """前台有处理请求时暂缓预热，避免与用户请求争抢CPU"""
+        deadline = time.monotonic() + self.IDLE_MAX_WAIT
+        while self.image_processor.is_busy and time.monotonic() < deadline:
+            time.sleep(self.IDLE_POLL_INTERVAL)
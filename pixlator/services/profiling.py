@@ -0,0 +1,250 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from pixlator.config import settings
+
+# pyinstrument为可选依赖，安装后优先使用（支持asyncio调用栈）
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:  # pragma: no cover - 取决于运行环境
+    PyinstrumentProfiler = None
+
+
+# Python 3.12起cProfile基于sys.monitoring：整个解释器同时只能启用一个，但它会记录所有线程
+CPROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class ProfileSession:
+    """一次请求的性能剖析会话
+
+    剖析器只记录启动它的线程：事件循环线程上的剖析器在请求开始时启动，交给工作线程执行的函数
+    （经 profiled 包装）在所在线程中另行剖析，写出时合并为一份结果。
+    Python 3.12及以上的cProfile例外，请求的剖析器本身已经记录工作线程，不再另行剖析。
+    """
+
+    def __init__(self, engine: str, sampled: bool):
+        self.engine = engine
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self._profiler = self._create_profiler(async_mode="enabled")
+        self._workers: List[Any] = []
+        self._workers_lock = threading.Lock()
+        self._stopped = False
+        self.worker_calls = 0
+        self.skipped_workers: List[str] = []
+
+    def _create_profiler(self, async_mode: str) -> Any:
+        if self.engine == "pyinstrument":
+            return PyinstrumentProfiler(async_mode=async_mode)
+        return cProfile.Profile()
+
+    def run_in_thread(self, func: Callable, *args, **kwargs) -> Any:
+        """在当前（工作）线程中剖析 func 的执行，请求结束前完成的结果会合并到会话中
+
+        无法剖析时照常执行func，并记录在 skipped_workers 中（写入剖析的元数据）。
+        """
+        with self._workers_lock:
+            self.worker_calls += 1
+        if self.engine == "cprofile" and CPROFILE_ALL_THREADS:
+            return func(*args, **kwargs)
+
+        profiler = self._create_profiler(async_mode="disabled")
+        try:
+            if self.engine == "pyinstrument":
+                profiler.start()
+            else:
+                profiler.enable()
+        except Exception as e:
+            # 其他剖析工具已在该线程运行等情况，不影响处理本身
+            name = getattr(func, "__qualname__", repr(func))
+            logger.warning(f"Skipped profiling {name} in worker thread: {e}")
+            with self._workers_lock:
+                self.skipped_workers.append(name)
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if self.engine == "pyinstrument":
+                profiler.stop()
+            else:
+                profiler.disable()
+            with self._workers_lock:
+                if not self._stopped:
+                    self._workers.append(profiler)
+
+    def start(self) -> None:
+        if self.engine == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self) -> float:
+        """停止剖析，返回耗时（毫秒）"""
+        if self.engine == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        with self._workers_lock:
+            # 请求结束后才完成的工作线程（例如客户端断开后仍在运行的合并计算）不再合并
+            self._stopped = True
+        return (time.perf_counter() - self.started) * 1000
+
+    def write(self, path_without_suffix: str) -> str:
+        """写出剖析结果文件，返回文件名"""
+        if self.engine == "pyinstrument":
+            from pyinstrument.renderers import HTMLRenderer
+            from pyinstrument.session import Session
+
+            session = self._profiler.last_session
+            for worker in self._workers:
+                session = Session.combine(session, worker.last_session)
+            path = f"{path_without_suffix}.html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(HTMLRenderer().render(session))
+        else:
+            path = f"{path_without_suffix}.prof"
+            stats = pstats.Stats(self._profiler)
+            for worker in self._workers:
+                stats.add(worker)
+            stats.dump_stats(path)
+        return os.path.basename(path)
+
+
+# 当前请求的剖析会话，由中间件在请求的上下文中设置
+current_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+
+
+def profiled(func: Callable) -> Callable:
+    """包装交给线程池执行的函数：当前请求正在剖析时，在工作线程中同样剖析并合并到请求的结果
+
+    需要在请求的上下文中（事件循环线程）调用；请求未被剖析时原样返回func。
+    """
+    session = current_session.get()
+    if session is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return session.run_in_thread(func, *args, **kwargs)
+    return wrapper
+
+
+class RequestProfiler:
+    """按采样率或耗时阈值捕获请求的性能剖析
+
+    设置了耗时阈值时需要剖析每个请求（事后才知道是否变慢），只保存超过阈值或被采样的结果。
+    同一时间只允许一个剖析会话：事件循环线程上的剖析会记录会话期间交错执行的其他协程；
+    放到线程池中的处理（经 profiled 包装）在工作线程中剖析并合并到同一份结果，
+    否则结果中只有等待future的 await。
+    """
+
+    def __init__(self, directory: str = None, sample_rate: float = None, slow_threshold_ms: float = None, max_profiles: int = None):
+        self.directory = os.path.abspath(directory or settings.DIAGNOSTICS_DIR)
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.slow_threshold_ms = settings.PROFILE_SLOW_THRESHOLD_MS if slow_threshold_ms is None else slow_threshold_ms
+        self.max_profiles = max_profiles or settings.PROFILE_MAX_FILES
+        self.engine = "pyinstrument" if PyinstrumentProfiler is not None else "cprofile"
+        self._active = threading.Lock()
+
+    def start(self) -> Optional[ProfileSession]:
+        """尝试开始剖析，已有会话在运行或未命中采样时返回None"""
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_threshold_ms <= 0:
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+
+        session = ProfileSession(self.engine, sampled)
+        try:
+            session.start()
+            current_session.set(session)
+        except Exception as e:
+            # 其他剖析工具已在运行等情况
+            self._active.release()
+            logger.warning(f"Failed to start request profiler: {e}")
+            return None
+        return session
+
+    def finish(self, session: ProfileSession, request_info: Dict) -> Optional[str]:
+        """结束剖析，被采样或超过耗时阈值时保存结果，返回剖析名称"""
+        try:
+            duration_ms = session.stop()
+        finally:
+            current_session.set(None)
+            self._active.release()
+
+        slow = 0 < self.slow_threshold_ms <= duration_ms
+        if not (session.sampled or slow):
+            return None
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            artifact = session.write(os.path.join(self.directory, name))
+            metadata = {
+                "name": name,
+                "artifact": artifact,
+                "engine": session.engine,
+                "reason": "slow" if slow else "sampled",
+                "duration_ms": round(duration_ms, 2),
+                "worker_threads": {"calls": session.worker_calls, "skipped": session.skipped_workers},
+                "captured_at": datetime.now().isoformat(),
+                "request": request_info,
+            }
+            with open(os.path.join(self.directory, f"{name}.json"), "w", encoding="utf-8") as f:
+                json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+            logger.info(f"Captured request profile {name}: {request_info.get('method')} {request_info.get('path')} ({duration_ms:.0f}ms, {metadata['reason']})")
+            self._enforce_limit()
+            return name
+
+        except Exception as e:
+            logger.error(f"Error saving request profile: {e}")
+            return None
+
+    def list_profiles(self) -> List[Dict]:
+        """列出已捕获的剖析（最新的在前）"""
+        profiles = []
+        for meta_path in Path(self.directory).glob("*.json"):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable profile metadata {meta_path.name}: {e}")
+        profiles.sort(key=lambda item: item.get("captured_at", ""), reverse=True)
+        return profiles
+
+    def get_artifact_path(self, name: str) -> Optional[str]:
+        """剖析结果文件的路径，不存在时返回None"""
+        meta_path = os.path.join(self.directory, f"{Path(name).name}.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)["artifact"]
+        artifact_path = os.path.join(self.directory, artifact)
+        return artifact_path if os.path.exists(artifact_path) else None
+
+    def _enforce_limit(self) -> None:
+        """只保留最新的max_profiles个剖析"""
+        profiles = self.list_profiles()
+        for profile in profiles[self.max_profiles:]:
+            for filename in (f"{profile['name']}.json", profile.get("artifact")):
+                if filename:
+                    try:
+                        os.remove(os.path.join(self.directory, filename))
+                    except OSError:
+                        pass
@@ -0,0 +1,215 @@
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+# K-means的迭代上限（与scikit-learn默认值相同）以及分段大小：每段结束时回调进度并检查取消
+KMEANS_MAX_ITER = 300
+KMEANS_STEP_ITER = 10
+
+
+class ColorQuantizer:
+    """K-means颜色量化器
+
+    为同一张缩放后的图片保留上一次的聚类中心，颜色数量变化时以其为种子热启动：
+    颜色增加时拆分方差最大的簇，颜色减少时合并距离最近的中心。
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._centers: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def quantize(
+        self,
+        pixels: np.ndarray,
+        n_colors: int,
+        cache_key: Optional[Hashable] = None,
+        progress: Optional[Callable[[float, Dict], None]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """对像素做K-means聚类，返回(整数聚类中心, 每个像素的标签)
+
+        聚类在去重后的颜色上进行，以出现次数作为sample_weight，再通过逆索引映射回每个像素；
+        去重后的颜色数不超过n_colors时直接跳过聚类。聚类分段迭代，progress在每段之间回调已完成的迭代次数，
+        回调抛出的异常（如取消）会中止聚类。
+        """
+        colors, inverse, counts = unique_colors(pixels)
+        if len(colors) <= n_colors:
+            logger.info(f"Skipping K-means: {len(colors)} unique colors <= {n_colors}")
+            self._put(cache_key, colors.astype(np.float64))
+            return colors.astype(int), inverse
+
+        samples = colors.astype(np.float64)
+        weights = counts.astype(np.float64)
+
+        previous = self._get(cache_key)
+        if previous is not None:
+            seeds = self._seed_centers(previous, samples, weights, n_colors)
+            centers, labels, iterations = _fit_in_steps(samples, weights, n_colors, seeds, progress)
+            logger.info(f"Warm-started K-means from {len(previous)} to {n_colors} centers on {len(samples)} unique colors ({iterations} iterations)")
+        else:
+            centers, labels, iterations = _fit_in_steps(samples, weights, n_colors, "k-means++", progress)
+            logger.info(f"Cold-started K-means with {n_colors} centers on {len(samples)} unique colors ({iterations} iterations)")
+
+        self._put(cache_key, centers)
+        if progress is not None:
+            progress(1.0, {"iterations": iterations, "unique_colors": len(samples), "warm_start": previous is not None})
+        return centers.astype(int), labels[inverse]
+
+    def fit_palette(self, colors: np.ndarray, counts: np.ndarray, n_colors: int) -> np.ndarray:
+        """在去重后的颜色上聚类（出现次数作为权重），返回整数聚类中心
+
+        用于多帧图片：各帧的颜色先汇总再聚类，所有帧共用同一个调色板。颜色数不超过n_colors时直接返回这些颜色。
+        """
+        if len(colors) <= n_colors:
+            return colors.astype(int)
+        kmeans = _kmeans(n_clusters=n_colors, random_state=0).fit(colors.astype(np.float64), sample_weight=counts.astype(np.float64))
+        logger.info(f"Fitted shared palette with {n_colors} centers on {len(colors)} pooled colors ({kmeans.n_iter_} iterations)")
+        return kmeans.cluster_centers_.astype(int)
+
+    def clear(self) -> None:
+        """清空热启动缓存"""
+        with self._lock:
+            self._centers.clear()
+
+    def _get(self, cache_key: Optional[Hashable]) -> Optional[np.ndarray]:
+        if cache_key is None:
+            return None
+        with self._lock:
+            centers = self._centers.get(cache_key)
+            if centers is not None:
+                self._centers.move_to_end(cache_key)
+            return centers
+
+    def _put(self, cache_key: Optional[Hashable], centers: np.ndarray) -> None:
+        if cache_key is None:
+            return
+        with self._lock:
+            self._centers[cache_key] = centers.copy()
+            self._centers.move_to_end(cache_key)
+            while len(self._centers) > self.max_entries:
+                self._centers.popitem(last=False)
+
+    def _seed_centers(self, previous: np.ndarray, samples: np.ndarray, weights: np.ndarray, n_colors: int) -> np.ndarray:
+        """根据上一次的聚类中心生成n_colors个初始中心"""
+        k = len(previous)
+        labels = _nearest_center(samples, previous)
+        counts = np.bincount(labels, weights=weights, minlength=k)
+
+        if n_colors == k:
+            return previous.copy()
+        if n_colors > k:
+            return _split_centers(previous, samples, weights, labels, counts, n_colors)
+        return _merge_centers(previous, counts, n_colors)
+
+
+def _kmeans(**params):
+    """创建KMeans；scikit-learn（连同scipy）导入耗时超过1秒，只在第一次需要聚类时导入"""
+    from sklearn.cluster import KMeans
+    return KMeans(**params)
+
+
+def _fit_in_steps(samples: np.ndarray, weights: np.ndarray, n_colors: int, init, progress: Optional[Callable[[float, Dict], None]]) -> Tuple[np.ndarray, np.ndarray, int]:
+    """分段运行K-means，返回(聚类中心, 标签, 总迭代次数)
+
+    每段最多KMEANS_STEP_ITER次迭代，下一段以上一段的中心热启动，直到某段提前收敛或达到KMEANS_MAX_ITER；
+    段与段之间回调progress，使进度和取消检查不必等到整个聚类结束。
+    """
+    iterations = 0
+    while True:
+        kmeans = _kmeans(n_clusters=n_colors, init=init, n_init=1, max_iter=KMEANS_STEP_ITER, random_state=0).fit(samples, sample_weight=weights)
+        iterations += int(kmeans.n_iter_)
+        if kmeans.n_iter_ < KMEANS_STEP_ITER or iterations >= KMEANS_MAX_ITER:
+            return kmeans.cluster_centers_, kmeans.labels_, iterations
+        if progress is not None:
+            progress(iterations / KMEANS_MAX_ITER, {"iterations": iterations, "inertia": float(kmeans.inertia_)})
+        init = kmeans.cluster_centers_
+
+
+def unique_colors(pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """将RGB像素去重，返回(唯一颜色, 逆索引, 出现次数)
+
+    颜色先打包为24位整数再去重，比按行去重快得多。
+    """
+    flat = pixels.reshape(-1, 3).astype(np.uint32)
+    packed = (flat[:, 0] << 16) | (flat[:, 1] << 8) | flat[:, 2]
+    keys, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+    colors = np.stack([(keys >> 16) & 0xFF, (keys >> 8) & 0xFF, keys & 0xFF], axis=1)
+    return colors, inverse.reshape(-1), counts
+
+
+def assign_colors(pixels: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """为每个像素找到调色板中最近的颜色，返回标签（按唯一颜色计算距离再映射回像素）"""
+    colors, inverse, _ = unique_colors(pixels)
+    return _nearest_center(colors.astype(np.float64), palette.astype(np.float64))[inverse]
+
+
+def _squared_distances(samples: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """计算样本到各中心的平方距离矩阵"""
+    return (
+        (samples ** 2).sum(axis=1)[:, None]
+        - 2 * samples @ centers.T
+        + (centers ** 2).sum(axis=1)[None, :]
+    )
+
+
+def _nearest_center(samples: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """返回每个样本最近的中心索引"""
+    return _squared_distances(samples, centers).argmin(axis=1)
+
+
+def _split_centers(centers: np.ndarray, samples: np.ndarray, weights: np.ndarray, labels: np.ndarray, counts: np.ndarray, n_colors: int) -> np.ndarray:
+    """反复拆分加权误差平方和最大的簇，直到中心数量达到n_colors"""
+    k = len(centers)
+    safe_counts = np.maximum(counts, 1)
+    sums = np.stack([np.bincount(labels, weights=samples[:, d] * weights, minlength=k) for d in range(3)], axis=1)
+    sq_sums = np.stack([np.bincount(labels, weights=samples[:, d] ** 2 * weights, minlength=k) for d in range(3)], axis=1)
+    means = sums / safe_counts[:, None]
+    variances = np.maximum(sq_sums / safe_counts[:, None] - means ** 2, 0)
+    sse = variances.sum(axis=1) * counts
+
+    # 以误差平方和为优先级的最大堆
+    heap = [(-sse[j], j, centers[j], np.sqrt(variances[j])) for j in range(k)]
+    heapq.heapify(heap)
+    tie = k
+    while len(heap) < n_colors:
+        neg_sse, _, center, spread = heapq.heappop(heap)
+        if -neg_sse <= 0:
+            # 所有簇都已无法拆分，退回到距离现有中心最远的样本
+            heapq.heappush(heap, (neg_sse, tie, center, spread))
+            existing = np.array([item[2] for item in heap])
+            farthest = samples[_squared_distances(samples, existing).min(axis=1).argmax()]
+            heapq.heappush(heap, (0.0, tie + 1, farthest, np.zeros(3)))
+            tie += 2
+            continue
+        half = spread / 2
+        heapq.heappush(heap, (neg_sse / 2, tie, center + half, half))
+        heapq.heappush(heap, (neg_sse / 2, tie + 1, center - half, half))
+        tie += 2
+
+    return np.array([item[2] for item in heap], dtype=np.float64)
+
+
+def _merge_centers(centers: np.ndarray, counts: np.ndarray, n_colors: int) -> np.ndarray:
+    """反复合并距离最近的两个中心（按像素数加权），直到中心数量降到n_colors"""
+    centers = [c.astype(np.float64) for c in centers]
+    weights = [max(w, 1.0) for w in counts]
+
+    while len(centers) > n_colors:
+        stacked = np.array(centers)
+        distances = ((stacked[:, None, :] - stacked[None, :, :]) ** 2).sum(axis=2)
+        np.fill_diagonal(distances, np.inf)
+        i, j = np.unravel_index(distances.argmin(), distances.shape)
+        total = weights[i] + weights[j]
+        merged = (centers[i] * weights[i] + centers[j] * weights[j]) / total
+        for index in sorted((i, j), reverse=True):
+            del centers[index]
+            del weights[index]
+        centers.append(merged)
+        weights.append(total)
+
+    return np.array(centers)
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Optional
+
+from loguru import logger
+
+from pixlator.config import settings
+
+
+class RetentionScheduler:
+    """按 CLEANUP_INTERVAL 定期在线程池中执行 FileManager.cleanup_old_files
+
+    由应用的lifespan启动与停止；启动后先执行一次清理，之后每隔interval秒执行一次。
+    """
+
+    def __init__(self, file_manager, interval: int = None):
+        self.file_manager = file_manager
+        self.interval = settings.CLEANUP_INTERVAL if interval is None else interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval <= 0:
+            logger.info("Retention scheduler disabled (CLEANUP_INTERVAL <= 0)")
+            return
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Retention scheduler started: every {self.interval}s, retention {settings.FILE_RETENTION_DAYS} days")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # 清理包含大量阻塞I/O与批次间暂停，放到线程中执行
+                await asyncio.to_thread(self.file_manager.cleanup_old_files)
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+            await asyncio.sleep(self.interval)
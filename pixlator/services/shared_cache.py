@@ -0,0 +1,182 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from pixlator.utils import serialization
+from pixlator.utils.atomic import atomic_write
+
+INDEX_NAME = "index.sqlite3"
+ARRAY_EXT = ".npy"
+OBJECT_EXT = ".json"
+
+# 命中时更新访问时间的最小间隔（秒），避免每次读取都写索引
+ATIME_RESOLUTION = 1.0
+
+
+def _best_effort(default: Any) -> Callable:
+    """缓存读写失败（磁盘已满、索引被锁超时等）时记录警告并返回default，不影响处理流程"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Shared cache {func.__name__} failed: {e}")
+                return default
+        return wrapper
+    return decorator
+
+
+class SharedCache:
+    """多个worker进程共享的磁盘缓存：<root>/<ab>/<key哈希>.npy|.json，索引保存在SQLite中
+
+    数组以 .npy 保存并以只读内存映射读取，各进程共享同一份页缓存，不复制数据；其他对象用
+    utils/serialization 编码。值先原子写入文件再登记到索引，读取方只会看到完整的文件。
+    SQLite事务负责跨进程加锁，总大小超过max_bytes时按最近访问时间淘汰。
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    @_best_effort(None)
+    def get_array(self, key: Hashable) -> Optional[np.ndarray]:
+        """读取数组（只读内存映射），未命中返回None"""
+        path = self._lookup(key)
+        if path is None:
+            return None
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            self._forget(key)
+            return None
+
+    @_best_effort(False)
+    def put_array(self, key: Hashable, array: np.ndarray) -> bool:
+        def write(f):
+            np.save(f, np.ascontiguousarray(array))
+        return self._store(key, ARRAY_EXT, array.nbytes, write)
+
+    @_best_effort(None)
+    def get_object(self, key: Hashable) -> Optional[Any]:
+        """读取JSON对象，未命中返回None"""
+        path = self._lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return serialization.loads(f.read())
+        except (OSError, ValueError):
+            self._forget(key)
+            return None
+
+    @_best_effort(False)
+    def put_object(self, key: Hashable, obj: Any) -> bool:
+        data = serialization.dumps(obj)
+        return self._store(key, OBJECT_EXT, len(data), lambda f: f.write(data))
+
+    @_best_effort(False)
+    def __contains__(self, key: Hashable) -> bool:
+        row = self._connection().execute("SELECT 1 FROM entries WHERE key = ?", (self._digest(key),)).fetchone()
+        return row is not None
+
+    @_best_effort({})
+    def stats(self) -> Dict[str, int]:
+        count, total = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+    def clear(self) -> None:
+        with self._connection() as connection:
+            files = [row[0] for row in connection.execute("SELECT file FROM entries")]
+            connection.execute("DELETE FROM entries")
+        self._remove_files(files)
+
+    @staticmethod
+    def _digest(key: Hashable) -> str:
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程（以及fork出的子进程）使用各自的连接"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        os.makedirs(self.root, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(self.root, INDEX_NAME), timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, file TEXT NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)")
+        # 上下文管理器中的事务以 BEGIN IMMEDIATE 开始，写锁在事务开始时取得
+        connection.isolation_level = "IMMEDIATE"
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _lookup(self, key: Hashable) -> Optional[str]:
+        digest = self._digest(key)
+        connection = self._connection()
+        row = connection.execute("SELECT file, atime FROM entries WHERE key = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        file, atime = row
+        now = time.time()
+        if now - atime >= ATIME_RESOLUTION:
+            with connection:
+                connection.execute("UPDATE entries SET atime = ? WHERE key = ?", (now, digest))
+        return os.path.join(self.root, file)
+
+    def _forget(self, key: Hashable) -> None:
+        """文件已被其他进程淘汰或损坏时删除索引记录"""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries WHERE key = ?", (self._digest(key),))
+
+    def _store(self, key: Hashable, ext: str, size: int, write) -> bool:
+        if size > self.max_bytes:
+            logger.debug(f"Shared cache: entry of {size} bytes exceeds budget, not cached")
+            return False
+
+        digest = self._digest(key)
+        file = os.path.join(digest[:2], digest + ext)
+        path = os.path.join(self.root, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, "wb") as f:
+            write(f)
+        size = os.path.getsize(path)
+
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO entries (key, file, size, atime) VALUES (?, ?, ?, ?)", (digest, file, size, time.time()))
+            evicted = self._evict(connection, keep=digest)
+        self._remove_files([entry[0] for entry in evicted])
+        if evicted:
+            logger.info(f"Shared cache evicted {len(evicted)} entries ({sum(entry[1] for entry in evicted) / 2**20:.1f}MB)")
+        return True
+
+    def _evict(self, connection: sqlite3.Connection, keep: str) -> List[Tuple[str, int]]:
+        """在当前事务中按访问时间删除最旧的记录，直到总大小不超过max_bytes，返回[(文件, 大小)]"""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        evicted = []
+        if total <= self.max_bytes:
+            return evicted
+        for key, file, size in connection.execute("SELECT key, file, size FROM entries WHERE key != ? ORDER BY atime", (keep,)).fetchall():
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            evicted.append((file, size))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        return evicted
+
+    def _remove_files(self, files: List[str]) -> None:
+        # 已映射该文件的进程仍可继续读取（删除只移除目录项）
+        for file in files:
+            try:
+                os.remove(os.path.join(self.root, file))
+            except FileNotFoundError:
+                pass
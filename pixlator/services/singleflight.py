@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from pixlator.services.cancellation import CancelToken
+
+
+class Flight:
+    """一次进行中的计算，所有相同请求共享同一个future与取消令牌"""
+
+    def __init__(self):
+        self.future: Future = Future()
+        # 标记为运行中，等待方取消自己的等待时不会取消共享的future
+        self.future.set_running_or_notify_cancel()
+        self.cancel_token = CancelToken()
+        self.waiters = 0
+
+
+class SingleFlight:
+    """相同键的并发调用只计算一次（single-flight）
+
+    第一个调用方成为leader并负责执行计算，其余调用方等待同一个future。
+    所有等待方都放弃时取消计算；计算结束后移除该键，之后的调用会重新计算（结果缓存由调用方负责）。
+    已被取消（但尚未结束）的计算不再被加入，新的调用方发起新的计算。
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: Hashable) -> Tuple[Flight, bool]:
+        """加入（或发起）某个键的计算，返回(flight, 是否为leader)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None or flight.cancel_token.cancelled
+            if leader:
+                flight = self._flights[key] = Flight()
+            flight.waiters += 1
+            return flight, leader
+
+    def leave(self, flight: Flight) -> None:
+        """等待方放弃等待，没有其他等待方时取消计算"""
+        with self._lock:
+            flight.waiters -= 1
+            abandoned = flight.waiters <= 0 and not flight.future.done()
+        if abandoned:
+            flight.cancel_token.cancel("client disconnected")
+
+    def run(self, key: Hashable, flight: Flight, func: Callable[[CancelToken], Any]) -> None:
+        """由leader在工作线程中调用：执行 func(cancel_token) 并把结果交给所有等待方"""
+        try:
+            result = func(flight.cancel_token)
+        except BaseException as e:
+            self._release(key, flight)
+            flight.future.set_exception(e)
+        else:
+            self._release(key, flight)
+            flight.future.set_result(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def _release(self, key: Hashable, flight: Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
@@ -0,0 +1,123 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Iterator, List
+
+from pixlator.config import settings
+
+# 导出文件名前缀：pixelated_{上传文件名去掉扩展名}_{时间戳}.{扩展名}
+EXPORT_PREFIX = "pixelated_"
+
+# 衍生文件后缀（处理结果、量化网格与多帧结果）
+ARTIFACT_SUFFIXES = ("_grid.npy", "_grid.json", "_frames.npz", "_frames.json", ".json")
+
+# 上传记录文件名：记录原图对应的内容寻址blob（见 services/blobs.py）
+UPLOAD_RECORD = "upload.json"
+# 释放blob引用期间上传记录的临时名称（见 FileManager._release_upload）
+RELEASING_RECORD = ".upload.json.releasing"
+
+
+def is_upload(name: str) -> bool:
+    """是否为用户上传的原图（排除导出文件与临时文件）"""
+    return (
+        not name.startswith(EXPORT_PREFIX)
+        and not name.startswith(".")
+        and Path(name).suffix.lower() in settings.ALLOWED_EXTENSIONS
+    )
+
+
+def group_of(name: str) -> str:
+    """文件所属的上传（上传文件名去掉扩展名），无法归属的文件返回文件名本身"""
+    if name.startswith(EXPORT_PREFIX):
+        # pixelated_{stem}_{YYYYmmdd}_{HHMMSS}.{ext}
+        parts = Path(name[len(EXPORT_PREFIX):]).stem.rsplit("_", 2)
+        return parts[0] if len(parts) == 3 else name
+    for suffix in ARTIFACT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    if is_upload(name):
+        return Path(name).stem
+    return name
+
+
+class ShardedStorage:
+    """上传存储布局
+
+    每个上传一个目录 <root>/<ab>/<cd>/<stem>/（ab、cd 为stem的SHA-1前缀），上传记录、处理结果、
+    量化网格、导出文件与缩略图都放在该目录中，单个目录的文件数不会随上传数量增长。
+    原图按内容去重保存在 <root>/BLOB_DIR 下，旧布局中直接位于上传目录的原图仍可读取。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def upload_dir(self, filename: str) -> str:
+        """上传所在的目录（导出文件名也可以，按所属上传定位）"""
+        stem = group_of(os.path.basename(filename))
+        digest = hashlib.sha1(stem.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], stem)
+
+    def upload_path(self, filename: str) -> str:
+        filename = os.path.basename(filename)
+        return os.path.join(self.upload_dir(filename), filename)
+
+    def record_path(self, filename: str) -> str:
+        return os.path.join(self.upload_dir(filename), UPLOAD_RECORD)
+
+    @property
+    def blob_root(self) -> str:
+        return os.path.join(self.root, settings.BLOB_DIR)
+
+    def artifact_path(self, filename: str, suffix: str) -> str:
+        """衍生文件路径（处理结果、量化网格等）"""
+        stem = Path(os.path.basename(filename)).stem
+        return os.path.join(self.upload_dir(filename), f"{stem}{suffix}")
+
+    def thumbnail_path(self, filename: str, size: int, ext: str) -> str:
+        stem = Path(os.path.basename(filename)).stem
+        return os.path.join(self.upload_dir(filename), settings.THUMBNAIL_DIR, f"{stem}_{size}{ext}")
+
+    def export_path(self, export_filename: str) -> str:
+        """导出文件路径，无法归属到上传的旧导出文件位于根目录"""
+        export_filename = os.path.basename(export_filename)
+        if group_of(export_filename) == export_filename:
+            return os.path.join(self.root, export_filename)
+        return os.path.join(self.upload_dir(export_filename), export_filename)
+
+    def iter_upload_dirs(self) -> Iterator[str]:
+        """遍历所有上传目录"""
+        for first in _subdirs(self.root, shard=True):
+            for second in _subdirs(first, shard=True):
+                yield from _subdirs(second)
+
+    def list_files(self, directory: str) -> List[os.DirEntry]:
+        """上传目录中的所有文件（包括缩略图子目录）"""
+        files = []
+        for entry in _scandir(directory):
+            if entry.is_file():
+                files.append(entry)
+            elif entry.is_dir():
+                files.extend(self.list_files(entry.path))
+        return files
+
+
+def _scandir(directory: str) -> List[os.DirEntry]:
+    try:
+        with os.scandir(directory) as entries:
+            return list(entries)
+    except FileNotFoundError:
+        return []
+
+
+def _subdirs(directory: str, shard: bool = False) -> Iterator[str]:
+    for entry in _scandir(directory):
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        # 分片目录名为两位十六进制，跳过根目录下的其他目录
+        if shard and not _is_shard_name(entry.name):
+            continue
+        yield entry.path
+
+
+def _is_shard_name(name: str) -> bool:
+    return len(name) == 2 and all(char in "0123456789abcdef" for char in name)
@@ -0,0 +1,209 @@
+"""
+文件管理、存储布局、清理与共享缓存测试
+"""
+
+import io
+import os
+import shutil
+import time
+
+import numpy as np
+from PIL import Image
+
+from pixlator.config import settings
+from pixlator.services.file_manager import FileManager
+from pixlator.services.image_processor import ImageProcessor
+from pixlator.services.shared_cache import SharedCache
+from pixlator.services.storage import ShardedStorage
+from pixlator.utils import serialization
+from pixlator.utils.migrate_storage import migrate
+
+
+def make_upload(directory, stem, size=1000, age_days=0, flat=False):
+    """创建一个上传及其衍生文件（结果、网格、导出、缩略图），flat为True时使用旧的平铺布局"""
+    upload_dir = str(directory) if flat else ShardedStorage(str(directory)).upload_dir(stem)
+    os.makedirs(os.path.join(upload_dir, "thumbnails"), exist_ok=True)
+    paths = [
+        os.path.join(upload_dir, f"{stem}.png"),
+        os.path.join(upload_dir, f"{stem}.json"),
+        os.path.join(upload_dir, f"{stem}_grid.npy"),
+        os.path.join(upload_dir, f"pixelated_{stem}_20240102_101010.png"),
+        os.path.join(upload_dir, "thumbnails", f"{stem}_128.webp"),
+    ]
+    timestamp = time.time() - age_days * 24 * 60 * 60
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        os.utime(path, (timestamp, timestamp))
+    return paths
+
+
+def make_file_manager(directory):
+    file_manager = FileManager()
+    file_manager.upload_dir = str(directory)
+    return file_manager
+
+
+def test_cleanup_removes_expired_uploads_with_artifacts(tmp_path):
+    """过期的上传连同结果、导出与缩略图一起删除"""
+    old = make_upload(tmp_path, "old_20240101_000000_aaaaaaaa", age_days=30)
+    recent = make_upload(tmp_path, "new_20240101_000000_bbbbbbbb", age_days=1)
+
+    deleted = make_file_manager(tmp_path).cleanup_old_files(days=7, quota_bytes=0, pause=0)
+
+    assert deleted == len(old)
+    assert not any(os.path.exists(path) for path in old)
+    assert all(os.path.exists(path) for path in recent)
+
+
+def test_cleanup_enforces_quota_lru(tmp_path):
+    """超过磁盘配额时按最近使用时间淘汰最旧的上传"""
+    oldest = make_upload(tmp_path, "a_20240101_000000_aaaaaaaa", age_days=3)
+    middle = make_upload(tmp_path, "b_20240101_000000_bbbbbbbb", age_days=2)
+    newest = make_upload(tmp_path, "c_20240101_000000_cccccccc", age_days=1)
+
+    make_file_manager(tmp_path).cleanup_old_files(days=7, quota_bytes=11000, batch_size=2, pause=0)
+
+    assert not any(os.path.exists(path) for path in oldest)
+    assert all(os.path.exists(path) for path in middle + newest)
+
+
+def test_migrate_flat_layout(tmp_path):
+    """平铺布局迁移后，上传及其衍生文件都位于分片目录中"""
+    stem = "photo_20240101_000000_aaaaaaaa"
+    make_upload(tmp_path, stem, flat=True)
+    legacy_export = tmp_path / "pixelated_20240101_101010.png"
+    legacy_export.write_bytes(b"\0")
+
+    assert migrate(str(tmp_path)) == 5
+    assert migrate(str(tmp_path)) == 0
+
+    file_manager = make_file_manager(tmp_path)
+    assert file_manager.get_file_path(f"{stem}.png") == ShardedStorage(str(tmp_path)).upload_path(f"{stem}.png")
+    assert file_manager.get_result_path(f"{stem}.png")
+    assert file_manager.get_export_path(f"pixelated_{stem}_20240102_101010.png")
+    assert file_manager.get_export_path(legacy_export.name) == str(legacy_export)
+    assert [item["filename"] for item in file_manager.get_history_list()] == [f"{stem}.png"]
+
+    file_manager.delete_file(f"{stem}.png")
+    assert not os.path.exists(ShardedStorage(str(tmp_path)).upload_dir(stem))
+
+
+def test_identical_uploads_share_blob(tmp_path):
+    """内容相同的上传共享同一个原图blob，最后一个引用删除时blob才被删除"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (255, 0, 0)).save(buffer, "PNG")
+    file_manager = make_file_manager(tmp_path)
+
+    first = file_manager.save_uploaded_file(buffer.getvalue(), "a.png", prefetch=False)
+    second = file_manager.save_uploaded_file(buffer.getvalue(), "b.png", prefetch=False)
+
+    blob_path = first["file_path"]
+    assert not first["deduplicated"] and second["deduplicated"]
+    assert file_manager.get_file_path(first["filename"]) == file_manager.get_file_path(second["filename"]) == blob_path
+    assert file_manager.blobs.refcount(blob_path) == 2
+    assert {item["original_filename"] for item in file_manager.get_history_list()} == {"a.png", "b.png"}
+
+    file_manager.delete_file(first["filename"])
+    assert os.path.exists(blob_path)
+    assert file_manager.blobs.refcount(blob_path) == 1
+
+    file_manager.cleanup_old_files(days=0, quota_bytes=0, pause=0)
+    assert not os.path.exists(blob_path)
+    assert file_manager.get_file_path(second["filename"]) is None
+
+
+def test_concurrent_delete_and_cleanup_release_upload_once(tmp_path, monkeypatch):
+    """删除与清理同时处理同一个上传时只释放一次引用，其他上传仍在使用的blob不会被删除"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (0, 0, 255)).save(buffer, "PNG")
+    file_manager = make_file_manager(tmp_path)
+
+    first = file_manager.save_uploaded_file(buffer.getvalue(), "a.png", prefetch=False)
+    second = file_manager.save_uploaded_file(buffer.getvalue(), "b.png", prefetch=False)
+    blob_path = first["file_path"]
+    # 第二个上传近期仍在使用，清理不会淘汰它
+    future = time.time() + 3600
+    for entry in file_manager.storage.list_files(file_manager.storage.upload_dir(second["filename"])):
+        os.utime(entry.path, (future, future))
+
+    # 删除请求释放引用之后、删除目录之前，清理处理了同一个上传
+    rmtree = shutil.rmtree
+    calls = []
+
+    def cleanup_then_rmtree(path, *args, **kwargs):
+        if not calls:
+            calls.append(path)
+            file_manager.cleanup_old_files(days=0, quota_bytes=0, pause=0)
+        rmtree(path, *args, **kwargs)
+
+    monkeypatch.setattr(shutil, "rmtree", cleanup_then_rmtree)
+    assert file_manager.delete_file(first["filename"])
+
+    assert os.path.exists(blob_path)
+    assert file_manager.blobs.refcount(blob_path) == 1
+    assert file_manager.get_file_path(second["filename"]) == blob_path
+
+
+def test_shared_cache_across_instances_with_lru_eviction(tmp_path):
+    """一个实例写入的数组与对象可被另一个实例（模拟另一个worker）读取，数组以内存映射返回；超出容量时淘汰最久未访问的条目"""
+    writer = SharedCache(str(tmp_path), max_bytes=2200)
+    reader = SharedCache(str(tmp_path), max_bytes=2200)
+    array = np.arange(1000, dtype=np.uint8).reshape(10, 100)
+
+    assert writer.put_array(("resized", "a.png", 10), array)
+    assert writer.put_object(("results", "a.png", 10), {"dimensions": {"width": 10, "height": 100}})
+    cached = reader.get_array(("resized", "a.png", 10))
+    assert isinstance(cached, np.memmap) and not cached.flags.writeable
+    assert np.array_equal(cached, array)
+    assert reader.get_object(("results", "a.png", 10)) == {"dimensions": {"width": 10, "height": 100}}
+
+    # 写入第三个条目后超出容量，最早写入的数组被淘汰
+    assert writer.put_array(("resized", "b.png", 10), array)
+    assert reader.get_array(("resized", "a.png", 10)) is None
+    assert ("resized", "b.png", 10) in reader
+    assert reader.stats()["bytes"] <= 2200
+
+    # 文件被删除时视为未命中并移除索引记录
+    for root, _, files in os.walk(tmp_path):
+        for name in files:
+            if name.endswith(".json"):
+                os.remove(os.path.join(root, name))
+    assert reader.get_object(("results", "a.png", 10)) is None
+    assert ("results", "a.png", 10) not in writer
+
+
+def test_mutating_returned_result_does_not_corrupt_cache(tmp_path, monkeypatch):
+    """修改处理返回的结果（包括嵌套的像素、颜色统计与编号统计）不影响缓存中的结果"""
+    monkeypatch.setattr(settings, "SHARED_CACHE_MB", 0)
+    path = str(tmp_path / "image.png")
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (12, 16, 3), dtype=np.uint8)).save(path)
+    processor = ImageProcessor()
+
+    first = processor.process_image(path, max_size=8, color_count=3)
+    expected = serialization.dumps(first)
+    first["pixel_data"][0][0]["hex"] = "000000"
+    first["pixel_data"][0].clear()
+    first["color_stats"][0]["positions"].clear()
+    first["number_stats"][0]["sequence"].append((9, 9))
+    first["metadata"] = {}
+
+    second = processor.process_image(path, max_size=8, color_count=3)
+    assert serialization.dumps(second) == expected
+
+
+def test_saved_result_is_not_rewritten_until_edited(tmp_path):
+    """同样参数、未编辑的结果已保存时无需重新保存；参数不同或网格被编辑后需要重新保存"""
+    file_manager = make_file_manager(tmp_path)
+    make_upload(tmp_path, "image")
+    params = {"max_size": 4, "color_count": 2, "numbering_mode": "top_to_bottom", "processed_dimensions": {"width": 4, "height": 2}}
+    indices = np.zeros((2, 4), dtype=np.uint8)
+
+    file_manager.save_processing_result("image.png", {"processing_params": params})
+    file_manager.save_grid("image.png", indices, {"processing_params": params, "result_saved": True})
+    assert file_manager.has_saved_result("image.png", params)
+    assert not file_manager.has_saved_result("image.png", {**params, "color_count": 3})
+
+    with file_manager.edit_grid("image.png") as grid:
+        grid[0][0, 0] = 1
+    assert not file_manager.has_saved_result("image.png", params)
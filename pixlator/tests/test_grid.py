@@ -0,0 +1,158 @@
+"""
+量化网格与分块导出测试
+"""
+
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+
+from pixlator.services.animation import DELTA, KEYFRAME, REPEAT, decode_frame, encode_frames
+from pixlator.services.diff import diff_grids
+from pixlator.services.grid import (
+    build_index_grid,
+    compress_number_stats,
+    expand_number_stats,
+    line_sequence,
+    max_number,
+    number_of,
+    number_sequences,
+)
+from pixlator.services.image_processor import ImageProcessor
+from pixlator.utils.png import iter_png
+
+MODES = ["top_to_bottom", "bottom_to_top", "diagonal_bottom_left", "diagonal_bottom_right"]
+
+
+def make_random_image(width=9, height=6, seed=0):
+    """生成只含少量颜色的随机图片"""
+    rng = np.random.default_rng(seed)
+    levels = rng.integers(0, 3, (height, width)) * 100
+    return np.stack([levels, levels // 2, levels // 3], axis=-1).astype(np.uint8)
+
+
+def brute_force_sequence(indices, number, mode):
+    """按原始逐像素扫描的方式计算某个编号的序列"""
+    height, width = indices.shape
+    pixels = [
+        (x, int(indices[y, x]) + 1)
+        for y in range(height)
+        for x in range(width)
+        if number_of(x, y, mode, width, height) == number
+    ]
+    pixels.sort(key=lambda p: p[0], reverse=number % 2 == 1)
+
+    sequence = []
+    for _, color in pixels:
+        if sequence and sequence[-1][0] == color:
+            sequence[-1] = (color, sequence[-1][1] + 1)
+        else:
+            sequence.append((color, 1))
+    return sequence
+
+
+def test_palette_first_appearance_order():
+    """调色板按首次出现顺序排列，且能还原原图"""
+    img = make_random_image()
+    indices, palette = build_index_grid(img)
+
+    assert np.array_equal(palette[indices], img)
+    assert indices[0, 0] == 0
+    assert indices.dtype == np.uint8
+
+
+def test_line_sequences_match_brute_force():
+    """向量化的编号序列与逐像素扫描结果一致"""
+    for width, height in [(9, 6), (6, 9), (1, 5), (5, 1)]:
+        indices, _ = build_index_grid(make_random_image(width, height))
+        for mode in MODES:
+            for number in range(1, max_number(mode, width, height) + 1):
+                assert line_sequence(indices, number, mode) == brute_force_sequence(indices, number, mode)
+
+
+def test_streamed_png_roundtrip():
+    """逐行流式编码的PNG可以被正常解码"""
+    img = make_random_image(13, 7)
+    indices, palette = build_index_grid(img)
+    pixel_size = 3
+
+    scanlines = (np.repeat(palette[row], pixel_size, axis=0) for row in indices for _ in range(pixel_size))
+    data = b"".join(iter_png(13 * pixel_size, 7 * pixel_size, scanlines))
+
+    decoded = np.array(Image.open(io.BytesIO(data)))
+    expected = np.repeat(np.repeat(img, pixel_size, axis=0), pixel_size, axis=1)
+    assert np.array_equal(decoded, expected)
+
+
+def test_pixel_edits_update_affected_numbers_and_counts():
+    """像素编辑后，受影响编号的序列与颜色计数和完整重新计算的结果一致"""
+    processor = ImageProcessor()
+    for mode in MODES:
+        indices, palette = build_index_grid(make_random_image(9, 6))
+        grid_info = processor.summarize_grid(indices, palette, max_size=9, color_count=None, numbering_mode=mode)
+        # 同一位置的第二次修改覆盖第一次
+        edits = [(0, 0, 2), (4, 3, 1), (8, 5, 3), (4, 3, 2)]
+
+        changes = processor.apply_pixel_edits(indices, grid_info, edits)
+
+        assert indices[0, 0] == 1 and indices[3, 4] == 1 and indices[5, 8] == 2
+        assert [entry["count"] for entry in changes["palette"]] == np.bincount(indices.reshape(-1), minlength=len(palette)).tolist()
+        for stat in changes["number_stats"]:
+            assert stat["sequence"] == brute_force_sequence(indices, stat["number"], mode)
+        width, height = 9, 6
+        assert {stat["number"] for stat in changes["number_stats"]} <= {
+            int(number_of(x, y, mode, width, height)) for x, y, _ in edits
+        }
+
+
+def test_frame_delta_encoding_roundtrip():
+    """差异压缩的帧可以逐帧还原：重复帧、少量变化与大量变化分别保存为REPEAT、DELTA与关键帧"""
+    rng = np.random.default_rng(0)
+    first = rng.integers(0, 4, (6, 9)).astype(np.uint8)
+    small_change = first.copy()
+    small_change[2, 3] = (small_change[2, 3] + 1) % 4
+    frames = [first, first.copy(), small_change, rng.integers(0, 4, (6, 9)).astype(np.uint8)]
+    frames += [frames[-1].copy() for _ in range(4)]
+
+    encoded = encode_frames(frames, keyframe_interval=6, max_delta_ratio=0.25)
+
+    assert encoded["kinds"].tolist()[:4] == [KEYFRAME, REPEAT, DELTA, KEYFRAME]
+    assert all(np.array_equal(decode_frame(encoded, index), frame) for index, frame in enumerate(frames))
+
+
+def test_compressed_instructions_roundtrip():
+    """条纹图案的编号统计压缩为少量引用指令，并能还原为完整序列"""
+    stripes = np.tile(np.array([[1, 1, 2, 3]], dtype=np.uint8), (12, 6))
+    for mode in ["top_to_bottom", "diagonal_bottom_right"]:
+        stats = [{"number": number, "sequence": sequence} for number, sequence in number_sequences(stripes, mode).items()]
+        instructions = compress_number_stats(stats)
+
+        assert expand_number_stats(instructions) == stats
+        assert len(instructions) < len(stats)
+
+    # 奇偶行方向相反：前两行原样给出，其余各行与前第2行相同
+    rows = [{"number": number, "sequence": sequence} for number, sequence in number_sequences(stripes, "top_to_bottom").items()]
+    assert [set(instruction) for instruction in compress_number_stats(rows)] == [
+        {"number", "sequence"}, {"number", "sequence"}, {"number", "count", "period"}
+    ]
+
+
+def test_diff_grids_aligns_palettes_and_packs_mask():
+    """b的调色板按最近颜色对齐后比较，变化格子打包为位图，尺寸不同时b按最近邻缩放"""
+    indices_a = np.array([[0, 0, 1], [1, 2, 2]], dtype=np.uint8)
+    palette_a = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.uint8)
+    # b的颜色顺序不同且略有偏差，只有 (2, 0) 的颜色真正变化
+    indices_b = np.array([[1, 1, 0], [0, 0, 2]], dtype=np.uint8)
+    palette_b = np.array([[10, 250, 0], [250, 5, 5], [0, 0, 240]], dtype=np.uint8)
+
+    diff = diff_grids(indices_a, palette_a, indices_b, palette_b)
+
+    mask = np.unpackbits(np.frombuffer(base64.b64decode(diff["mask"]), dtype=np.uint8))[:6].reshape(2, 3)
+    assert mask.tolist() == [[0, 0, 0], [0, 1, 0]]
+    assert diff["changed"] == 1 and not diff["resampled"]
+    assert [delta["delta"] for delta in diff["color_deltas"]] == [0, 1, -1]
+    assert [entry["color_index_a"] for entry in diff["palette_mapping"]] == [2, 1, 3]
+
+    upscaled = np.repeat(np.repeat(indices_b, 2, axis=0), 2, axis=1)
+    assert diff_grids(indices_a, palette_a, upscaled, palette_b)["changed"] == 1
@@ -0,0 +1,220 @@
+"""
+后台任务进度、请求取消与合并、内存准入测试
+"""
+
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixlator.services.admission import AdmissionController, AdmissionRejected
+from pixlator.services.cancellation import CancelToken, LatestOnly, ProcessingCancelled
+from pixlator.services.image_processor import ImageProcessor
+from pixlator.services.jobs import CANCELLED, COMPLETED, JobManager
+from pixlator.services.quantizer import ColorQuantizer
+from pixlator.services.singleflight import SingleFlight
+
+
+def wait_finished(job, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if job.finished:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job {job.id} did not finish")
+
+
+def test_progress_is_weighted_and_events_are_ordered():
+    """阶段进度按权重换算为整体进度，事件编号连续"""
+    manager = JobManager(max_workers=1)
+
+    def run(job):
+        job.report("a", 0.0)
+        job.report("a", 0.5)
+        job.report("a", 1.0)
+        job.report("b", 1.0)
+        return "done"
+
+    job = manager.submit("test", run, {}, {"a": 1.0, "b": 3.0})
+    wait_finished(job)
+
+    events = job.events_since(0)
+    assert [event["id"] for event in events] == list(range(1, len(events) + 1))
+    progress = [event["data"]["progress"] for event in events if event["event"] == "progress"]
+    assert progress == [0.0, 0.125, 0.25, 1.0]
+    assert job.status == COMPLETED and job.result == "done"
+    manager.shutdown()
+
+
+def test_cancel_running_job():
+    """运行中的任务在下一次进度回调时停止"""
+    manager = JobManager(max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def run(job):
+        started.set()
+        release.wait(5)
+        job.report("a", 0.5)
+        raise AssertionError("job should have been cancelled")
+
+    job = manager.submit("test", run, {}, {"a": 1.0})
+    started.wait(5)
+    assert job.cancel()
+    release.set()
+    wait_finished(job)
+
+    assert job.status == CANCELLED
+    assert not job.cancel()
+    manager.shutdown()
+
+
+def test_quantize_reports_progress_and_stops_when_cancelled():
+    """聚类在分段之间回调进度，取消后不再继续迭代"""
+    pixels = np.random.default_rng(0).integers(0, 256, (20000, 3)).astype(np.uint8)
+    token = CancelToken()
+    fractions = []
+
+    def progress(fraction, detail):
+        token.check()
+        fractions.append(fraction)
+        token.cancel("job cancelled")
+
+    with pytest.raises(ProcessingCancelled):
+        ColorQuantizer().quantize(pixels, 16, progress=progress)
+    assert len(fractions) == 1 and 0 < fractions[0] < 1
+
+
+def test_finished_jobs_are_purged_on_lookup():
+    """没有新任务提交时，查询也会释放超过保留时间的任务"""
+    manager = JobManager(max_workers=1, retention_seconds=0)
+    job = manager.submit("test", lambda job: "done", {}, {"a": 1.0})
+    wait_finished(job)
+
+    threading.Event().wait(0.01)
+    assert manager.get(job.id) is None
+    manager.shutdown()
+
+
+def test_newer_request_supersedes_previous():
+    """同一个键的新请求会取消上一个请求，结束旧请求不影响新请求"""
+    latest = LatestOnly()
+    first = latest.begin("a.png")
+    other = latest.begin("b.png")
+    second = latest.begin("a.png")
+
+    assert first.cancelled and first.reason == "superseded"
+    assert not other.cancelled and not second.cancelled
+    with pytest.raises(ProcessingCancelled):
+        first.check()
+
+    latest.end("a.png", first)
+    third = latest.begin("a.png")
+    assert second.cancelled and not third.cancelled
+
+
+def test_single_flight_shares_one_computation():
+    """相同键的并发调用只计算一次，所有等待方都放弃时取消计算"""
+    flights = SingleFlight()
+    calls = []
+
+    first, leader = flights.join("key")
+    second, follower_is_leader = flights.join("key")
+    assert leader and not follower_is_leader and first is second
+
+    flights.run("key", first, lambda token: calls.append(1) or "result")
+    assert calls == [1]
+    assert second.future.result() == "result"
+    assert flights.in_flight() == 0
+
+    abandoned, _ = flights.join("key")
+    flights.leave(abandoned)
+    assert abandoned.cancel_token.cancelled
+
+
+def test_returning_to_superseded_parameters_starts_new_flight():
+    """参数A→B→A：第三个请求不加入已被取代的A，而是重新计算并取代B"""
+    flights = SingleFlight()
+    latest = LatestOnly()
+
+    def request(key):
+        flight, leader = flights.join(key)
+        latest.begin("a.png", flight.cancel_token)
+        return flight, leader
+
+    first_a, _ = request(("a.png", 50))
+    b, _ = request(("a.png", 100))
+    assert first_a.cancel_token.cancelled
+
+    second_a, leader = request(("a.png", 50))
+    assert leader and second_a is not first_a
+    assert not second_a.cancel_token.cancelled and b.cancel_token.cancelled
+
+    # 加入进行中的相同计算不会取消它
+    joined, leader = request(("a.png", 50))
+    assert not leader and joined is second_a and not second_a.cancel_token.cancelled
+
+    # 旧的A结束时不会移除新的A
+    flights.run(("a.png", 50), first_a, lambda token: token.check())
+    assert flights.in_flight() == 2
+
+
+def test_admission_queues_within_budget_and_rejects_when_full():
+    """超出内存预算的请求排队，释放后按顺序准入；队列已满或等待超时时拒绝"""
+    controller = AdmissionController(budget_bytes=100, max_queue=1, retry_after=7)
+    admitted = threading.Event()
+
+    with controller.admit(60):
+        def queued():
+            with controller.admit(60, timeout=5):
+                admitted.set()
+
+        thread = threading.Thread(target=queued)
+        thread.start()
+        for _ in range(500):
+            if controller.stats()["queued"] == 1:
+                break
+            threading.Event().wait(0.01)
+        assert controller.stats() == {"budget_bytes": 100, "in_use_bytes": 60, "active": 1, "queued": 1}
+        assert not admitted.is_set()
+
+        # 队列已满
+        with pytest.raises(AdmissionRejected) as excinfo:
+            with controller.admit(10):
+                pass
+        assert excinfo.value.retry_after == 7
+
+    thread.join(5)
+    assert admitted.is_set()
+
+    # 超过整个预算的请求在空闲时仍可执行；等待超时后拒绝
+    with controller.admit(1000):
+        assert controller.stats()["in_use_bytes"] == 100
+        with pytest.raises(AdmissionRejected):
+            with controller.admit(1, timeout=0.05):
+                pass
+    assert controller.stats() == {"budget_bytes": 100, "in_use_bytes": 0, "active": 0, "queued": 0}
+
+
+def test_tiled_animation_and_prefetch_paths_are_admitted(tmp_path):
+    """分块、多帧与后台预热同样申请内存预算，预算被占满时拒绝"""
+    path = str(tmp_path / "image.gif")
+    frames = [Image.fromarray(np.full((8, 10, 3), value, dtype=np.uint8)) for value in (0, 255)]
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    processor = ImageProcessor()
+    processor.shared_cache = None
+    processor.admission = AdmissionController(budget_bytes=10**6, max_queue=0, retry_after=3)
+
+    with processor.admission.admit(10**6):
+        for call in (
+            lambda: processor.build_grid(path, 6, 2),
+            lambda: processor.process_animation(path, 6, 2, "top_to_bottom"),
+            lambda: processor.build_pyramid(path, [6]),
+            lambda: processor.precompute_defaults(path),
+        ):
+            with pytest.raises(AdmissionRejected):
+                call()
+
+    indices, _ = processor.build_grid(path, 6, 2)
+    assert indices.shape == (4, 6)
+    assert processor.admission.stats()["in_use_bytes"] == 0
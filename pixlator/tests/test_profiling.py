@@ -0,0 +1,35 @@
+"""
+请求性能剖析测试
+"""
+
+import json
+import os
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+
+from pixlator.services.profiling import RequestProfiler, profiled
+
+
+def busy_worker_function():
+    return sum(i * i for i in range(10000))
+
+
+def test_worker_thread_appears_in_profile(tmp_path):
+    """经 profiled 包装、在线程池中执行的函数出现在写出的剖析中"""
+    profiler = RequestProfiler(directory=str(tmp_path), sample_rate=1.0, slow_threshold_ms=0, max_profiles=5)
+    session = profiler.start()
+    assert session is not None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(profiled(busy_worker_function)).result()
+    name = profiler.finish(session, {"method": "GET", "path": "/test"})
+
+    with open(os.path.join(str(tmp_path), f"{name}.json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    assert metadata["worker_threads"] == {"calls": 1, "skipped": []}
+
+    artifact = os.path.join(str(tmp_path), metadata["artifact"])
+    if artifact.endswith(".prof"):
+        assert "busy_worker_function" in {key[2] for key in pstats.Stats(artifact).stats}
+    else:
+        with open(artifact, encoding="utf-8") as f:
+            assert "busy_worker_function" in f.read()
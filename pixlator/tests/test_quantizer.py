@@ -0,0 +1,68 @@
+"""
+颜色量化器测试
+"""
+
+import numpy as np
+
+from pixlator.services.quantizer import ColorQuantizer
+
+
+def make_gradient(width=40, height=30):
+    """生成与create_test_image相同的渐变像素数组"""
+    xs = np.arange(width)[None, :].repeat(height, axis=0)
+    ys = np.arange(height)[:, None].repeat(width, axis=1)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = (255 * xs / width).astype(np.uint8)
+    img[..., 1] = (255 * ys / height).astype(np.uint8)
+    img[..., 2] = 128
+    return img
+
+
+def test_warm_start_sweep():
+    """颜色数量上调和下调时都能复用上一次的聚类中心"""
+    quantizer = ColorQuantizer()
+    pixels = make_gradient()
+    key = ("gradient", 40, 30)
+
+    for n_colors in [2, 4, 8, 16, 4]:
+        centers, labels = quantizer.quantize(pixels, n_colors, cache_key=key)
+        assert centers.shape == (n_colors, 3)
+        assert labels.shape == (40 * 30,)
+        assert len(np.unique(labels)) == n_colors
+
+    assert len(quantizer._centers) == 1
+
+
+def test_skip_when_few_unique_colors():
+    """唯一颜色数不超过目标颜色数时跳过聚类，原样保留颜色"""
+    quantizer = ColorQuantizer()
+    pixels = np.array([[0, 0, 0]] * 10 + [[255, 255, 255]] * 10 + [[255, 0, 0]] * 10, dtype=np.uint8)
+
+    centers, labels = quantizer.quantize(pixels, 4)
+    assert np.array_equal(centers[labels], pixels.astype(int))
+
+
+def test_weighted_unique_clustering():
+    """按出现次数加权聚类，映射回的像素标签与逐像素一致"""
+    quantizer = ColorQuantizer()
+    pixels = np.array([[0, 0, 0]] * 100 + [[10, 10, 10]] * 1 + [[250, 250, 250]] * 100 + [[240, 240, 240]] * 1, dtype=np.uint8)
+
+    centers, labels = quantizer.quantize(pixels, 2)
+    assert labels.shape == (len(pixels),)
+    assert len(np.unique(labels[:101])) == 1
+    assert len(np.unique(labels[101:])) == 1
+    dark = centers[labels[0]]
+    assert dark.max() < 5
+
+
+def test_split_exhausted_clusters():
+    """簇无法继续拆分时仍能生成足够的初始中心"""
+    quantizer = ColorQuantizer()
+    # 每个簇只含一个颜色（误差平方和为0），拆分需要退回到最远样本
+    previous = np.array([[0, 0, 0], [255, 255, 255], [255, 0, 0]], dtype=np.float64)
+    samples = previous.copy()
+    weights = np.array([10.0, 10.0, 10.0])
+
+    seeds = quantizer._seed_centers(previous, samples, weights, 5)
+    assert seeds.shape == (5, 3)
+    assert {tuple(center) for center in previous} <= {tuple(seed) for seed in seeds}
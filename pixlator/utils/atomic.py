@@ -0,0 +1,27 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w", encoding: Optional[str] = None) -> Iterator[IO]:
+    """原子写入文件
+
+    先写入同目录下的临时文件，成功后用 os.replace 替换目标文件；读取方只会看到旧文件或完整的新文件，
+    写入失败时目标文件保持不变。
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+    try:
+        # mkstemp创建的文件只有属主可读，与open()创建的文件保持一致
+        os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
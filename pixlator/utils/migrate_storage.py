@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+上传目录迁移工具
+
+把旧的平铺布局（所有上传、结果、导出都在 UPLOAD_DIR 根目录，缩略图在 UPLOAD_DIR/thumbnails）
+迁移到分片布局 <ab>/<cd>/<stem>/（见 services/storage.py）。可以重复运行，已迁移的文件不受影响；
+无法归属到上传的旧导出文件保留在根目录。
+
+用法:
+    python -m pixlator.utils.migrate_storage --dry-run
+    python -m pixlator.utils.migrate_storage --upload-dir /data/uploads
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pixlator.config import settings
+from pixlator.services.storage import ShardedStorage, group_of
+
+
+def plan_migration(upload_dir: str) -> List[Tuple[str, str]]:
+    """计算需要移动的文件列表 [(源路径, 目标路径), ...]"""
+    storage = ShardedStorage(upload_dir)
+    moves = []
+
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            if group_of(entry.name) == entry.name:
+                # 无法归属的文件（旧导出等）保留在根目录
+                continue
+            moves.append((entry.path, os.path.join(storage.upload_dir(entry.name), entry.name)))
+
+    thumbnail_dir = os.path.join(upload_dir, settings.THUMBNAIL_DIR)
+    if os.path.isdir(thumbnail_dir):
+        with os.scandir(thumbnail_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    # {stem}_{size}.{ext}
+                    stem = Path(entry.name).stem.rsplit("_", 1)[0]
+                    target_dir = os.path.join(storage.upload_dir(stem), settings.THUMBNAIL_DIR)
+                    moves.append((entry.path, os.path.join(target_dir, entry.name)))
+
+    return moves
+
+
+def migrate(upload_dir: str, dry_run: bool = False) -> int:
+    """执行迁移，返回移动的文件数"""
+    moves = plan_migration(upload_dir)
+    for source, target in moves:
+        print(f"{os.path.relpath(source, upload_dir)} -> {os.path.relpath(target, upload_dir)}")
+        if dry_run:
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+
+    # 清空后的旧缩略图目录
+    thumbnail_dir = os.path.join(upload_dir, settings.THUMBNAIL_DIR)
+    if not dry_run and os.path.isdir(thumbnail_dir) and not os.listdir(thumbnail_dir):
+        os.rmdir(thumbnail_dir)
+
+    return len(moves)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="将平铺的上传目录迁移到分片布局")
+    parser.add_argument("--upload-dir", default=settings.UPLOAD_DIR, help="上传目录，默认为 UPLOAD_DIR")
+    parser.add_argument("--dry-run", action="store_true", help="只打印将要移动的文件")
+    args = parser.parse_args(argv)
+
+    upload_dir = os.path.abspath(args.upload_dir)
+    if not os.path.isdir(upload_dir):
+        print(f"Upload directory not found: {upload_dir}")
+        return 1
+
+    count = migrate(upload_dir, args.dry_run)
+    action = "Would move" if args.dry_run else "Moved"
+    print(f"{action} {count} files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import struct
+import zlib
+from typing import Iterable, Iterator
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# 压缩输出累积到该大小后再写出一个IDAT块
+IDAT_CHUNK_SIZE = 64 * 1024
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """构造一个PNG数据块"""
+    crc = zlib.crc32(chunk_type + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+
+
+def iter_png(width: int, height: int, scanlines: Iterable[np.ndarray], compress_level: int = 6) -> Iterator[bytes]:
+    """逐行编码RGB PNG并以字节块形式输出
+
+    scanlines 依次产出 (width, 3) 的 uint8 行数据，编码过程中只保留一行像素，
+    内存占用与图片高度无关，适合作为流式响应的内容。
+    """
+    yield PNG_SIGNATURE
+    yield _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    compressor = zlib.compressobj(compress_level)
+    pending = []
+    pending_size = 0
+    rows = 0
+
+    for line in scanlines:
+        # 每行前加上过滤类型字节0（不过滤）
+        data = compressor.compress(b"\x00" + np.ascontiguousarray(line, dtype=np.uint8).tobytes())
+        rows += 1
+        if data:
+            pending.append(data)
+            pending_size += len(data)
+        if pending_size >= IDAT_CHUNK_SIZE:
+            yield _chunk(b"IDAT", b"".join(pending))
+            pending = []
+            pending_size = 0
+
+    if rows != height:
+        raise ValueError(f"Expected {height} scanlines, got {rows}")
+
+    pending.append(compressor.flush())
+    yield _chunk(b"IDAT", b"".join(pending))
+    yield _chunk(b"IEND", b"")
@@ -0,0 +1,48 @@
+"""
+JSON序列化
+
+HTTP响应与保存的处理结果共用的编码层：安装了orjson时使用orjson（直接支持NumPy数组与标量），
+否则回退到标准库json。JSON_BACKEND 可以强制指定后端（auto、orjson、json）。
+"""
+
+import json
+from typing import Any
+
+import numpy as np
+
+from pixlator.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None and settings.JSON_BACKEND in ("auto", "orjson") else "json"
+
+
+def _default(obj: Any) -> Any:
+    """序列化NumPy类型（orjson不支持的非连续数组也由这里处理）"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """编码为UTF-8 JSON字节串，indent为True时缩进两个空格"""
+    if BACKEND == "orjson":
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+    if indent:
+        return json.dumps(obj, default=_default, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """解码JSON（接受bytes或str）"""
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
@@ -357,7 +357,7 @@ const StatsPanel: React.FC<StatsPanelProps> = ({
                         selected={selectedHistoryItem === item.filename}
                         onClick={() => handleHistoryItemClick(item)}
                     >
-                        <Thumbnail imageUrl={item.preview_url} />
+                        <Thumbnail imageUrl={item.thumbnail_url || item.preview_url} />
                         <ItemInfo>
                             <ItemTitle>{item.original_filename}</ItemTitle>
                             <ItemDetails>
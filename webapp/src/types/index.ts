@@ -74,6 +74,7 @@ export interface HistoryItem {
         height: number;
     };
     preview_url: string;
+    thumbnail_url?: string;
     has_processing_result?: boolean;
 }
 